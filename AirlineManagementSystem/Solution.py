@@ -1,6 +1,14 @@
 from enum import Enum
+import itertools
+import random
+import threading
+import time
 import uuid
-from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta
+from heapq import heappop, heappush
 
 
 class Role(Enum):
@@ -23,38 +31,392 @@ class User:
         self.role = role
 
 
+SEAT_CLASS_ORDER = (SeatClass.FIRST, SeatClass.BUSINESS, SeatClass.ECONOMY)
+SEAT_CLASS_INDEX = {seat_class: i for i, seat_class in enumerate(SEAT_CLASS_ORDER)}
+FREE, TAKEN = 0, 1
+
+
+# Seats are numbered from the front: first class, then business, then economy, each laid out in
+# rows of `seats_per_row`. Occupancy is one byte per seat in a bytearray, so free-seat and
+# adjacent-block searches are bytearray.find calls over a class's section, free counts per class
+# are kept up to date, and snapshots are a single bytes copy. Occupants are only stored for taken
+# seats. Sales are counted per class separately from seats, so a class can be sold past its seat
+# count up to its overbooking limit; those bookings are confirmed without a seat. Every flight has
+# its own inventory, even when flights share an aircraft. Not thread-safe on its own: AirlineSystem
+# serializes access per flight.
+class SeatInventory:
+    def __init__(self, capacity, class_layout=None, seats_per_row=6):
+        class_layout = class_layout or {SeatClass.ECONOMY: capacity}
+        if sum(class_layout.values()) != capacity:
+            raise ValueError("Seat class counts must add up to the aircraft capacity")
+        self.capacity = capacity
+        self.seats_per_row = seats_per_row
+        self.occupancy = bytearray(capacity)
+        self.occupants = {}  # seat_number -> user_id
+        self.sections = {}  # SeatClass -> (first index, end index) into occupancy
+        self.free_counts = []  # in SEAT_CLASS_ORDER
+        start = 0
+        for seat_class in SEAT_CLASS_ORDER:
+            count = class_layout.get(seat_class, 0)
+            self.sections[seat_class] = (start, start + count)
+            self.free_counts.append(count)
+            start += count
+        self._boundaries = [self.sections[seat_class][1] for seat_class in SEAT_CLASS_ORDER]
+        self.sold = [0] * len(SEAT_CLASS_ORDER)
+        self.overbooking_limits = [0] * len(SEAT_CLASS_ORDER)  # extra sales allowed beyond the seats
+
+    def seat_class(self, seat_number):
+        return SEAT_CLASS_ORDER[self._class_index(seat_number)]
+
+    def _class_index(self, seat_number):
+        return bisect_right(self._boundaries, seat_number - 1)
+
+    def is_free(self, seat_number):
+        return 1 <= seat_number <= self.capacity and self.occupancy[seat_number - 1] == FREE
+
+    def free_count(self, seat_class=None):
+        return self.free_counts[SEAT_CLASS_INDEX[seat_class]] if seat_class else sum(self.free_counts)
+
+    def assign(self, seat_number, user_id):
+        if not self.is_free(seat_number):
+            return False
+        self.occupancy[seat_number - 1] = TAKEN
+        self.occupants[seat_number] = user_id
+        self.free_counts[self._class_index(seat_number)] -= 1
+        return True
+
+    def release(self, seat_number):
+        if seat_number not in self.occupants:
+            return False
+        del self.occupants[seat_number]
+        self.occupancy[seat_number - 1] = FREE
+        self.free_counts[self._class_index(seat_number)] += 1
+        return True
+
+    def allocate(self, seat_class, user_id):
+        start, end = self.sections[seat_class]
+        index = self.occupancy.find(FREE, start, end)
+        if index < 0:
+            return None
+        self.assign(index + 1, user_id)
+        return index + 1
+
+    def find_block(self, seat_class, size):
+        # First run of `size` free seats within one row of the class section.
+        start, end = self.sections[seat_class]
+        pattern = bytes(size)
+        row_width = self.seats_per_row
+        index = self.occupancy.find(pattern, start, end)
+        while index >= 0:
+            row_end = start + ((index - start) // row_width + 1) * row_width
+            if index + size <= row_end:
+                return [index + 1 + offset for offset in range(size)]
+            index = self.occupancy.find(pattern, row_end, end)
+        return None
+
+    def allocate_block(self, seat_class, user_ids):
+        seats = self.find_block(seat_class, len(user_ids))
+        if seats is None:
+            return None
+        for seat_number, user_id in zip(seats, user_ids):
+            self.assign(seat_number, user_id)
+        return seats
+
+    def available_seats(self, seat_class=None):
+        start, end = self.sections[seat_class] if seat_class else (0, self.capacity)
+        occupancy = self.occupancy
+        return [index + 1 for index in range(start, end) if occupancy[index] == FREE]
+
+    def snapshot(self):
+        return bytes(self.occupancy)
+
+    def set_overbooking_limit(self, seat_class, extra_seats):
+        self.overbooking_limits[SEAT_CLASS_INDEX[seat_class]] = extra_seats
+
+    def sale_limit(self, seat_class):
+        start, end = self.sections[seat_class]
+        return end - start + self.overbooking_limits[SEAT_CLASS_INDEX[seat_class]]
+
+    def sell(self, seat_class, user_id, seat_number=None):
+        # Returns (sold, seat number). A sale past the seat count is made without a seat (None).
+        index = SEAT_CLASS_INDEX[seat_class]
+        if self.sold[index] >= self.sale_limit(seat_class):
+            return False, None
+        if seat_number is not None:
+            if not self.is_free(seat_number) or self._class_index(seat_number) != index:
+                return False, None
+            self.assign(seat_number, user_id)
+        else:
+            seat_number = self.allocate(seat_class, user_id)
+        self.sold[index] += 1
+        return True, seat_number
+
+    def sell_seat(self, seat_number, user_id):
+        # Sells a specific seat in whichever class it belongs to.
+        return 1 <= seat_number <= self.capacity and self.sell(self.seat_class(seat_number), user_id, seat_number)[0]
+
+    def sell_block(self, seat_class, user_ids):
+        index = SEAT_CLASS_INDEX[seat_class]
+        if self.sold[index] + len(user_ids) > self.sale_limit(seat_class):
+            return None
+        seats = self.allocate_block(seat_class, user_ids)
+        if seats is not None:
+            self.sold[index] += len(user_ids)
+        return seats
+
+    def unsell(self, seat_class, seat_number=None):
+        self.sold[SEAT_CLASS_INDEX[seat_class]] -= 1
+        if seat_number is not None:
+            self.release(seat_number)
+
+
+# An aircraft holds the seat layout its flights' inventories are made from. Its own `seats` only
+# backs the aircraft-level seat map, not any flight's bookings.
 class Aircraft:
-    def __init__(self, model, capacity):
+    def __init__(self, model, capacity, class_layout=None, seats_per_row=6):
         self.id = str(uuid.uuid4())
         self.model = model
         self.capacity = capacity
-        self.seat_map = {i: None for i in range(1, capacity + 1)}  # seat_number: user_id
+        self.class_layout = class_layout
+        self.seats_per_row = seats_per_row
+        self.seats = self.new_seat_inventory()
+
+    def new_seat_inventory(self):
+        return SeatInventory(self.capacity, self.class_layout, self.seats_per_row)
+
+    @property
+    def seat_map(self):
+        # seat_number: user_id, None for free seats
+        occupants = self.seats.occupants
+        return {i: occupants.get(i) for i in range(1, self.capacity + 1)}
 
     def assign_seat(self, seat_number, user_id):
-        if self.seat_map.get(seat_number) is None:
-            self.seat_map[seat_number] = user_id
-            return True
-        return False
+        return self.seats.sell_seat(seat_number, user_id)
 
-    def get_available_seats(self):
-        return [s for s, u in self.seat_map.items() if u is None]
+    def get_available_seats(self, seat_class=None):
+        return self.seats.available_seats(seat_class)
+
+
+def as_date(value):
+    # Flights are indexed by calendar date; a datetime is taken to mean its date.
+    return value.date() if isinstance(value, datetime) else value
 
 
 class Flight:
-    def __init__(self, source, destination, date, aircraft):
+    _seats_lock = threading.Lock()
+
+    def __init__(self, source, destination, date, aircraft, departure=None, arrival=None):
         self.id = str(uuid.uuid4())
         self.source = source
         self.destination = destination
-        self.date = date
+        self.date = as_date(date)
         self.aircraft = aircraft
+        self.departure = departure  # datetime, needed for connecting itineraries
+        self.arrival = arrival
         self.crew = []
         self.bookings = []
+        self.unseated = {seat_class: deque() for seat_class in SEAT_CLASS_ORDER}  # overbooked, oldest first
+        self._seats = None
+
+    @property
+    def seats(self):
+        # This departure's inventory, made from the aircraft layout on first use so that flights
+        # nobody books cost no seat memory.
+        if self._seats is None:
+            with Flight._seats_lock:
+                if self._seats is None:
+                    self._seats = self.aircraft.new_seat_inventory()
+        return self._seats
 
     def add_crew(self, staff_user):
         self.crew.append(staff_user)
 
-    def get_available_seats(self):
-        return self.aircraft.get_available_seats()
+    def get_available_seats(self, seat_class=None):
+        return self.seats.available_seats(seat_class)
+
+    def free_seat_count(self, seat_class=None):
+        return self.seats.free_count(seat_class)
+
+
+# Flights from one airport (or on one route) on one date, kept sorted by departure time so a time
+# window is two bisects.
+class FlightBucket:
+    __slots__ = ("times", "flights")
+
+    def __init__(self):
+        self.times = []
+        self.flights = []
+
+    def add(self, flight):
+        key = flight.departure.timestamp() if flight.departure else float("-inf")
+        i = bisect_right(self.times, key)
+        self.times.insert(i, key)
+        self.flights.insert(i, flight)
+
+    def remove(self, flight):
+        i = self.flights.index(flight)
+        del self.times[i]
+        del self.flights[i]
+
+    def between(self, start, end):
+        return self.flights[bisect_left(self.times, start.timestamp()):bisect_right(self.times, end.timestamp())]
+
+
+class Itinerary:
+    __slots__ = ("legs",)
+
+    def __init__(self, legs):
+        self.legs = legs
+
+    @property
+    def departure(self):
+        return self.legs[0].departure
+
+    @property
+    def arrival(self):
+        return self.legs[-1].arrival
+
+    @property
+    def duration(self):
+        return self.arrival - self.departure
+
+    @property
+    def layovers(self):
+        return [nxt.departure - prev.arrival for prev, nxt in zip(self.legs, self.legs[1:])]
+
+    def __repr__(self):
+        route = " -> ".join([self.legs[0].source] + [leg.destination for leg in self.legs])
+        return f"Itinerary({route}, {self.departure:%Y-%m-%d %H:%M} - {self.arrival:%Y-%m-%d %H:%M})"
+
+
+# Flights indexed by id, by (source, date) and by (source, destination, date). Connection search
+# walks the time-expanded graph where each flight is a node and a connection is a departure from
+# the arrival airport inside the layover window. Nodes are expanded in order of arrival time. A
+# flight is expanded again only when a later path reaches it with a later deadline or fewer legs
+# used than every earlier one. The last allowed leg is looked up on the route index directly, and
+# the leg before it is only taken to airports with a flight to the destination on one of the
+# query's days (from the `feeders` index), so few flights that cannot finish the trip are queued.
+class FlightIndex:
+    def __init__(self):
+        self.by_id = {}
+        self.by_source_date = {}
+        self.by_route_date = {}
+        self.feeders = {}  # (destination, date) -> {source: flights from it that day}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def add(self, flight):
+        self.by_id[flight.id] = flight
+        for index, key in ((self.by_source_date, (flight.source, flight.date)),
+                           (self.by_route_date, (flight.source, flight.destination, flight.date))):
+            bucket = index.get(key)
+            if bucket is None:
+                bucket = index[key] = FlightBucket()
+            bucket.add(flight)
+        sources = self.feeders.setdefault((flight.destination, flight.date), {})
+        sources[flight.source] = sources.get(flight.source, 0) + 1
+
+    def remove(self, flight):
+        if self.by_id.pop(flight.id, None) is None:
+            return False
+        for index, key in ((self.by_source_date, (flight.source, flight.date)),
+                           (self.by_route_date, (flight.source, flight.destination, flight.date))):
+            index[key].remove(flight)
+            if not index[key].flights:
+                del index[key]
+        sources = self.feeders[flight.destination, flight.date]
+        sources[flight.source] -= 1
+        if not sources[flight.source]:
+            del sources[flight.source]
+        return True
+
+    def get(self, flight_id):
+        return self.by_id.get(flight_id)
+
+    def direct(self, source, destination, date):
+        bucket = self.by_route_date.get((source, destination, as_date(date)))
+        return list(bucket.flights) if bucket else []
+
+    def departures(self, source, start, end, destination=None):
+        # Timed departures from `source` between two datetimes, across date buckets.
+        flights = []
+        day = start.date()
+        while day <= end.date():
+            key = (source, day) if destination is None else (source, destination, day)
+            bucket = (self.by_source_date if destination is None else self.by_route_date).get(key)
+            if bucket:
+                flights.extend(bucket.between(start, end))
+            day += timedelta(days=1)
+        return flights
+
+    def connections(self, source, destination, date, max_legs=3, min_layover=timedelta(minutes=45),
+                    max_layover=timedelta(hours=6), max_duration=timedelta(hours=36), limit=10):
+        day_start = datetime.combine(as_date(date), datetime.min.time())
+        first_legs = self.departures(source, day_start, day_start + timedelta(days=1) - timedelta(microseconds=1))
+        # Airports with a flight to the destination on a day the last leg could leave.
+        feeders = set()
+        day, last_day = day_start.date(), (day_start + timedelta(days=1) + max_duration).date()
+        while day <= last_day:
+            feeders.update(self.feeders.get((destination, day), ()))
+            day += timedelta(days=1)
+        heap = []
+        seq = itertools.count()
+        for flight in first_legs:
+            if flight.arrival is not None and (max_legs > 2 or flight.destination == destination
+                                               or max_legs == 2 and flight.destination in feeders):
+                heappush(heap, (flight.arrival, next(seq), flight, (flight,)))
+        expanded = {}  # flight id -> (deadline, legs used) of the last path it was expanded for
+        itineraries = []
+        while heap and len(itineraries) < limit:
+            arrival, _, flight, legs = heappop(heap)
+            if flight.destination == destination:
+                itineraries.append(Itinerary(legs))
+                continue
+            deadline = legs[0].departure + max_duration
+            previous = expanded.get(flight.id)
+            if previous is not None and previous[0] >= deadline and previous[1] <= len(legs):
+                continue
+            expanded[flight.id] = (deadline, len(legs))
+            legs_left = max_legs - len(legs) - 1  # after the next one
+            visited = {leg.source for leg in legs}
+            window_end = min(arrival + max_layover, deadline)
+            for nxt in self.departures(flight.destination, arrival + min_layover, window_end,
+                                       destination if not legs_left else None):
+                if nxt.arrival is None or nxt.arrival > deadline or nxt.destination in visited:
+                    continue
+                if legs_left == 1 and nxt.destination != destination and nxt.destination not in feeders:
+                    continue
+                heappush(heap, (nxt.arrival, next(seq), nxt, legs + (nxt,)))
+        return itineraries
+
+
+# Availability for many flights in one object: free counts per class in one flat array (in
+# SEAT_CLASS_ORDER) and every flight's seat occupancy bytes joined into one buffer.
+class AvailabilitySnapshot:
+    def __init__(self, flights):
+        self.flight_ids = [flight.id for flight in flights]
+        self.taken_at = datetime.now()
+        self.free_counts = array("H")
+        self.offsets = array("I", [0])
+        maps = []
+        total = 0
+        for flight in flights:
+            seats = flight.seats
+            self.free_counts.extend(seats.free_counts)
+            maps.append(seats.occupancy)
+            total += seats.capacity
+            self.offsets.append(total)
+        self.seat_maps = b"".join(maps)
+
+    def __len__(self):
+        return len(self.flight_ids)
+
+    def free_count(self, i, seat_class):
+        return self.free_counts[i * len(SEAT_CLASS_ORDER) + SEAT_CLASS_INDEX[seat_class]]
+
+    def seat_map(self, i):
+        return memoryview(self.seat_maps)[self.offsets[i]:self.offsets[i + 1]]
 
 
 class Baggage:
@@ -65,21 +427,33 @@ class Baggage:
 
 
 class BookingStatus(Enum):
+    HELD = "Held"
+    EXPIRED = "Expired"
     CONFIRMED = "Confirmed"
     CANCELLED = "Cancelled"
     REFUNDED = "Refunded"
 
 
 class Booking:
-    def __init__(self, passenger, flight, seat_number, baggage_list):
+    def __init__(self, passenger, flight, seat_number, baggage_list, seat_class=SeatClass.ECONOMY):
         self.id = str(uuid.uuid4())
         self.passenger = passenger
         self.flight = flight
-        self.seat_number = seat_number
+        self.seat_number = seat_number  # None while an overbooked booking waits for a seat
+        self.seat_class = seat_class
         self.baggage = baggage_list
         self.status = BookingStatus.CONFIRMED
+        self.hold_expires = None  # clock time a held seat is released unless paid for
+        self.paid = False  # set once a payment for the booking goes through
         self.timestamp = datetime.now()
 
+    def confirm(self):
+        self.status = BookingStatus.CONFIRMED
+        self.hold_expires = None
+
+    def expire(self):
+        self.status = BookingStatus.EXPIRED
+
     def cancel(self):
         self.status = BookingStatus.CANCELLED
 
@@ -87,57 +461,241 @@ class Booking:
         self.status = BookingStatus.REFUNDED
 
 
+class PaymentStatus(Enum):
+    COMPLETED = "Completed"
+    FAILED = "Failed"
+
+
 class Payment:
-    def __init__(self, booking_id, amount, method):
+    def __init__(self, booking_id, amount, method, status=PaymentStatus.COMPLETED):
         self.id = str(uuid.uuid4())
         self.booking_id = booking_id
         self.amount = amount
         self.method = method
+        self.status = status
         self.timestamp = datetime.now()
 
 
+# Hashed timing wheel: a key due at time t sits in slot ceil(t / resolution) % slots, so advancing
+# the clock only visits the slots for the elapsed ticks. Keys more than a lap ahead stay in their
+# slot until their own tick comes round. Expiry costs O(elapsed ticks + expired keys) and never
+# fires early.
+class TimingWheel:
+    def __init__(self, resolution=1.0, slots=4096, now=0.0):
+        self.resolution = resolution
+        self.slots = [{} for _ in range(slots)]  # key -> due tick
+        self.slot_of = {}
+        self.tick = int(now // resolution)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, key):
+        return key in self.slot_of
+
+    def schedule(self, key, due):
+        self.cancel(key)
+        tick = max(-int(-due // self.resolution), self.tick + 1)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = tick
+        self.slot_of[key] = slot
+
+    def cancel(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self, now):
+        target = int(now // self.resolution)
+        expired = []
+        # After a gap longer than a lap every slot is visited once.
+        for tick in range(self.tick + 1, min(target, self.tick + len(self.slots)) + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            if not bucket:
+                continue
+            due = [key for key, due_tick in bucket.items() if due_tick <= target]
+            for key in due:
+                del bucket[key]
+                del self.slot_of[key]
+            expired.extend(due)
+        self.tick = max(self.tick, target)
+        return expired
+
+
+class LockStripes:
+    def __init__(self, stripes=64):
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    def for_key(self, key):
+        return self.locks[hash(key) % len(self.locks)]
+
+
 class AirlineSystem:
-    def __init__(self):
+    def __init__(self, stripes=64, hold_minutes=15, clock=time.monotonic):
         self.users = {}
         self.flights = []
+        self.flight_index = FlightIndex()
         self.bookings = {}
         self.payments = []
+        self.flight_locks = LockStripes(stripes)  # all seat inventory changes for a flight happen under its stripe
+        self.hold_minutes = hold_minutes
+        self.clock = clock
+        self.holds = TimingWheel(now=clock())  # booking id -> hold deadline
+        self.holds_lock = threading.Lock()  # never held while taking a flight lock
 
     def register_user(self, name, email, role=Role.PASSENGER):
         user = User(name, email, role)
         self.users[user.id] = user
         return user
 
-    def add_flight(self, source, destination, date, aircraft):
-        flight = Flight(source, destination, date, aircraft)
+    def add_flight(self, source, destination, date, aircraft, departure=None, arrival=None):
+        flight = Flight(source, destination, date, aircraft, departure, arrival)
         self.flights.append(flight)
+        self.flight_index.add(flight)
         return flight
 
     def search_flights(self, source, destination, date):
-        return [f for f in self.flights if f.source == source and f.destination == destination and f.date == date]
-
-    def book_flight(self, passenger_id, flight_id, seat_number, baggage_weights):
+        return self.flight_index.direct(source, destination, date)
+
+    def search_itineraries(self, source, destination, date, max_legs=3, min_layover=timedelta(minutes=45),
+                           max_layover=timedelta(hours=6), limit=10):
+        return self.flight_index.connections(source, destination, date, max_legs, min_layover, max_layover, limit=limit)
+
+    def book_flight(self, passenger_id, flight_id, seat_number, baggage_weights, seat_class=SeatClass.ECONOMY):
+        # seat_number None picks the first free seat in seat_class, or, once the class is full but
+        # still within its overbooking limit, confirms the booking without a seat.
+        return self._sell(passenger_id, flight_id, seat_number, baggage_weights, seat_class)
+
+    def hold_seat(self, passenger_id, flight_id, seat_number, baggage_weights, seat_class=SeatClass.ECONOMY,
+                  hold_minutes=None):
+        # Like book_flight, but the booking stays HELD until process_payment confirms it and the
+        # seat goes back on sale once the hold runs out.
+        self.release_expired_holds()
+        minutes = self.hold_minutes if hold_minutes is None else hold_minutes
+        return self._sell(passenger_id, flight_id, seat_number, baggage_weights, seat_class,
+                          self.clock() + minutes * 60)
+
+    def _sell(self, passenger_id, flight_id, seat_number, baggage_weights, seat_class, hold_expires=None):
         passenger = self.users[passenger_id]
-        flight = next((f for f in self.flights if f.id == flight_id), None)
-        if not flight or not flight.aircraft.assign_seat(seat_number, passenger_id):
+        flight = self.flight_index.get(flight_id)
+        if not flight:
             return None
+        seats = flight.seats
+        if seat_number is not None:
+            if not 1 <= seat_number <= seats.capacity:
+                return None
+            seat_class = seats.seat_class(seat_number)
+        with self.flight_locks.for_key(flight.id):
+            sold, seat_number = seats.sell(seat_class, passenger_id, seat_number)
+            if not sold:
+                return None
+            booking = self._record_booking(passenger, flight, seat_number, baggage_weights, seat_class)
+            if seat_number is None:
+                flight.unseated[seat_class].append(booking)
+            if hold_expires is not None:
+                booking.status = BookingStatus.HELD
+                booking.hold_expires = hold_expires
+                with self.holds_lock:
+                    self.holds.schedule(booking.id, hold_expires)
+        return booking
+
+    def book_group(self, passenger_ids, flight_id, seat_class=SeatClass.ECONOMY):
+        # Seats the whole group side by side in one row, or books nobody.
+        flight = self.flight_index.get(flight_id)
+        if not flight:
+            return None
+        passengers = [self.users[passenger_id] for passenger_id in passenger_ids]
+        with self.flight_locks.for_key(flight.id):
+            seats = flight.seats.sell_block(seat_class, passenger_ids)
+            if seats is None:
+                return None
+            return [self._record_booking(passenger, flight, seat_number, [], seat_class)
+                    for passenger, seat_number in zip(passengers, seats)]
+
+    def _record_booking(self, passenger, flight, seat_number, baggage_weights, seat_class=SeatClass.ECONOMY):
         baggage_list = [Baggage(w, False) for w in baggage_weights]
-        booking = Booking(passenger, flight, seat_number, baggage_list)
+        booking = Booking(passenger, flight, seat_number, baggage_list, seat_class)
         flight.bookings.append(booking)
         self.bookings[booking.id] = booking
         return booking
 
-    def process_payment(self, booking_id, amount, method):
-        payment = Payment(booking_id, amount, method)
+    def set_overbooking_limit(self, flight_id, seat_class, extra_seats):
+        flight = self.flight_index.get(flight_id)
+        with self.flight_locks.for_key(flight.id):
+            flight.seats.set_overbooking_limit(seat_class, extra_seats)
+
+    def availability_snapshot(self, flight_ids=None):
+        index = self.flight_index
+        flights = self.flights if flight_ids is None else [index.get(flight_id) for flight_id in flight_ids]
+        return AvailabilitySnapshot(flights)
+
+    def process_payment(self, booking_id, amount, method, approved=True):
+        # Confirms a held booking if the payment went through before the hold ran out; a declined
+        # payment releases the seat at once, cancelling the booking if book_flight confirmed it before
+        # any payment went through. A booking that is already paid for keeps its seat.
+        booking = self.bookings.get(booking_id)
+        status = PaymentStatus.COMPLETED if approved else PaymentStatus.FAILED
+        if booking and booking.status == BookingStatus.CONFIRMED:
+            if approved:
+                booking.paid = True
+            elif not booking.paid:
+                self.cancel_booking(booking_id)
+        elif booking:
+            with self.flight_locks.for_key(booking.flight.id):
+                if booking.status != BookingStatus.HELD:
+                    status = PaymentStatus.FAILED
+                elif approved and self.clock() < booking.hold_expires:
+                    booking.confirm()
+                    booking.paid = True
+                else:
+                    status = PaymentStatus.FAILED
+                    booking.expire()
+                    self._free_seat(booking)
+            with self.holds_lock:
+                self.holds.cancel(booking_id)
+        payment = Payment(booking_id, amount, method, status)
         self.payments.append(payment)
         return payment
 
+    def release_expired_holds(self):
+        with self.holds_lock:
+            expired = self.holds.advance(self.clock())
+        released = 0
+        for booking_id in expired:
+            booking = self.bookings[booking_id]
+            with self.flight_locks.for_key(booking.flight.id):
+                if booking.status == BookingStatus.HELD:
+                    booking.expire()
+                    self._free_seat(booking)
+                    released += 1
+        return released
+
     def cancel_booking(self, booking_id):
         booking = self.bookings.get(booking_id)
-        if booking:
-            booking.cancel()
-            return True
-        return False
+        if not booking:
+            return False
+        with self.flight_locks.for_key(booking.flight.id):
+            if booking.status in (BookingStatus.CONFIRMED, BookingStatus.HELD):
+                booking.cancel()
+                self._free_seat(booking)
+        with self.holds_lock:
+            self.holds.cancel(booking_id)
+        return True
+
+    def _free_seat(self, booking):
+        # Gives the seat back straight away; the oldest unseated booking in the class takes it.
+        # Caller holds the flight lock.
+        flight = booking.flight
+        seats = flight.seats
+        seats.unsell(booking.seat_class, booking.seat_number)
+        if booking.seat_number is not None:
+            waiting = flight.unseated[booking.seat_class]
+            while waiting:
+                candidate = waiting.popleft()
+                if candidate.status in (BookingStatus.CONFIRMED, BookingStatus.HELD):
+                    seats.assign(booking.seat_number, candidate.passenger.id)
+                    candidate.seat_number = booking.seat_number
+                    break
 
     def issue_refund(self, booking_id):
         booking = self.bookings.get(booking_id)
@@ -145,3 +703,243 @@ class AirlineSystem:
             booking.refund()
             return True
         return False
+
+
+# Tests
+
+def test_declined_payments():
+    system = AirlineSystem()
+    passenger = system.register_user("P", "p@example.com").id
+    flight = system.add_flight("AAA", "BBB", datetime(2025, 1, 1).date(), Aircraft("A320", 2))
+    booked = system.book_flight(passenger, flight.id, None, [])
+    held = system.hold_seat(passenger, flight.id, None, [])
+    assert flight.free_seat_count() == 0
+    assert system.process_payment(booked.id, 99.0, "card", approved=False).status == PaymentStatus.FAILED
+    assert system.process_payment(held.id, 99.0, "card", approved=False).status == PaymentStatus.FAILED
+    assert booked.status == BookingStatus.CANCELLED and held.status == BookingStatus.EXPIRED
+    assert flight.free_seat_count() == 2 and not flight.seats.sold[SEAT_CLASS_INDEX[SeatClass.ECONOMY]]
+    # Once a payment has gone through, a later declined one leaves the booking and its seat alone.
+    held = system.hold_seat(passenger, flight.id, None, [])
+    assert system.process_payment(held.id, 99.0, "card").status == PaymentStatus.COMPLETED
+    booked = system.book_flight(passenger, flight.id, None, [])
+    assert system.process_payment(booked.id, 99.0, "card").status == PaymentStatus.COMPLETED
+    for booking in (held, booked):
+        assert system.process_payment(booking.id, 99.0, "card", approved=False).status == PaymentStatus.FAILED
+        assert booking.status == BookingStatus.CONFIRMED
+    assert flight.free_seat_count() == 0
+    print("Payment tests passed")
+
+
+def test_group_booking_unknown_passenger():
+    system = AirlineSystem()
+    passenger = system.register_user("P", "p@example.com").id
+    flight = system.add_flight("AAA", "BBB", datetime(2025, 1, 1).date(), Aircraft("A320", 6))
+    try:
+        system.book_group([passenger, "unknown"], flight.id)
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("group booked with an unknown passenger")
+    assert flight.free_seat_count() == 6 and not flight.bookings and not system.bookings
+    assert len(system.book_group([passenger, passenger], flight.id)) == 2 and flight.free_seat_count() == 4
+    print("Group booking tests passed")
+
+
+# Benchmarks
+
+def benchmark_flight_search(num_airports=300, flights_per_day=3000, days=365, queries=1000, seed=7):
+    rng = random.Random(seed)
+    airports = [f"A{i:03d}" for i in range(num_airports)]
+    # Hub-heavy traffic: a few airports see most departures and arrivals.
+    weights = [1 / (rank + 1) for rank in range(num_airports)]
+    aircraft = Aircraft("A320", 180)
+    system = AirlineSystem()
+    first_day = datetime(2025, 1, 1).date()
+    start = time.perf_counter()
+    for day_offset in range(days):
+        day = first_day + timedelta(days=day_offset)
+        midnight = datetime.combine(day, datetime.min.time())
+        sources = rng.choices(airports, weights, k=flights_per_day)
+        destinations = rng.choices(airports, weights, k=flights_per_day)
+        for source, destination in zip(sources, destinations):
+            if source == destination:
+                continue
+            departure = midnight + timedelta(minutes=rng.randrange(5 * 60, 23 * 60))
+            system.add_flight(source, destination, day, aircraft, departure, departure + timedelta(minutes=rng.randrange(60, 360)))
+    build = time.perf_counter() - start
+
+    pairs = [(rng.choice(airports[:50]), rng.choice(airports), first_day + timedelta(days=rng.randrange(days)))
+             for _ in range(queries)]
+    start = time.perf_counter()
+    for source, destination, day in pairs:
+        system.search_flights(source, destination, day)
+    direct = (time.perf_counter() - start) / queries
+    found = 0
+    start = time.perf_counter()
+    for source, destination, day in pairs:
+        found += bool(system.search_itineraries(source, destination, day))
+    connecting = (time.perf_counter() - start) / queries
+    print(f"Flight search: {len(system.flight_index):,} flights indexed in {build:.1f}s; direct {direct * 1000:.3f}ms, "
+          f"itineraries {connecting * 1000:.2f}ms per query ({found}/{queries} with results)")
+    return direct, connecting
+
+
+def benchmark_availability(num_flights=5000, polls=20, seed=7):
+    rng = random.Random(seed)
+    layout = {SeatClass.FIRST: 12, SeatClass.BUSINESS: 36, SeatClass.ECONOMY: 312}
+    system = AirlineSystem()
+    day = datetime(2025, 1, 1).date()
+    legacy_maps = []
+    for _ in range(num_flights):
+        flight = system.add_flight("AAA", "BBB", day, Aircraft("777", 360, layout, seats_per_row=9))
+        seats = flight.seats
+        for seat_number in rng.sample(range(1, 361), rng.randrange(360)):
+            seats.sell_seat(seat_number, "user")
+        legacy_maps.append({i: seats.occupants.get(i) for i in range(1, 361)})
+
+    start = time.perf_counter()
+    for _ in range(polls):
+        snapshot = system.availability_snapshot()
+    bulk = (time.perf_counter() - start) / polls
+    start = time.perf_counter()
+    for _ in range(polls):
+        legacy = [[s for s, u in seat_map.items() if u is None] for seat_map in legacy_maps]
+    per_seat = (time.perf_counter() - start) / polls
+    assert all(snapshot.seat_map(i).tobytes().count(FREE) == len(free) for i, free in enumerate(legacy))
+
+    flight = system.flights[0]
+    start = time.perf_counter()
+    blocks = 0
+    for _ in range(10000):
+        seats = flight.seats.find_block(SeatClass.ECONOMY, 3)
+        blocks += seats is not None
+    block = (time.perf_counter() - start) / 10000
+    print(f"Availability: snapshot of {num_flights:,} flights in {bulk * 1000:.1f}ms "
+          f"vs {per_seat * 1000:.1f}ms rebuilding free-seat lists ({per_seat / bulk:.0f}x); "
+          f"{len(snapshot.seat_maps) / num_flights:.0f} B/flight; 3-seat block search {block * 1e6:.1f}us")
+    return bulk, per_seat
+
+
+def stress_test_concurrent_bookings(num_flights=50, num_threads=8, ops_per_thread=20000, overbooking=6, seed=7):
+    layout = {SeatClass.FIRST: 8, SeatClass.BUSINESS: 24, SeatClass.ECONOMY: 148}
+    system = AirlineSystem()
+    passengers = [system.register_user(f"P{i}", f"p{i}@example.com").id for i in range(1000)]
+    day = datetime(2025, 1, 1).date()
+    # Every departure uses the same aircraft, but each must still sell its own seats.
+    aircraft = Aircraft("A321", 180, layout)
+    flights = [system.add_flight("AAA", "BBB", day, aircraft) for _ in range(num_flights)]
+    for flight in flights:
+        system.set_overbooking_limit(flight.id, SeatClass.ECONOMY, overbooking)
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        mine = []
+        for _ in range(ops_per_thread):
+            roll = rng.random()
+            if mine and roll < 0.3:
+                system.cancel_booking(mine.pop(rng.randrange(len(mine))).id)
+                continue
+            flight = rng.choice(flights)
+            if roll < 0.6:
+                # Everyone fights over the same few seat numbers.
+                booking = system.book_flight(rng.choice(passengers), flight.id, rng.randint(1, 40), [])
+            elif roll < 0.9:
+                booking = system.book_flight(rng.choice(passengers), flight.id, None, [],
+                                             rng.choice(SEAT_CLASS_ORDER))
+            else:
+                booking = system.book_group(rng.sample(passengers, 3), flight.id)
+                booking = booking[0] if booking else None
+            if booking:
+                mine.append(booking)
+
+    threads = [threading.Thread(target=worker, args=(seed + i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    confirmed = 0
+    for flight in flights:
+        seats = flight.seats
+        active = [booking for booking in flight.bookings if booking.status == BookingStatus.CONFIRMED]
+        seated = [booking.seat_number for booking in active if booking.seat_number is not None]
+        assert len(seated) == len(set(seated)), "seat booked twice"
+        assert set(seated) == set(seats.occupants), "seat inventory out of sync with bookings"
+        assert seats.occupancy.count(TAKEN) == len(seated)
+        for seat_class in SEAT_CLASS_ORDER:
+            sold = sum(1 for booking in active if booking.seat_class == seat_class)
+            assert sold == seats.sold[SEAT_CLASS_INDEX[seat_class]] <= seats.sale_limit(seat_class), "sales out of sync"
+            start_index, end_index = seats.sections[seat_class]
+            assert seats.free_count(seat_class) == seats.occupancy.count(FREE, start_index, end_index)
+            if any(booking.seat_number is None and booking.seat_class == seat_class for booking in active):
+                assert seats.free_count(seat_class) == 0, "unseated booking while seats are free"
+        confirmed += len(active)
+    ops = num_threads * ops_per_thread
+    print(f"Booking stress: {ops:,} ops on {num_threads} threads in {elapsed:.2f}s ({ops / elapsed:,.0f} ops/s), "
+          f"{confirmed:,} confirmed bookings across {num_flights} flights; no double bookings")
+    return ops / elapsed
+
+
+def benchmark_seat_holds(num_holds=50000, num_threads=8, sweeps=60, seed=7):
+    # One fare-sale flight: tens of thousands of 5-15 minute holds taken on several threads, some
+    # paid, some declined, the rest left to expire while a simulated clock runs forward a minute a
+    # sweep. Each sweep is timed against scanning every booking for lapsed holds.
+    now = [0.0]
+    system = AirlineSystem(clock=lambda: now[0])
+    passengers = [system.register_user(f"P{i}", f"p{i}@example.com").id for i in range(1000)]
+    capacity = num_holds - num_holds // 10  # some holds end up unseated within the overbooking limit
+    flight = system.add_flight("AAA", "BBB", datetime(2025, 1, 1).date(), Aircraft("sale", capacity, {
+        SeatClass.FIRST: 0, SeatClass.BUSINESS: 0, SeatClass.ECONOMY: capacity}))
+    system.set_overbooking_limit(flight.id, SeatClass.ECONOMY, num_holds - capacity)
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        for _ in range(num_holds // num_threads):
+            booking = system.hold_seat(rng.choice(passengers), flight.id, None, [],
+                                       hold_minutes=rng.uniform(5, 15))
+            roll = rng.random()
+            if booking and roll < 0.5:
+                system.process_payment(booking.id, 99.0, "card", approved=roll < 0.4)
+
+    threads = [threading.Thread(target=worker, args=(seed + i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    taking = time.perf_counter() - start
+    held = len(system.holds)
+
+    wheel = scan = 0.0
+    released = 0
+    for _ in range(sweeps):
+        now[0] += 60
+        start = time.perf_counter()
+        lapsed = [b for b in flight.bookings if b.status == BookingStatus.HELD and b.hold_expires <= now[0]]
+        scan += time.perf_counter() - start
+        start = time.perf_counter()
+        count = system.release_expired_holds()
+        wheel += time.perf_counter() - start
+        assert count == len(lapsed)
+        released += count
+
+    seats = flight.seats
+    confirmed = [b for b in flight.bookings if b.status == BookingStatus.CONFIRMED]
+    assert not any(b.status == BookingStatus.HELD for b in flight.bookings) and not system.holds
+    assert seats.sold[SEAT_CLASS_INDEX[SeatClass.ECONOMY]] == len(confirmed)
+    assert sorted(seats.occupants) == sorted(b.seat_number for b in confirmed if b.seat_number is not None)
+    print(f"Seat holds: {len(flight.bookings):,} holds on one flight in {taking:.2f}s ({held:,} left unpaid); "
+          f"{released:,} released over {sweeps} sweeps in {wheel * 1000:.1f}ms vs {scan * 1000:.1f}ms scanning "
+          f"({scan / wheel:.0f}x); {len(confirmed):,} confirmed")
+    return wheel, scan
+
+
+if __name__ == "__main__":
+    test_declined_payments()
+    test_group_booking_unknown_passenger()
+    benchmark_flight_search()
+    benchmark_availability()
+    stress_test_concurrent_bookings()
+    benchmark_seat_holds()
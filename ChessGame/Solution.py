@@ -1,4 +1,8 @@
+import os
+import random
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 
 
 class Position:
@@ -39,17 +43,17 @@ class Queen(Piece):
     def is_valid_move(self, board, dest):
         dx = abs(dest.x - self.position.x)
         dy = abs(dest.y - self.position.y)
-        return dx == dy or dx == 0 or dy == 0
+        return (dx == dy or dx == 0 or dy == 0) and board.is_path_clear(self.position, dest)
 
 
 class Rook(Piece):
     def is_valid_move(self, board, dest):
-        return self.position.x == dest.x or self.position.y == dest.y
+        return (self.position.x == dest.x or self.position.y == dest.y) and board.is_path_clear(self.position, dest)
 
 
 class Bishop(Piece):
     def is_valid_move(self, board, dest):
-        return abs(dest.x - self.position.x) == abs(dest.y - self.position.y)
+        return abs(dest.x - self.position.x) == abs(dest.y - self.position.y) and board.is_path_clear(self.position, dest)
 
 
 class Knight(Piece):
@@ -73,6 +77,12 @@ class Board:
     def __init__(self):
         self.grid = [[None for _ in range(8)] for _ in range(8)]
         self.setup_board()
+        self.side_to_move = 'white'
+        self.castling = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.en_passant = None  # square a pawn just skipped with a double push
+        self.history = []  # undo records for unmake_move
+        self.zobrist_key = self.compute_key()
+        self.repetitions = {self.zobrist_key: 1}  # zobrist key -> times the position has occurred
 
     def setup_board(self):
         for color, row_pawn, row_other in [('white', 6, 7), ('black', 1, 0)]:
@@ -84,11 +94,104 @@ class Board:
     def get_piece(self, pos):
         return self.grid[pos.x][pos.y]
 
-    def move_piece(self, src, dest):
+    def move_piece(self, src, dest, promotion=None):
+        self.make_move(src, dest, promotion)
+
+    def make_move(self, src, dest, promotion=None):
+        # Updates the grid and the Zobrist key in place; unmake_move reverts it without copying.
+        # Castling also moves the rook, en passant takes the pawn beside dest, and a pawn reaching the
+        # last rank is replaced by `promotion` (a Piece class, Queen by default).
         piece = self.get_piece(src)
-        self.grid[dest.x][dest.y] = piece
+        captured_pos = dest
+        if isinstance(piece, Pawn) and dest.y != src.y and self.grid[dest.x][dest.y] is None:
+            captured_pos = Position(src.x, dest.y)
+        captured = self.get_piece(captured_pos)
+        rook_move = None
+        if isinstance(piece, King) and abs(dest.y - src.y) == 2:
+            rook_from, rook_to = CASTLING_ROOK_MOVES[_grid_square(dest)]
+            rook_move = (_grid_position(rook_from), _grid_position(rook_to))
+        landed = piece
+        if isinstance(piece, Pawn) and dest.x in (0, 7):
+            landed = (promotion or Queen)(piece.color, dest)
+        self.history.append((src, dest, piece, captured, captured_pos, piece.has_moved, rook_move,
+                             self.castling, self.en_passant, self.zobrist_key))
+
+        src_square, dest_square = _grid_square(src), _grid_square(dest)
+        key = self.zobrist_key ^ self._ep_key() ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECES[_piece_code(piece)][src_square] ^ ZOBRIST_PIECES[_piece_code(landed)][dest_square]
+        if captured is not None:
+            key ^= ZOBRIST_PIECES[_piece_code(captured)][_grid_square(captured_pos)]
+        self.grid[captured_pos.x][captured_pos.y] = None
         self.grid[src.x][src.y] = None
+        self.grid[dest.x][dest.y] = landed
         piece.move(dest)
+        landed.has_moved = True
+        if rook_move is not None:
+            rook_from, rook_to = rook_move
+            rook = self.get_piece(rook_from)
+            self.grid[rook_to.x][rook_to.y] = rook
+            self.grid[rook_from.x][rook_from.y] = None
+            rook.move(rook_to)
+            rook_code = _piece_code(rook)
+            key ^= ZOBRIST_PIECES[rook_code][_grid_square(rook_from)] ^ ZOBRIST_PIECES[rook_code][_grid_square(rook_to)]
+        castling = self.castling & CASTLING_MASK[src_square] & CASTLING_MASK[dest_square]
+        key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+        self.castling = castling
+        self.en_passant = None
+        if isinstance(piece, Pawn) and abs(dest.x - src.x) == 2:
+            self.en_passant = Position((src.x + dest.x) // 2, src.y)
+        self.side_to_move = 'black' if self.side_to_move == 'white' else 'white'
+        key ^= self._ep_key()
+        self.zobrist_key = key
+        self.repetitions[key] = self.repetitions.get(key, 0) + 1
+
+    def unmake_move(self):
+        src, dest, piece, captured, captured_pos, has_moved, rook_move, self.castling, self.en_passant, key = \
+            self.history.pop()
+        count = self.repetitions[self.zobrist_key] - 1
+        if count:
+            self.repetitions[self.zobrist_key] = count
+        else:
+            del self.repetitions[self.zobrist_key]
+        self.zobrist_key = key
+        self.grid[dest.x][dest.y] = None
+        self.grid[captured_pos.x][captured_pos.y] = captured
+        self.grid[src.x][src.y] = piece
+        piece.position = src
+        piece.has_moved = has_moved
+        if rook_move is not None:
+            rook_from, rook_to = rook_move
+            rook = self.get_piece(rook_to)
+            self.grid[rook_from.x][rook_from.y] = rook
+            self.grid[rook_to.x][rook_to.y] = None
+            rook.position = rook_from
+            rook.has_moved = False
+        self.side_to_move = 'black' if self.side_to_move == 'white' else 'white'
+
+    def _ep_key(self):
+        # Hashed like BitboardPosition: only when a pawn of the side to move stands beside the pawn
+        # that just made the double push.
+        ep = self.en_passant
+        if ep is not None:
+            row = ep.x + (1 if self.side_to_move == 'white' else -1)
+            for y in (ep.y - 1, ep.y + 1):
+                piece = self.grid[row][y] if 0 <= y < 8 else None
+                if isinstance(piece, Pawn) and piece.color == self.side_to_move:
+                    return ZOBRIST_EP_FILE[ep.y]
+        return 0
+
+    def compute_key(self):
+        key = ZOBRIST_CASTLING[self.castling] ^ self._ep_key()
+        if self.side_to_move == 'black':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for x, row in enumerate(self.grid):
+            for y, piece in enumerate(row):
+                if piece is not None:
+                    key ^= ZOBRIST_PIECES[_piece_code(piece)][(7 - x) * 8 + y]
+        return key
+
+    def is_threefold_repetition(self):
+        return self.repetitions[self.zobrist_key] >= 3
 
     def is_empty(self, pos):
         return self.get_piece(pos) is None
@@ -96,6 +199,17 @@ class Board:
     def is_valid_position(self, pos):
         return 0 <= pos.x < 8 and 0 <= pos.y < 8
 
+    def is_path_clear(self, src, dest):
+        # Squares strictly between src and dest along a rank, file or diagonal.
+        step_x = (dest.x > src.x) - (dest.x < src.x)
+        step_y = (dest.y > src.y) - (dest.y < src.y)
+        x, y = src.x + step_x, src.y + step_y
+        while (x, y) != (dest.x, dest.y):
+            if self.grid[x][y] is not None:
+                return False
+            x, y = x + step_x, y + step_y
+        return True
+
     def find_king(self, color):
         for row in self.grid:
             for piece in row:
@@ -104,9 +218,1020 @@ class Board:
         return None
 
     def is_in_check(self, color):
-        king_pos = self.find_king(color)
-        for row in self.grid:
-            for piece in row:
-                if piece and piece.color != color and piece.is_valid_move(self, king_pos):
-                    return True
-        return False
+        position = self.to_bitboard(color)
+        return position.in_check()
+
+    def to_bitboard(self, side_to_move=None):
+        # White starts on rows 6-7 of the grid, so grid (x, y) is square (7 - x) * 8 + y with a1 = 0.
+        # Castling rights follow from unmoved kings and rooks on their home squares; the en passant
+        # square only applies to the side to move.
+        position = BitboardPosition()
+        for x, row in enumerate(self.grid):
+            for y, piece in enumerate(row):
+                if piece is not None:
+                    position.put(COLORS.index(piece.color) * 6 + PIECE_CLASSES.index(type(piece)), (7 - x) * 8 + y)
+        for right, (king_square, rook_square) in enumerate(CASTLING_HOME_SQUARES):
+            king = self.grid[7 - king_square // 8][king_square % 8]
+            rook = self.grid[7 - rook_square // 8][rook_square % 8]
+            if isinstance(king, King) and isinstance(rook, Rook) and not king.has_moved and not rook.has_moved \
+                    and king.color == rook.color == COLORS[right // 2]:
+                position.castling |= 1 << right
+        position.side = COLORS.index(side_to_move or self.side_to_move)
+        if self.en_passant is not None and position.side == COLORS.index(self.side_to_move):
+            position.ep_square = _grid_square(self.en_passant)
+        position.refresh()
+        return position
+
+    def legal_moves(self, color):
+        # (src, dest, promotion piece class or None) for every legal move of `color`.
+        return [_grid_move(move) for move in self.to_bitboard(color).legal_moves()]
+
+
+def _grid_square(pos):
+    return (7 - pos.x) * 8 + pos.y
+
+
+def _grid_position(square):
+    return Position(7 - square // 8, square % 8)
+
+
+def _piece_code(piece):
+    return COLORS.index(piece.color) * 6 + PIECE_CLASSES.index(type(piece))
+
+
+def _grid_move(move):
+    src, dest, promotion = move & 63, (move >> 6) & 63, (move >> 12) & 7
+    return _grid_position(src), _grid_position(dest), PIECE_CLASSES[promotion] if promotion else None
+
+
+# Bitboards: one 64-bit int per (color, piece type), bit n set for square n with a1 = 0, h1 = 7,
+# a8 = 56. Piece codes are color * 6 + type. Leapers use precomputed attack tables; sliders use
+# precomputed rays cut at the first blocker (lowest set bit for rays going up the board, highest
+# for rays going down).
+
+COLORS = ('white', 'black')
+PIECE_CLASSES = (Pawn, Knight, Bishop, Rook, Queen, King)
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_LETTERS = "PNBRQKpnbrqk"
+FULL_BOARD = (1 << 64) - 1
+RANK_3 = 0xFF << 16
+RANK_6 = 0xFF << 40
+PROMOTION_RANKS = (0xFF << 56, 0xFF)
+
+# Move encoding: from | to << 6 | promotion piece type << 12 | flag << 15
+QUIET, CAPTURE, DOUBLE_PUSH, EN_PASSANT, CASTLE = range(5)
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLING_HOME_SQUARES = ((4, 7), (4, 0), (60, 63), (60, 56))
+# king destination -> (rook from, rook to)
+CASTLING_ROOK_MOVES = {6: (7, 5), 2: (0, 3), 62: (63, 61), 58: (56, 59)}
+CASTLING_MASK = [15] * 64
+for _square, _rights in ((4, 3), (7, 1), (0, 2), (60, 12), (63, 4), (56, 8)):
+    CASTLING_MASK[_square] = 15 ^ _rights
+
+
+# Zobrist keys: one random 64-bit number per (piece code, square), castling-rights set and en
+# passant file, plus one for black to move. Seeded so keys are stable across runs and processes.
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP_FILE = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+
+def _leaper_attacks(offsets):
+    table = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        attacks = 0
+        for d_rank, d_file in offsets:
+            if 0 <= rank + d_rank < 8 and 0 <= file + d_file < 8:
+                attacks |= 1 << ((rank + d_rank) * 8 + file + d_file)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_attacks([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _leaper_attacks([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+PAWN_ATTACKS = (_leaper_attacks([(1, -1), (1, 1)]), _leaper_attacks([(-1, -1), (-1, 1)]))
+
+ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def _rays(d_rank, d_file):
+    table = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        ray = 0
+        rank, file = rank + d_rank, file + d_file
+        while 0 <= rank < 8 and 0 <= file < 8:
+            ray |= 1 << (rank * 8 + file)
+            rank, file = rank + d_rank, file + d_file
+        table.append(ray)
+    return table
+
+
+# (rays, ray goes up the board) per direction
+ROOK_RAYS = [(_rays(*direction), direction > (0, 0)) for direction in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(_rays(*direction), direction > (0, 0)) for direction in BISHOP_DIRECTIONS]
+
+
+def _slider_attacks(rays, square, occupied):
+    attacks = 0
+    for ray_table, upward in rays:
+        ray = ray_table[square]
+        blockers = ray & occupied
+        if blockers:
+            blocker = (blockers & -blockers).bit_length() - 1 if upward else blockers.bit_length() - 1
+            ray ^= ray_table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(square, occupied):
+    return _slider_attacks(ROOK_RAYS, square, occupied)
+
+
+def bishop_attacks(square, occupied):
+    return _slider_attacks(BISHOP_RAYS, square, occupied)
+
+
+def square_name(square):
+    return "abcdefgh"[square & 7] + str(square // 8 + 1)
+
+
+def move_to_uci(move):
+    promotion = (move >> 12) & 7
+    return square_name(move & 63) + square_name((move >> 6) & 63) + ("nbrq"[promotion - 1] if promotion else "")
+
+
+# Material and piece-square values (the "simplified evaluation function" tables), listed from a8 to
+# h1 as seen by white. PIECE_SQUARE_VALUES[piece code][square] holds the signed contribution of a
+# piece on a square: positive for white, negative for black, with black reading the tables mirrored.
+PIECE_VALUES = (100, 320, 330, 500, 900, 20000)
+PIECE_SQUARE_TABLES = (
+    (0, 0, 0, 0, 0, 0, 0, 0,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5,
+     0, 0, 0, 20, 20, 0, 0, 0,
+     5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5,
+     0, 0, 0, 0, 0, 0, 0, 0),
+    (-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20, 0, 0, 0, 0, -20, -40,
+     -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30,
+     -30, 0, 15, 20, 20, 15, 0, -30,
+     -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50),
+    (-20, -10, -10, -10, -10, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10,
+     -10, 0, 10, 10, 10, 10, 0, -10,
+     -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20),
+    (0, 0, 0, 0, 0, 0, 0, 0,
+     5, 10, 10, 10, 10, 10, 10, 5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     0, 0, 0, 5, 5, 0, 0, 0),
+    (-20, -10, -10, -5, -5, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5,
+     0, 0, 5, 5, 5, 5, 0, -5,
+     -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10,
+     -20, -10, -10, -5, -5, -10, -10, -20),
+    (-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+     20, 20, 0, 0, 0, 0, 20, 20,
+     20, 30, 10, 0, 0, 10, 30, 20),
+)
+PIECE_SQUARE_VALUES = [[PIECE_VALUES[piece_type] + table[(7 - square // 8) * 8 + square % 8] for square in range(64)]
+                       for piece_type, table in enumerate(PIECE_SQUARE_TABLES)] + \
+                      [[-PIECE_VALUES[piece_type] - table[square] for square in range(64)]
+                       for piece_type, table in enumerate(PIECE_SQUARE_TABLES)]
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+class BitboardPosition:
+    def __init__(self, fen=None):
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        self.mailbox = [-1] * 64  # square -> piece code, -1 when empty
+        self.side = 0
+        self.castling = 0
+        self.ep_square = -1
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.history = []  # undo records for unmake_move
+        self.key = 0
+        self.repetitions = {}  # zobrist key -> times the position has occurred
+        self.score = 0  # material + piece-square total, white minus black
+        self.nodes = 0  # make_move calls, for search statistics
+        if fen:
+            self.set_fen(fen)
+
+    def put(self, piece, square):
+        bit = 1 << square
+        self.bitboards[piece] |= bit
+        self.occupancy[piece // 6] |= bit
+        self.mailbox[square] = piece
+
+    def compute_key(self):
+        key = ZOBRIST_CASTLING[self.castling] ^ self._ep_key()
+        if self.side:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for square, piece in enumerate(self.mailbox):
+            if piece >= 0:
+                key ^= ZOBRIST_PIECES[piece][square]
+        return key
+
+    def compute_score(self):
+        return sum(PIECE_SQUARE_VALUES[piece][square] for square, piece in enumerate(self.mailbox) if piece >= 0)
+
+    def refresh(self):
+        # Recomputes the key, repetition counts and evaluation after pieces were placed directly.
+        self.key = self.compute_key()
+        self.repetitions = {self.key: 1}
+        self.score = self.compute_score()
+
+    def evaluate(self):
+        # Material and piece-square score from the side to move's point of view.
+        return self.score if self.side == 0 else -self.score
+
+    def _ep_key(self):
+        # The en passant file only counts when the side to move has a pawn that could take, so that
+        # otherwise identical positions hash (and repeat) the same.
+        ep = self.ep_square
+        if ep >= 0 and PAWN_ATTACKS[self.side ^ 1][ep] & self.bitboards[self.side * 6 + PAWN]:
+            return ZOBRIST_EP_FILE[ep & 7]
+        return 0
+
+    def is_repetition(self, times=3):
+        return self.repetitions.get(self.key, 0) >= times
+
+    def set_fen(self, fen):
+        fields = fen.split()
+        for rank, row in enumerate(reversed(fields[0].split("/"))):
+            file = 0
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                else:
+                    self.put(PIECE_LETTERS.index(char), rank * 8 + file)
+                    file += 1
+        self.side = 0 if fields[1] == "w" else 1
+        self.castling = sum(1 << "KQkq".index(char) for char in fields[2] if char != "-")
+        self.ep_square = -1 if fields[3] == "-" else "abcdefgh".index(fields[3][0]) + (int(fields[3][1]) - 1) * 8
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        self.refresh()
+
+    def fen(self):
+        rows = []
+        for rank in range(7, -1, -1):
+            row, empty = "", 0
+            for file in range(8):
+                piece = self.mailbox[rank * 8 + file]
+                if piece < 0:
+                    empty += 1
+                    continue
+                row += (str(empty) if empty else "") + PIECE_LETTERS[piece]
+                empty = 0
+            rows.append(row + (str(empty) if empty else ""))
+        castling = "".join(char for i, char in enumerate("KQkq") if self.castling >> i & 1) or "-"
+        ep = square_name(self.ep_square) if self.ep_square >= 0 else "-"
+        return f"{'/'.join(rows)} {'wb'[self.side]} {castling} {ep} {self.halfmove_clock} {self.fullmove_number}"
+
+    def is_attacked(self, square, by):
+        bitboards = self.bitboards
+        base = by * 6
+        if PAWN_ATTACKS[by ^ 1][square] & bitboards[base + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[square] & bitboards[base + KNIGHT] or KING_ATTACKS[square] & bitboards[base + KING]:
+            return True
+        occupied = self.occupancy[0] | self.occupancy[1]
+        queens = bitboards[base + QUEEN]
+        return bool(bishop_attacks(square, occupied) & (bitboards[base + BISHOP] | queens)
+                    or rook_attacks(square, occupied) & (bitboards[base + ROOK] | queens))
+
+    def in_check(self, side=None):
+        side = self.side if side is None else side
+        king = self.bitboards[side * 6 + KING]
+        return bool(king) and self.is_attacked(king.bit_length() - 1, side ^ 1)
+
+    def pseudo_legal_moves(self):
+        us = self.side
+        them = us ^ 1
+        bitboards = self.bitboards
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        empty = ~occupied & FULL_BOARD
+        moves = []
+        add = moves.append
+
+        pawns = bitboards[us * 6 + PAWN]
+        if us == 0:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_3) << 8) & empty
+            back = -8
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_6) >> 8) & empty
+            back = 8
+        promotion_rank = PROMOTION_RANKS[us]
+        while single:
+            bit = single & -single
+            single ^= bit
+            to = bit.bit_length() - 1
+            base = (to + back) | to << 6
+            if bit & promotion_rank:
+                for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                    add(base | promotion << 12)
+            else:
+                add(base)
+        while double:
+            bit = double & -double
+            double ^= bit
+            to = bit.bit_length() - 1
+            add((to + 2 * back) | to << 6 | DOUBLE_PUSH << 15)
+        attacks_table = PAWN_ATTACKS[us]
+        remaining = pawns
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            frm = bit.bit_length() - 1
+            targets = attacks_table[frm] & enemy
+            while targets:
+                target = targets & -targets
+                targets ^= target
+                to = target.bit_length() - 1
+                base = frm | to << 6 | CAPTURE << 15
+                if target & promotion_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        add(base | promotion << 12)
+                else:
+                    add(base)
+        if self.ep_square >= 0:
+            attackers = PAWN_ATTACKS[them][self.ep_square] & pawns
+            while attackers:
+                bit = attackers & -attackers
+                attackers ^= bit
+                add((bit.bit_length() - 1) | self.ep_square << 6 | EN_PASSANT << 15)
+
+        not_own = ~own & FULL_BOARD
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            pieces = bitboards[us * 6 + piece_type]
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                frm = bit.bit_length() - 1
+                if piece_type == KNIGHT:
+                    targets = KNIGHT_ATTACKS[frm]
+                elif piece_type == BISHOP:
+                    targets = bishop_attacks(frm, occupied)
+                elif piece_type == ROOK:
+                    targets = rook_attacks(frm, occupied)
+                elif piece_type == QUEEN:
+                    targets = bishop_attacks(frm, occupied) | rook_attacks(frm, occupied)
+                else:
+                    targets = KING_ATTACKS[frm]
+                targets &= not_own
+                while targets:
+                    target = targets & -targets
+                    targets ^= target
+                    add(frm | (target.bit_length() - 1) << 6 | (CAPTURE << 15 if target & enemy else 0))
+
+        if self.castling:
+            rights = self.castling >> (2 * us)
+            king_square = 4 + 56 * us
+            if rights & 3 and not self.is_attacked(king_square, them):
+                if rights & 1 and not occupied & (0x60 << 56 * us) \
+                        and not self.is_attacked(king_square + 1, them) and not self.is_attacked(king_square + 2, them):
+                    add(king_square | (king_square + 2) << 6 | CASTLE << 15)
+                if rights & 2 and not occupied & (0x0E << 56 * us) \
+                        and not self.is_attacked(king_square - 1, them) and not self.is_attacked(king_square - 2, them):
+                    add(king_square | (king_square - 2) << 6 | CASTLE << 15)
+        return moves
+
+    def legal_moves(self):
+        legal = []
+        us = self.side
+        for move in self.pseudo_legal_moves():
+            self.make_move(move)
+            if not self.in_check(us):
+                legal.append(move)
+            self.unmake_move()
+        return legal
+
+    def make_move(self, move):
+        frm = move & 63
+        to = (move >> 6) & 63
+        promotion = (move >> 12) & 7
+        flag = move >> 15
+        us = self.side
+        them = us ^ 1
+        bitboards, occupancy, mailbox = self.bitboards, self.occupancy, self.mailbox
+        piece = mailbox[frm]
+
+        captured_square = to if flag != EN_PASSANT else to - 8 + 16 * us
+        captured = mailbox[captured_square]
+        self.history.append((move, captured, self.castling, self.ep_square, self.halfmove_clock, self.key, self.score))
+        self.nodes += 1
+        piece_keys = ZOBRIST_PIECES[piece]
+        key = self.key ^ self._ep_key() ^ piece_keys[frm] ^ ZOBRIST_BLACK_TO_MOVE
+        score = self.score - PIECE_SQUARE_VALUES[piece][frm]
+        if captured >= 0:
+            bit = 1 << captured_square
+            bitboards[captured] ^= bit
+            occupancy[them] ^= bit
+            mailbox[captured_square] = -1
+            key ^= ZOBRIST_PIECES[captured][captured_square]
+            score -= PIECE_SQUARE_VALUES[captured][captured_square]
+
+        from_to = 1 << frm | 1 << to
+        bitboards[piece] ^= from_to
+        occupancy[us] ^= from_to
+        mailbox[frm] = -1
+        mailbox[to] = piece
+        if promotion:
+            bitboards[piece] ^= 1 << to
+            mailbox[to] = us * 6 + promotion
+            bitboards[mailbox[to]] |= 1 << to
+            key ^= ZOBRIST_PIECES[mailbox[to]][to]
+            score += PIECE_SQUARE_VALUES[mailbox[to]][to]
+        else:
+            key ^= piece_keys[to]
+            score += PIECE_SQUARE_VALUES[piece][to]
+            if flag == CASTLE:
+                rook_from, rook_to = CASTLING_ROOK_MOVES[to]
+                rook = us * 6 + ROOK
+                rook_bits = 1 << rook_from | 1 << rook_to
+                bitboards[rook] ^= rook_bits
+                occupancy[us] ^= rook_bits
+                mailbox[rook_from] = -1
+                mailbox[rook_to] = rook
+                key ^= ZOBRIST_PIECES[rook][rook_from] ^ ZOBRIST_PIECES[rook][rook_to]
+                score += PIECE_SQUARE_VALUES[rook][rook_to] - PIECE_SQUARE_VALUES[rook][rook_from]
+
+        castling = self.castling & CASTLING_MASK[frm] & CASTLING_MASK[to]
+        key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+        self.castling = castling
+        self.ep_square = (frm + to) >> 1 if flag == DOUBLE_PUSH else -1
+        self.halfmove_clock = 0 if captured >= 0 or piece % 6 == PAWN else self.halfmove_clock + 1
+        self.fullmove_number += us
+        self.side = them
+        key ^= self._ep_key()
+        self.key = key
+        self.score = score
+        self.repetitions[key] = self.repetitions.get(key, 0) + 1
+
+    def unmake_move(self):
+        count = self.repetitions[self.key] - 1
+        if count:
+            self.repetitions[self.key] = count
+        else:
+            del self.repetitions[self.key]
+        move, captured, self.castling, self.ep_square, self.halfmove_clock, self.key, self.score = self.history.pop()
+        frm = move & 63
+        to = (move >> 6) & 63
+        promotion = (move >> 12) & 7
+        flag = move >> 15
+        them = self.side
+        us = them ^ 1
+        self.side = us
+        self.fullmove_number -= us
+        bitboards, occupancy, mailbox = self.bitboards, self.occupancy, self.mailbox
+
+        piece = mailbox[to]
+        if promotion:
+            bitboards[piece] ^= 1 << to
+            piece = us * 6 + PAWN
+            bitboards[piece] |= 1 << to
+        elif flag == CASTLE:
+            rook_from, rook_to = CASTLING_ROOK_MOVES[to]
+            rook = us * 6 + ROOK
+            rook_bits = 1 << rook_from | 1 << rook_to
+            bitboards[rook] ^= rook_bits
+            occupancy[us] ^= rook_bits
+            mailbox[rook_to] = -1
+            mailbox[rook_from] = rook
+        from_to = 1 << frm | 1 << to
+        bitboards[piece] ^= from_to
+        occupancy[us] ^= from_to
+        mailbox[to] = -1
+        mailbox[frm] = piece
+        if captured >= 0:
+            captured_square = to if flag != EN_PASSANT else to - 8 + 16 * us
+            bit = 1 << captured_square
+            bitboards[captured] |= bit
+            occupancy[them] |= bit
+            mailbox[captured_square] = captured
+
+    def perft(self, depth, table=None):
+        # With a transposition table, subtree counts are reused for positions reached again.
+        if depth == 0:
+            return 1
+        if table is not None:
+            entry = table.probe(self.key)
+            if entry is not None and entry[0] == depth:
+                return entry[1]
+        moves = self.legal_moves()
+        if depth == 1:
+            nodes = len(moves)
+        else:
+            nodes = 0
+            for move in moves:
+                self.make_move(move)
+                nodes += self.perft(depth - 1, table)
+                self.unmake_move()
+        if table is not None:
+            table.store(self.key, depth, nodes)
+        return nodes
+
+
+# Fixed-size hash table of search results keyed by Zobrist key, in buckets of two slots: the first
+# keeps the deepest result from the current search, the second always takes the newest entry, so
+# deep results survive while recent shallow ones still get cached. Entries are
+# (depth, value, bound, best move, generation).
+class TranspositionTable:
+    EXACT, LOWER_BOUND, UPPER_BOUND = range(3)
+
+    def __init__(self, size=1 << 20):
+        size = 1 << max(1, (size - 1).bit_length())
+        self.mask = (size >> 1) - 1
+        self.keys = [0] * size
+        self.entries = [None] * size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        return sum(entry is not None for entry in self.entries)
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        self.probes += 1
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        if keys[slot] == key:
+            self.hits += 1
+            return self.entries[slot]
+        if keys[slot + 1] == key:
+            self.hits += 1
+            return self.entries[slot + 1]
+        return None
+
+    def store(self, key, depth, value, bound=EXACT, move=0):
+        slot = (key & self.mask) << 1
+        keys, entries = self.keys, self.entries
+        entry = (depth, value, bound, move, self.generation)
+        current = entries[slot]
+        if current is None or keys[slot] == key or depth >= current[0] or current[4] != self.generation:
+            if current is not None and keys[slot] != key:
+                keys[slot + 1], entries[slot + 1] = keys[slot], current
+            keys[slot], entries[slot] = key, entry
+        else:
+            keys[slot + 1], entries[slot + 1] = key, entry
+
+
+# (name, FEN, {depth: nodes}) from the standard perft suite
+PERFT_POSITIONS = [
+    ("start", START_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", {1: 48, 2: 2039, 3: 97862}),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", {1: 44, 2: 1486, 3: 62379}),
+]
+
+
+INFINITY = 10 ** 9
+MATE = 100000
+MATE_BOUND = MATE - 1000
+MAX_PLY = 128
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, move, score, depth, nodes=0, elapsed=0.0):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return f"SearchResult({move_to_uci(self.move) if self.move else None}, score={self.score}, depth={self.depth})"
+
+
+# Iterative-deepening negamax alpha-beta over BitboardPosition with a transposition table,
+# quiescence on captures, and move ordering by table move, MVV-LVA, killers and history. With
+# workers > 1, each iteration searches the first (best so far) root move here to get a bound, then
+# hands the remaining root moves to a process pool; every worker process keeps its own engine and
+# table across tasks.
+class SearchEngine:
+    def __init__(self, table_size=1 << 20, workers=1):
+        self.table = TranspositionTable(table_size)
+        self.workers = workers
+        self.nodes = 0
+        self.deadline = None
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history_scores = [[0] * 64 for _ in range(12)]
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def new_search(self):
+        # Killers only make sense for the position searched; history scores are halved, so orderings
+        # learnt in earlier searches still help but fade instead of piling up.
+        self.table.new_search()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        for scores in self.history_scores:
+            scores[:] = [score >> 1 for score in scores]
+
+    def best_move(self, board, max_depth=4, time_limit=None):
+        # Takes a Board (side to move from board.side_to_move) and returns (src, dest, promotion) or None.
+        result = self.search(board.to_bitboard(), max_depth, time_limit)
+        return _grid_move(result.move) if result.move else None
+
+    def search(self, position, max_depth=64, time_limit=None):
+        start = time.perf_counter()
+        self.deadline = time.time() + time_limit if time_limit else None
+        self.nodes = 0
+        self.new_search()
+        root_moves = position.legal_moves()
+        if not root_moves:
+            return SearchResult(0, -MATE if position.in_check() else 0, 0)
+        result = SearchResult(root_moves[0], 0, 0)
+        for depth in range(1, max_depth + 1):
+            try:
+                if self.workers > 1 and depth > 2 and len(root_moves) > 1:
+                    scored = self._search_root_parallel(position, root_moves, depth)
+                else:
+                    scored = self._search_root(position, root_moves, depth)
+            except SearchTimeout:
+                break
+            root_moves = [move for move, _ in scored]
+            result = SearchResult(scored[0][0], scored[0][1], depth)
+            if abs(result.score) > MATE_BOUND or (self.deadline and time.time() > self.deadline):
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _search_root(self, position, moves, depth, alpha=-INFINITY):
+        scored = []
+        for move in moves:
+            position.make_move(move)
+            try:
+                score = -self._negamax(position, depth - 1, -INFINITY, -alpha, 1)
+            finally:
+                position.unmake_move()
+            scored.append((move, score))
+            alpha = max(alpha, score)
+        scored.sort(key=lambda item: -item[1])
+        self.table.store(position.key, depth, scored[0][1], TranspositionTable.EXACT, scored[0][0])
+        return scored
+
+    def _search_root_parallel(self, position, moves, depth):
+        scored = self._search_root(position, moves[:1], depth)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_search_worker,
+                                             initargs=(len(self.table.keys),))
+        fen = position.fen()
+        tasks = [self._pool.submit(_search_root_move, fen, position.repetitions, move, depth, scored[0][1], self.deadline,
+                                   self.table.generation) for move in moves[1:]]
+        timed_out = False
+        for task in tasks:
+            move, score, nodes = task.result()
+            self.nodes += nodes
+            if score is None:
+                timed_out = True
+            else:
+                scored.append((move, score))
+        if timed_out:
+            raise SearchTimeout()
+        scored.sort(key=lambda item: -item[1])
+        return scored
+
+    def _negamax(self, position, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.deadline and not self.nodes & 1023 and time.time() > self.deadline:
+            raise SearchTimeout()
+        if position.halfmove_clock >= 100 or position.repetitions[position.key] > 1:
+            return 0
+        if depth <= 0:
+            return self._quiescence(position, alpha, beta)
+
+        table = self.table
+        entry = table.probe(position.key)
+        table_move = 0
+        if entry is not None:
+            table_move = entry[3]
+            if entry[0] >= depth:
+                value = _score_from_table(entry[1], ply)
+                if entry[2] == TranspositionTable.EXACT:
+                    return value
+                if entry[2] == TranspositionTable.LOWER_BOUND:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        original_alpha = alpha
+        us = position.side
+        best_score, best_move = -INFINITY, 0
+        legal = 0
+        for move in self._ordered(position, position.pseudo_legal_moves(), table_move, ply):
+            position.make_move(move)
+            if position.in_check(us):
+                position.unmake_move()
+                continue
+            legal += 1
+            try:
+                score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                position.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not move >> 15 & 1 and not (move >> 12) & 7:
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1], killers[0] = killers[0], move
+                            self.history_scores[position.mailbox[move & 63]][(move >> 6) & 63] += depth * depth
+                        break
+        if not legal:
+            return -MATE + ply if position.in_check() else 0
+
+        bound = TranspositionTable.UPPER_BOUND if best_score <= original_alpha else \
+            TranspositionTable.LOWER_BOUND if best_score >= beta else TranspositionTable.EXACT
+        table.store(position.key, depth, _score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def _quiescence(self, position, alpha, beta):
+        self.nodes += 1
+        stand_pat = position.evaluate()
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        us = position.side
+        captures = [move for move in position.pseudo_legal_moves() if move >> 15 in (CAPTURE, EN_PASSANT)]
+        for move in self._ordered(position, captures, 0, 0):
+            position.make_move(move)
+            if position.in_check(us):
+                position.unmake_move()
+                continue
+            score = -self._quiescence(position, -beta, -alpha)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def _ordered(self, position, moves, table_move, ply):
+        mailbox = position.mailbox
+        killers = self.killers[ply]
+        history = self.history_scores
+
+        def priority(move):
+            if move == table_move:
+                return -INFINITY
+            flag = move >> 15
+            if flag == CAPTURE or flag == EN_PASSANT:
+                victim = mailbox[(move >> 6) & 63] % 6 if flag == CAPTURE else PAWN
+                return -10000000 - PIECE_VALUES[victim] * 8 + mailbox[move & 63] % 6
+            if (move >> 12) & 7:
+                return -9000000
+            if move == killers[0] or move == killers[1]:
+                return -8000000
+            return -history[mailbox[move & 63]][(move >> 6) & 63]
+
+        moves.sort(key=priority)
+        return moves
+
+
+def _score_to_table(score, ply):
+    # Mate scores are stored relative to the node, not the root.
+    return score + ply if score > MATE_BOUND else score - ply if score < -MATE_BOUND else score
+
+
+def _score_from_table(score, ply):
+    return score - ply if score > MATE_BOUND else score + ply if score < -MATE_BOUND else score
+
+
+_worker_engine = None
+_worker_search = None  # generation of the parent's search the worker engine was last reset for
+
+
+def _init_search_worker(table_size):
+    global _worker_engine
+    _worker_engine = SearchEngine(table_size)
+
+
+def _search_root_move(fen, repetitions, move, depth, alpha, deadline, search):
+    global _worker_search
+    position = BitboardPosition(fen)
+    position.repetitions = dict(repetitions)
+    engine = _worker_engine
+    if search != _worker_search:
+        engine.new_search()
+        _worker_search = search
+    engine.nodes = 0
+    engine.deadline = deadline
+    position.make_move(move)
+    try:
+        score = -engine._negamax(position, depth - 1, -INFINITY, -alpha, 1)
+    except SearchTimeout:
+        score = None
+    return move, score, engine.nodes
+
+
+SEARCH_POSITIONS = [
+    ("start", START_FEN),
+    ("kiwipete", PERFT_POSITIONS[1][1]),
+    ("italian", "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQK2R w KQkq - 0 5"),
+]
+
+
+# Tests
+
+def _uci_move(uci):
+    # "e7e8q" -> (src, dest, promotion piece class or None) on the Board grid
+    src, dest = (Position(8 - int(uci[i + 1]), "abcdefgh".index(uci[i])) for i in (0, 2))
+    return src, dest, PIECE_CLASSES["pnbrq".index(uci[4])] if len(uci) > 4 else None
+
+
+def _assert_board_matches(board, position):
+    assert board.to_bitboard().fen().split()[:4] == position.fen().split()[:4], (board.to_bitboard().fen(), position.fen())
+    assert board.zobrist_key == board.compute_key() == position.key
+
+
+def test_special_moves():
+    # En passant, a capturing underpromotion and castling on both sides, played through Board and
+    # checked square for square against BitboardPosition, then taken back.
+    board, position = Board(), BitboardPosition(START_FEN)
+    start_fen = board.to_bitboard().fen()
+    moves = ["e2e4", "a7a6", "e4e5", "d7d5", "e5d6", "g8f6", "d6c7", "e7e6", "c7d8n", "f8e7", "g1f3", "e8g8",
+             "f1e2", "a6a5", "e1g1", "a5a4", "b2b4", "a4b3", "a2a3", "b3b2", "h2h3", "b2a1q"]
+    for uci in moves:
+        src, dest, promotion = _uci_move(uci)
+        assert any(move[:2] == (src, dest) and move[2] is promotion for move in board.legal_moves(board.side_to_move)), uci
+        board.make_move(src, dest, promotion)
+        position.make_move(next(move for move in position.legal_moves() if move_to_uci(move) == uci))
+        _assert_board_matches(board, position)
+    assert board.to_bitboard().fen().split()[0] == "rnbN1rk1/1p2bppp/4pn2/8/8/P4N1P/2PPBPP1/qNBQ1RK1"
+    assert isinstance(board.grid[0][3], Knight) and isinstance(board.grid[7][0], Queen)
+    while board.history:
+        board.unmake_move()
+    assert board.to_bitboard().fen() == start_fen and board.zobrist_key == Board().zobrist_key
+    assert board.repetitions == {board.zobrist_key: 1}
+    print("Special move tests passed")
+
+
+def _play_engine_move(engine, board, depth):
+    # Plays the engine's choice on the Board and the same move on a BitboardPosition of the Board.
+    position = board.to_bitboard()
+    src, dest, promotion = engine.best_move(board, depth)
+    move = next(move for move in position.legal_moves() if _grid_move(move) == (src, dest, promotion))
+    board.make_move(src, dest, promotion)
+    position.make_move(move)
+    _assert_board_matches(board, position)
+    return move
+
+
+def test_engine_round_trip():
+    with SearchEngine(1 << 16) as engine:
+        board = Board()
+        for uci in ["e2e4", "e7e5", "g1f3", "b8c6", "f1c4", "f8c5", "b1c3", "g8f6", "d2d3", "d7d6", "c1e3", "c8e6"]:
+            board.make_move(*_uci_move(uci))
+        assert _play_engine_move(engine, board, 2) >> 15 == CASTLE
+        assert isinstance(board.grid[7][5], Rook) and board.grid[7][7] is None
+
+        board = Board()
+        for uci in ["e2e4", "a7a6", "e4e5", "d7d5", "e5d6", "g8f6", "d6c7", "e7e6"]:
+            board.make_move(*_uci_move(uci))
+        assert (_play_engine_move(engine, board, 2) >> 12) & 7 == QUEEN
+        assert isinstance(board.grid[0][3], Queen) and board.grid[0][3].color == 'white'
+    print("Engine round-trip tests passed")
+
+
+def test_search_timeout():
+    # A search cut off by its deadline deep in the tree must leave the position as it found it. Where
+    # the cut lands depends on the machine, so a few deadlines are tried on each position.
+    with SearchEngine(1 << 16) as engine:
+        for _, fen in SEARCH_POSITIONS:
+            for time_limit in (0.02, 0.1, 0.4):
+                position = BitboardPosition(fen)
+                key = position.key
+                result = engine.search(position, 64, time_limit)
+                assert result.depth < 64 and result.move
+                assert position.fen() == fen and position.key == key and not position.history, position.fen()
+    print("Search timeout tests passed")
+
+
+# Benchmarks
+
+def benchmark_perft(max_nodes=200000):
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in PERFT_POSITIONS:
+        position = BitboardPosition(fen)
+        for depth, expected in sorted(counts.items()):
+            if expected > max_nodes:
+                break
+            start = time.perf_counter()
+            nodes = position.perft(depth)
+            elapsed = time.perf_counter() - start
+            assert nodes == expected, f"perft({depth}) of {name}: {nodes} != {expected}"
+            assert position.fen() == BitboardPosition(fen).fen(), f"{name} not restored after perft"
+            total_nodes += nodes
+            total_time += elapsed
+        print(f"perft {name}: ok to depth {depth if expected <= max_nodes else depth - 1}")
+    print(f"Perft: {total_nodes:,} nodes in {total_time:.2f}s ({total_nodes / total_time:,.0f} nodes/s)")
+    return total_nodes / total_time
+
+
+def benchmark_transposition_table(runs=((START_FEN, 4), (PERFT_POSITIONS[2][1], 5)), table_size=1 << 20):
+    for fen, depth in runs:
+        position = BitboardPosition(fen)
+        start = time.perf_counter()
+        expected = position.perft(depth)
+        plain_time, plain_nodes = time.perf_counter() - start, position.nodes
+        position.nodes = 0
+        table = TranspositionTable(table_size)
+        start = time.perf_counter()
+        nodes = position.perft(depth, table)
+        hashed_time = time.perf_counter() - start
+        assert nodes == expected and position.key == position.compute_key()
+        print(f"Hashed perft({depth}) of {fen.split()[0]}: {position.nodes:,} moves made vs {plain_nodes:,} "
+              f"({plain_nodes / position.nodes:.1f}x fewer), {plain_time / hashed_time:.1f}x faster, "
+              f"{table.hits:,}/{table.probes:,} table hits")
+
+
+def benchmark_search(depth=5, time_limit=120.0, workers=(1, 2, 4)):
+    workers = sorted({count for count in workers if count <= max(2, os.cpu_count() or 1)})
+    elapsed = {}
+    for count in workers:
+        nodes = total = 0.0
+        with SearchEngine(workers=count) as engine:
+            for name, fen in SEARCH_POSITIONS:
+                result = engine.search(BitboardPosition(fen), depth, time_limit)
+                assert result.depth == depth, f"{name}: reached depth {result.depth} of {depth} in {time_limit}s"
+                nodes += result.nodes
+                total += result.elapsed
+                if count == workers[0]:
+                    print(f"Search {name} depth {depth}: {move_to_uci(result.move)} score {result.score} "
+                          f"({result.nodes:,} nodes, {result.elapsed:.2f}s)")
+        elapsed[count] = total
+        speedup = elapsed[workers[0]] / total
+        print(f"Search with {count} worker(s): {nodes / total:,.0f} nodes/s, {speedup:.2f}x speedup "
+              f"({speedup / count:.2f} per core, {os.cpu_count()} cores available)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    test_special_moves()
+    test_engine_round_trip()
+    test_search_timeout()
+    benchmark_perft()
+    benchmark_transposition_table()
+    benchmark_search()
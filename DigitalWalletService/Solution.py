@@ -1,83 +1,827 @@
 from enum import Enum
+import gc
+import itertools
+import math
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
 import uuid
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import numpy as np
+
 
 class Currency(Enum):
+    # New members go at the end: log records store a currency by its position here
     USD = "USD"
     EUR = "EUR"
     JPY = "JPY"
+    GBP = "GBP"
+    CHF = "CHF"
+    CAD = "CAD"
+    AUD = "AUD"
+    CNY = "CNY"
+    INR = "INR"
+
+
+MINOR_UNITS = {currency: 2 for currency in Currency}  # digits after the decimal point
+MINOR_UNITS[Currency.JPY] = 0
+MINOR_SCALE = {currency: 10 ** digits for currency, digits in MINOR_UNITS.items()}
+CURRENCIES = list(Currency)
+CURRENCY_CODES = {currency: code for code, currency in enumerate(CURRENCIES)}
 
 
 class PaymentMethod:
+    __slots__ = ("method_id", "method_type")
+
     def __init__(self, method_id, method_type):
         self.method_id = method_id
         self.method_type = method_type
 
 
 class CreditCard(PaymentMethod):
+    __slots__ = ("expiry_date",)
+
     def __init__(self, card_number, expiry_date):
         super().__init__(card_number, "CreditCard")
         self.expiry_date = expiry_date
 
 
 class BankAccount(PaymentMethod):
+    __slots__ = ("bank_name",)
+
     def __init__(self, account_number, bank_name):
         super().__init__(account_number, "BankAccount")
         self.bank_name = bank_name
 
 
+PAYMENT_METHOD_TYPES = {"CreditCard": CreditCard, "BankAccount": BankAccount}
+
+
+# Global index of payment methods keyed by (method_type, method_id). Most methods belong to one user,
+# so the owner is stored directly and only upgraded to a set once a second user adds the same method.
+class PaymentMethodRegistry:
+    def __init__(self):
+        self.owners = {}  # (method_type, method_id) -> user_id or set of user_ids
+        self.type_counts = {}  # method_type -> number of distinct methods
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.owners)
+
+    def add(self, user_id, method):
+        with self._lock:
+            self._add(user_id, (method.method_type, method.method_id))
+
+    def remove(self, user_id, method):
+        with self._lock:
+            self._remove(user_id, (method.method_type, method.method_id))
+
+    def users_for_method(self, method_id, method_type=None):
+        types = [method_type] if method_type is not None else list(self.type_counts)
+        users = set()
+        for candidate in types:
+            owners = self.owners.get((candidate, method_id))
+            if isinstance(owners, set):
+                users |= owners
+            elif owners is not None:
+                users.add(owners)
+        return users
+
+    def shared_methods(self):
+        return {key: set(owners) for key, owners in self.owners.items() if isinstance(owners, set)}
+
+    def bulk_import(self, rows, users=None):
+        # rows: iterable of (user_id, method_type, method_id, detail), where detail is the card expiry date
+        # or the bank name. Methods are attached to users[user_id] when a user map is given.
+        created = 0
+        collecting = gc.isenabled()
+        gc.disable()  # millions of new container objects would otherwise trigger repeated full collections
+        try:
+            with self._lock:
+                for user_id, method_type, method_id, detail in rows:
+                    method = PAYMENT_METHOD_TYPES[method_type](method_id, detail)
+                    key = (method_type, method_id)
+                    if users is not None:
+                        users[user_id]._attach(key, method)
+                    self._add(user_id, key)
+                    created += 1
+        finally:
+            if collecting:
+                gc.enable()
+        return created
+
+    def _add(self, user_id, key):
+        owners = self.owners.get(key)
+        if owners is None:
+            self.owners[key] = user_id
+            self.type_counts[key[0]] = self.type_counts.get(key[0], 0) + 1
+        elif isinstance(owners, set):
+            owners.add(user_id)
+        elif owners != user_id:
+            self.owners[key] = {owners, user_id}
+
+    def _remove(self, user_id, key):
+        owners = self.owners.get(key)
+        if owners is None:
+            return
+        if isinstance(owners, set):
+            owners.discard(user_id)
+            if len(owners) == 1:
+                self.owners[key] = next(iter(owners))
+        elif owners == user_id:
+            del self.owners[key]
+            self.type_counts[key[0]] -= 1
+
+
 class Transaction:
-    def __init__(self, sender_id, receiver_id, amount, currency, txn_type):
-        self.id = str(uuid.uuid4())
-        self.timestamp = datetime.now()
+    __slots__ = ("id", "created_at", "sender_id", "receiver_id", "amount", "currency", "txn_type",
+                 "converted_amount", "to_currency")
+    _ids = itertools.count(1)
+
+    def __init__(self, sender_id, receiver_id, amount, currency, txn_type, created_at=None,
+                 converted_amount=None, to_currency=None):
+        self.id = next(Transaction._ids)
+        self.created_at = time.time() if created_at is None else created_at
         self.sender_id = sender_id
         self.receiver_id = receiver_id
         self.amount = amount
         self.currency = currency
         self.txn_type = txn_type  # e.g. "transfer", "deposit", "conversion"
+        self.converted_amount = converted_amount  # conversions only
+        self.to_currency = to_currency
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.created_at)
 
     def __str__(self):
         return f"[{self.timestamp}] {self.txn_type.upper()} {self.amount} {self.currency.name} from {self.sender_id} to {self.receiver_id}"
 
 
+class LedgerPartition:
+    def __init__(self, capacity=1024):
+        self.lock = threading.Lock()
+        self.size = 0
+        self.balances = {currency: array("q", bytes(8 * capacity)) for currency in Currency}  # minor units
+
+    def add_slot(self):
+        slot = self.size
+        self.size += 1
+        if slot == len(self.balances[Currency.USD]):
+            for column in self.balances.values():
+                column.extend(array("q", bytes(8 * len(column))))
+        return slot
+
+
+# Balances are integer minor units held in per-currency arrays, with users spread across partitions.
+# Every operation locks the partitions it touches in index order, so transfers between partitions
+# cannot deadlock, and transfers within different partitions never contend.
+class LedgerEngine:
+    def __init__(self, partitions=16):
+        self.partitions = [LedgerPartition() for _ in range(partitions)]
+        self.locations = {}  # user_id -> (partition index, slot)
+        self._open_lock = threading.Lock()
+        self.wal = None  # WriteAheadLog that successful operations are appended to while still locked
+        self.statements = {}  # user_id -> Statement that recorded operations are appended to while still locked
+
+    def account_number(self, user_id):
+        # Accounts are dealt round-robin, so creation order is recoverable from (partition, slot)
+        index, slot = self.locations[user_id]
+        return slot * len(self.partitions) + index
+
+    @staticmethod
+    def to_minor(currency, amount):
+        return round(amount * MINOR_SCALE[currency])
+
+    @staticmethod
+    def from_minor(currency, amount):
+        return amount / MINOR_SCALE[currency]
+
+    @classmethod
+    def _minor_amount(cls, currency, amount):
+        # None for a non-zero amount below one minor unit, which would be reported while moving nothing
+        minor = cls.to_minor(currency, amount)
+        return None if amount and not minor else minor
+
+    def open_account(self, user_id):
+        with self._open_lock:
+            if user_id not in self.locations:
+                index = len(self.locations) % len(self.partitions)
+                partition = self.partitions[index]
+                with partition.lock:
+                    self.locations[user_id] = (index, partition.add_slot())
+            return self.locations[user_id]
+
+    def get_balance(self, user_id, currency):
+        index, slot = self.locations[user_id]
+        return self.from_minor(currency, self.partitions[index].balances[currency][slot])
+
+    def get_minor_balance(self, user_id, currency):
+        index, slot = self.locations[user_id]
+        return self.partitions[index].balances[currency][slot]
+
+    def get_balances(self, user_id):
+        index, slot = self.locations[user_id]
+        balances = self.partitions[index].balances
+        return {currency: self.from_minor(currency, balances[currency][slot]) for currency in Currency}
+
+    # With txn (or record for transfers) the operation is also appended to the statements involved,
+    # under the same locks, with the balances it left behind and the amounts as actually booked, in
+    # whole minor units. Amounts too small to move a single minor unit are refused.
+
+    def deposit(self, user_id, currency, amount, txn=None):
+        index, slot = self.locations[user_id]
+        partition = self.partitions[index]
+        minor = self._minor_amount(currency, amount)
+        if minor is None:
+            return False
+        with partition.lock:
+            column = partition.balances[currency]
+            column[slot] += minor
+            sequence = self._log(WriteAheadLog.DEPOSIT, currency, currency, user_id, user_id, minor, 0)
+            if txn is not None:
+                txn.amount = self.from_minor(currency, minor)
+                self._record(txn, (user_id, column[slot], 0))
+        self._wait(sequence)
+        return True
+
+    def withdraw(self, user_id, currency, amount, txn=None):
+        index, slot = self.locations[user_id]
+        partition = self.partitions[index]
+        minor = self._minor_amount(currency, amount)
+        if minor is None:
+            return False
+        with partition.lock:
+            column = partition.balances[currency]
+            if column[slot] < minor:
+                return False
+            column[slot] -= minor
+            sequence = self._log(WriteAheadLog.WITHDRAWAL, currency, currency, user_id, user_id, minor, 0)
+            if txn is not None:
+                txn.amount = self.from_minor(currency, minor)
+                self._record(txn, (user_id, column[slot], 0))
+        self._wait(sequence)
+        return True
+
+    def convert(self, user_id, from_currency, amount, to_currency, converted, txn=None):
+        index, slot = self.locations[user_id]
+        partition = self.partitions[index]
+        debit, credit = self._minor_amount(from_currency, amount), self._minor_amount(to_currency, converted)
+        if debit is None or credit is None:
+            return False
+        with partition.lock:
+            source, target = partition.balances[from_currency], partition.balances[to_currency]
+            if source[slot] < debit:
+                return False
+            source[slot] -= debit
+            target[slot] += credit
+            sequence = self._log(WriteAheadLog.CONVERSION, from_currency, to_currency, user_id, user_id, debit, credit)
+            if txn is not None:
+                txn.amount = self.from_minor(from_currency, debit)
+                txn.converted_amount = self.from_minor(to_currency, credit)
+                self._record(txn, (user_id, source[slot], target[slot]))
+        self._wait(sequence)
+        return True
+
+    def transfer(self, sender_id, receiver_id, amount, currency, record=False):
+        return self.transfer_many([(sender_id, receiver_id, amount, currency)], record)[0]
+
+    def transfer_many(self, transfers, record=False):
+        # Each transfer is atomic. Transfers are grouped by the pair of partitions they touch and every
+        # group is applied in input order under a single acquisition of its locks. Zero amounts go
+        # through, as they always have in transfer_funds; negative amounts and amounts below one minor
+        # unit are refused.
+        results = [False] * len(transfers)
+        groups = {}
+        partitions, locations = self.partitions, self.locations
+        for position, (sender_id, receiver_id, amount, currency) in enumerate(transfers):
+            (sender_index, sender_slot), (receiver_index, receiver_slot) = locations[sender_id], locations[receiver_id]
+            key = (sender_index, receiver_index) if sender_index <= receiver_index else (receiver_index, sender_index)
+            groups.setdefault(key, []).append((position, partitions[sender_index].balances[currency], sender_slot,
+                                               partitions[receiver_index].balances[currency], receiver_slot,
+                                               self._minor_amount(currency, amount)))
+
+        sequence = 0
+        for (low, high), group in groups.items():
+            locks = [partitions[low].lock] if low == high else [partitions[low].lock, partitions[high].lock]
+            for lock in locks:
+                lock.acquire()
+            try:
+                for position, source, sender_slot, target, receiver_slot, minor in group:
+                    if minor is not None and 0 <= minor <= source[sender_slot]:
+                        source[sender_slot] -= minor
+                        target[receiver_slot] += minor
+                        results[position] = True
+                        if self.wal is not None or record:
+                            sender_id, receiver_id, amount, currency = transfers[position]
+                        if self.wal is not None:
+                            sequence = self._log(WriteAheadLog.TRANSFER, currency, currency, sender_id, receiver_id,
+                                                 minor, 0)
+                        if record:
+                            txn = Transaction(sender_id, receiver_id, self.from_minor(currency, minor), currency,
+                                              "transfer")
+                            if sender_id == receiver_id:
+                                self._record(txn, (sender_id, source[sender_slot], 0))
+                            else:
+                                self._record(txn, (sender_id, source[sender_slot], 0),
+                                             (receiver_id, target[receiver_slot], 0))
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+        self._wait(sequence)
+        return results
+
+    def _log(self, record_type, currency, to_currency, user_id, counterparty_id, amount, amount_to):
+        if self.wal is None:
+            return 0
+        return self.wal.append(WriteAheadLog.RECORD.pack(
+            record_type, CURRENCY_CODES[currency], CURRENCY_CODES[to_currency], self.account_number(user_id),
+            self.account_number(counterparty_id), amount, amount_to))
+
+    def _record(self, txn, *entries):
+        # entries: (user_id, balance after, converted balance after) in minor units. The timestamp is
+        # taken here, under the partition locks, so each statement receives entries in time order.
+        txn.created_at = time.time()
+        for user_id, balance, converted in entries:
+            statement = self.statements.get(user_id)
+            if statement is not None:
+                statement.append(txn, balance, converted)
+
+    def _wait(self, sequence):
+        if sequence:
+            self.wal.wait(sequence)
+
+    def freeze(self):
+        # Locks every partition in index order, giving a consistent cut of all balances
+        self._open_lock.acquire()
+        for partition in self.partitions:
+            partition.lock.acquire()
+
+    def unfreeze(self):
+        for partition in reversed(self.partitions):
+            partition.lock.release()
+        self._open_lock.release()
+
+    def export_balances(self):
+        # Per-currency arrays indexed by account number; call while frozen
+        count, stride = len(self.locations), len(self.partitions)
+        exported = {}
+        for currency in Currency:
+            column = array("q", bytes(8 * count))
+            for index, partition in enumerate(self.partitions):
+                column[index::stride] = partition.balances[currency][:partition.size]
+            exported[currency] = column
+        return exported
+
+    def import_balances(self, balances):
+        stride = len(self.partitions)
+        for currency, column in balances.items():
+            for index, partition in enumerate(self.partitions):
+                partition.balances[currency][:partition.size] = column[index::stride]
+
+
+# Fixed-width log of successful ledger operations. Records are appended to a buffer while the ledger
+# still holds the affected partition locks, so the log order matches the apply order. With group
+# commit a background thread writes and fsyncs whatever has accumulated and wakes every caller whose
+# record made it to disk; otherwise each append is written and fsynced on its own. A failed write
+# or fsync stops the log: waiters for records not yet on disk, and every later append, raise.
+class WriteAheadLog:
+    RECORD = struct.Struct("<BBBxIIqq")  # type, currency, to currency, account, counterparty, amount, amount to
+    DEPOSIT, WITHDRAWAL, TRANSFER, CONVERSION = 1, 2, 3, 4
+
+    def __init__(self, path, group_commit=True):
+        self.path = path
+        self.group_commit = group_commit
+        self.file = open(path, "ab")
+        self.offset = self.file.tell()  # logical end of the log, including records not yet on disk
+        self._buffer = bytearray()
+        self._appended = 0
+        self._durable = 0
+        self._closed = False
+        self._error = None  # why the log stopped accepting records
+        self._lock = threading.Lock()
+        self._pending = threading.Condition(self._lock)
+        self._committed = threading.Condition(self._lock)
+        self._committer = None
+        if group_commit:
+            self._committer = threading.Thread(target=self._commit_loop, daemon=True)
+            self._committer.start()
+
+    def append(self, record):
+        with self._lock:
+            self._check()
+            self._appended += 1
+            self.offset += len(record)
+            if self.group_commit:
+                self._buffer += record
+                self._pending.notify()
+            else:
+                self.file.write(record)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self._durable = self._appended
+            return self._appended
+
+    def wait(self, sequence):
+        with self._lock:
+            while self._durable < sequence:
+                self._check()
+                self._committed.wait()
+
+    def _check(self):
+        if self._error is not None:
+            raise Exception("Write-ahead log failed") from self._error
+
+    def position(self):
+        with self._lock:
+            return self._appended, self.offset
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pending.notify()
+        if self._committer:
+            self._committer.join()
+        self.file.close()
+
+    def _commit_loop(self):
+        while True:
+            with self._lock:
+                while not self._buffer and not self._closed:
+                    self._pending.wait()
+                if not self._buffer:
+                    return
+                batch, self._buffer = self._buffer, bytearray()
+                target = self._appended
+            try:
+                self.file.write(batch)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except Exception as error:
+                with self._lock:
+                    self._error = error
+                    self._committed.notify_all()
+                continue
+            with self._lock:
+                self._durable = target
+                self._committed.notify_all()
+
+    @classmethod
+    def replay(cls, path, offset, balances):
+        # Applies every complete record after offset to per-currency arrays indexed by account number
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as handle:
+            handle.seek(offset)
+            data = handle.read()
+        data = memoryview(data)[:len(data) - len(data) % cls.RECORD.size]
+        columns = [balances[currency] for currency in CURRENCIES]
+        deposit, withdrawal, transfer = cls.DEPOSIT, cls.WITHDRAWAL, cls.TRANSFER
+        count = 0
+        for record_type, code, to_code, account, counterparty, amount, amount_to in cls.RECORD.iter_unpack(data):
+            column = columns[code]
+            if record_type == transfer:
+                column[account] -= amount
+                column[counterparty] += amount
+            elif record_type == deposit:
+                column[account] += amount
+            elif record_type == withdrawal:
+                column[account] -= amount
+            else:
+                column[account] -= amount
+                columns[to_code][account] += amount_to
+            count += 1
+        return count
+
+
+class StatementPage:
+    __slots__ = ("lines", "next_cursor")
+
+    def __init__(self, lines, next_cursor):
+        self.lines = lines
+        self.next_cursor = next_cursor  # None once the requested range is exhausted
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+
+# Per-wallet statement. Each appended transaction stores the owner's ledger balance right after it
+# (in minor units), so formatting any page needs only the entries on that page. Entries are appended
+# in time order, which lets time ranges be located by bisecting the timestamps. Formatted pages are
+# cached; pages that reached the end of the statement are dropped when a new entry arrives.
+class Statement:
+    def __init__(self, owner_id, max_cached_pages=256):
+        self.owner_id = owner_id
+        self.entries = []
+        self.timestamps = array("d")
+        self.balances_after = array("q")  # balance of entry.currency after the entry
+        self.converted_after = array("q")  # balance of entry.to_currency after a conversion
+        self.max_cached_pages = max_cached_pages
+        self._pages = {}  # (first, last) -> formatted lines
+        self._open_pages = []  # cached pages that end at the current end of the statement
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, txn, balance_after, converted_after=0):
+        # Balances are in minor units, as read from the ledger
+        with self._lock:
+            timestamps = self.timestamps
+            timestamps.append(max(txn.created_at, timestamps[-1]) if timestamps else txn.created_at)
+            self.balances_after.append(balance_after)
+            self.converted_after.append(converted_after)
+            self.entries.append(txn)
+            for key in self._open_pages:
+                self._pages.pop(key, None)
+            self._open_pages.clear()
+
+    def page(self, cursor=None, limit=None, start=None, end=None):
+        count = len(self.entries)
+        if cursor is not None:
+            first = cursor
+        elif start is not None:
+            first = bisect_left(self.timestamps, start.timestamp(), 0, count)
+        else:
+            first = 0
+        stop = bisect_left(self.timestamps, end.timestamp(), 0, count) if end is not None else count
+        last = max(first, min(stop, first + limit) if limit else stop)
+        key = (first, last)
+        lines = self._pages.get(key)
+        if lines is None:
+            lines = [self.format_entry(position) for position in range(first, last)]
+            with self._lock:
+                if len(self._pages) >= self.max_cached_pages:
+                    self._pages.pop(next(iter(self._pages)))
+                self._pages[key] = lines
+                if last == len(self.entries):
+                    self._open_pages.append(key)
+        return StatementPage(lines, last if last < stop else None)
+
+    def format_entry(self, position):
+        txn = self.entries[position]
+        balance = LedgerEngine.from_minor(txn.currency, self.balances_after[position])
+        line = f"{txn} | balance {balance} {txn.currency.name}"
+        if txn.txn_type == "conversion":
+            converted = LedgerEngine.from_minor(txn.to_currency, self.converted_after[position])
+            line += f", {converted} {txn.to_currency.name}"
+        return line
+
+
 class Wallet:
-    def __init__(self):
-        self.balances = {currency: 0.0 for currency in Currency}
-        self.transactions = []
+    def __init__(self, ledger=None, owner_id=None):
+        self.ledger = ledger if ledger is not None else LedgerEngine(partitions=1)
+        self.owner_id = owner_id if owner_id is not None else str(uuid.uuid4())
+        self.ledger.open_account(self.owner_id)
+        self.statement = Statement(self.owner_id)
+        self.ledger.statements[self.owner_id] = self.statement
+
+    @property
+    def transactions(self):
+        return self.statement.entries
+
+    @property
+    def balances(self):
+        return self.ledger.get_balances(self.owner_id)
 
     def add_balance(self, currency, amount):
-        self.balances[currency] += amount
+        self.ledger.deposit(self.owner_id, currency, amount)
 
     def deduct_balance(self, currency, amount):
-        if self.balances[currency] >= amount:
-            self.balances[currency] -= amount
-            return True
-        return False
+        return self.ledger.withdraw(self.owner_id, currency, amount)
 
     def get_balance(self, currency):
-        return self.balances[currency]
+        return self.ledger.get_balance(self.owner_id, currency)
 
     def record_transaction(self, txn):
-        self.transactions.append(txn)
+        ledger = self.ledger
+        converted = ledger.get_minor_balance(self.owner_id, txn.to_currency) if txn.to_currency else 0
+        self.statement.append(txn, ledger.get_minor_balance(self.owner_id, txn.currency), converted)
+
+    def get_statement(self, cursor=None, limit=None, start=None, end=None):
+        return self.statement.page(cursor, limit, start, end).lines
 
-    def get_statement(self):
-        return [str(txn) for txn in self.transactions]
+    def get_statement_page(self, cursor=None, limit=50, start=None, end=None):
+        return self.statement.page(cursor, limit, start, end)
 
 
 class User:
-    def __init__(self, name, email):
-        self.id = str(uuid.uuid4())
+    def __init__(self, name, email, ledger=None, user_id=None, registry=None):
+        self.id = user_id if user_id is not None else str(uuid.uuid4())
         self.name = name
         self.email = email
-        self.wallet = Wallet()
+        self.wallet = Wallet(ledger, self.id)
         self.payment_methods = []
+        self.payment_method_index = {}  # (method_type, method_id) -> PaymentMethod
+        self._positions = {}  # (method_type, method_id) -> position in payment_methods
+        self._method_types = {}  # method_type -> number of this user's methods of that type
+        self.registry = registry
 
     def add_payment_method(self, method):
-        self.payment_methods.append(method)
+        self._attach((method.method_type, method.method_id), method)
+        if self.registry is not None:
+            self.registry.add(self.id, method)
+
+    def remove_payment_method(self, method_id, method_type=None):
+        # Without a type, every type this user holds methods of is tried, built-in or not
+        types = [method_type] if method_type is not None else list(self._method_types)
+        removed = []
+        for candidate in types:
+            key = (candidate, method_id)
+            method = self.payment_method_index.pop(key, None)
+            if method is not None:
+                self._detach(key)
+                removed.append(method)
+                if self.registry is not None:
+                    self.registry.remove(self.id, method)
+        return removed
+
+    def _attach(self, key, method):
+        # Re-adding a method replaces it, so the list never holds two entries for the same key
+        self.payment_method_index[key] = method
+        position = self._positions.get(key)
+        if position is None:
+            self._positions[key] = len(self.payment_methods)
+            self.payment_methods.append(method)
+            self._method_types[key[0]] = self._method_types.get(key[0], 0) + 1
+        else:
+            self.payment_methods[position] = method
+
+    def _detach(self, key):
+        # The last method moves into the freed position, so removal is O(1) but reorders the list
+        position = self._positions.pop(key)
+        last = self.payment_methods.pop()
+        if position < len(self.payment_methods):
+            self.payment_methods[position] = last
+            self._positions[(last.method_type, last.method_id)] = position
+        count = self._method_types[key[0]] - 1
+        if count:
+            self._method_types[key[0]] = count
+        else:
+            del self._method_types[key[0]]
+
 
-    def remove_payment_method(self, method_id):
-        self.payment_methods = [m for m in self.payment_methods if m.method_id != method_id]
+# Best conversion rates over walks of at most max_hops edges, kept as min-plus layers of -log(rate):
+# layer k holds the cheapest cost from every currency to every other using at most k conversions.
+# Lowering one edge relaxes all layers in O(hops^2 * n^2). Raising or removing an edge only marks the
+# source rows whose best walk used it, and those rows are recomputed on their next lookup.
+# Rates must be free of arbitrage within max_hops, so the best walk is always a simple path; rate sets
+# and updates that would open a profitable cycle are rejected.
+class ExchangeRateGraph:
+    def __init__(self, max_hops=3):
+        self.max_hops = max_hops
+        self.codes = []
+        self.index = {}  # currency code -> position
+        self.weights = np.zeros((0, 0))  # -log(direct rate), inf where there is no direct rate
+        self.layers = [np.zeros((0, 0)) for _ in range(max_hops + 1)]
+        self.dirty_rows = set()
+
+    @staticmethod
+    def code(currency):
+        return currency.value if isinstance(currency, Currency) else currency
+
+    def add_currency(self, currency):
+        code = self.code(currency)
+        if code in self.index:
+            return self.index[code]
+        position = self.index[code] = len(self.codes)
+        self.codes.append(code)
+        self.weights = self._grow(self.weights)
+        self.layers = [self._grow(layer) for layer in self.layers]
+        return position
+
+    def set_rate(self, from_currency, to_currency, rate):
+        if rate is not None and rate <= 0:
+            raise ValueError("Exchange rates must be positive")
+        source, target = self.add_currency(from_currency), self.add_currency(to_currency)
+        if source == target:
+            return
+        old = self.weights[source, target]
+        new = math.inf if rate is None else -math.log(rate)
+        if new < old:
+            self._refresh_rows((target,))
+            if self.layers[self.max_hops - 1][target, source] + new < -1e-12:
+                raise ValueError(f"Rate {self.codes[source]}->{self.codes[target]} would create an arbitrage cycle")
+        self.weights[source, target] = new
+        if new < old:
+            self._relax_edge(source, target, new)
+        elif new > old:
+            self._invalidate_edge(source, target, old)
+
+    def load_rates(self, rates):
+        # Bulk load of {(from, to): rate} followed by one full rebuild
+        for (from_currency, to_currency), rate in rates.items():
+            source, target = self.add_currency(from_currency), self.add_currency(to_currency)
+            if source != target:
+                self.weights[source, target] = -math.log(rate)
+        self.rebuild()
+
+    def remove_rate(self, from_currency, to_currency):
+        self.set_rate(from_currency, to_currency, None)
+
+    def best_rate(self, from_currency, to_currency):
+        source, target = self.index.get(self.code(from_currency)), self.index.get(self.code(to_currency))
+        if source is None or target is None:
+            return None
+        self._refresh_rows((source,))
+        cost = self.layers[self.max_hops][source, target]
+        return None if math.isinf(cost) else math.exp(-cost)
+
+    def best_rates(self, from_positions, to_positions):
+        self._refresh_rows(np.unique(from_positions).tolist())
+        return np.exp(-self.layers[self.max_hops][from_positions, to_positions])
+
+    def best_path(self, from_currency, to_currency):
+        source, target = self.index[self.code(from_currency)], self.index[self.code(to_currency)]
+        self._refresh_rows((source,))
+        layers = self.layers
+        if math.isinf(layers[self.max_hops][source, target]):
+            return None
+        path, current, hops = [target], target, self.max_hops
+        while current != source:
+            while hops > 1 and layers[hops - 1][source, current] <= layers[hops][source, current]:
+                hops -= 1
+            current = int(np.argmin(layers[hops - 1][source] + self.weights[:, current]))
+            path.append(current)
+            hops -= 1
+        return [self.codes[position] for position in reversed(path)]
+
+    def rebuild(self):
+        n = len(self.codes)
+        previous = np.full((n, n), math.inf)
+        np.fill_diagonal(previous, 0.0)
+        self.layers = [previous]
+        for _ in range(self.max_hops):
+            layer = previous.copy()
+            for via in range(n):
+                np.minimum(layer, previous[:, via, None] + self.weights[via], out=layer)
+            if np.any(np.diagonal(layer) < -1e-12):
+                raise ValueError("Exchange rates contain an arbitrage cycle")
+            np.fill_diagonal(layer, 0.0)
+            self.layers.append(layer)
+            previous = layer
+        self.dirty_rows.clear()
+
+    def _relax_edge(self, source, target, cost):
+        layers = self.layers
+        for hops in range(1, self.max_hops + 1):
+            layer = layers[hops]
+            for before in range(hops):
+                via = layers[before][:, source, None] + cost + layers[hops - 1 - before][target]
+                np.minimum(layer, via, out=layer)
+            np.fill_diagonal(layer, 0.0)
+
+    def _invalidate_edge(self, source, target, old_cost):
+        if math.isinf(old_cost):
+            return
+        layers = self.layers
+        affected = np.zeros(len(self.codes), dtype=bool)
+        for hops in range(1, self.max_hops + 1):
+            for before in range(hops):
+                via = layers[before][:, source, None] + old_cost + layers[hops - 1 - before][target]
+                affected |= (np.isclose(via, layers[hops], rtol=1e-12, atol=1e-12) & np.isfinite(via)).any(axis=1)
+        self.dirty_rows.update(np.flatnonzero(affected).tolist())
+
+    def _refresh_rows(self, rows):
+        for row in rows:
+            if row not in self.dirty_rows:
+                continue
+            previous = np.full(len(self.codes), math.inf)
+            previous[row] = 0.0
+            for hops in range(1, self.max_hops + 1):
+                current = np.minimum(previous, (previous[:, None] + self.weights).min(axis=0))
+                current[row] = 0.0
+                self.layers[hops][row] = current
+                previous = current
+            self.dirty_rows.discard(row)
+
+    @staticmethod
+    def _grow(matrix):
+        n = len(matrix)
+        grown = np.full((n + 1, n + 1), math.inf)
+        grown[:n, :n] = matrix
+        grown[n, n] = 0.0
+        return grown
+
+
+# Lets a method be called on an instance or, as the baseline static CurrencyConverter.convert was,
+# on the class itself, in which case it runs against a shared converter built from the class rates.
+class _SharedInstanceMethod:
+    def __init__(self, function):
+        self.function = function
+
+    def __get__(self, instance, owner):
+        return self.function.__get__(instance if instance is not None else owner.shared(), owner)
 
 
 class CurrencyConverter:
@@ -85,56 +829,461 @@ class CurrencyConverter:
         (Currency.USD, Currency.EUR): 0.9,
         (Currency.EUR, Currency.USD): 1.1,
         (Currency.USD, Currency.JPY): 150,
-        (Currency.JPY, Currency.USD): 0.0067,
+        (Currency.JPY, Currency.USD): 0.0066,
         (Currency.EUR, Currency.JPY): 165,
         (Currency.JPY, Currency.EUR): 0.006,
+        (Currency.USD, Currency.GBP): 0.79,
+        (Currency.GBP, Currency.USD): 1.25,
+        (Currency.USD, Currency.CHF): 0.88,
+        (Currency.CHF, Currency.USD): 1.12,
+        (Currency.USD, Currency.CAD): 1.36,
+        (Currency.CAD, Currency.USD): 0.728,
+        (Currency.USD, Currency.AUD): 1.52,
+        (Currency.AUD, Currency.USD): 0.651,
+        (Currency.USD, Currency.CNY): 7.2,
+        (Currency.CNY, Currency.USD): 0.1375,
+        (Currency.USD, Currency.INR): 83,
+        (Currency.INR, Currency.USD): 0.0119,
     }
+    _shared = None
+    _shared_lock = threading.Lock()
 
-    @staticmethod
-    def convert(amount, from_currency, to_currency):
+    def __init__(self, exchange_rates=None, max_hops=3):
+        self.graph = ExchangeRateGraph(max_hops)
+        for currency in Currency:
+            self.graph.add_currency(currency)
+        self.graph.load_rates(CurrencyConverter.exchange_rates if exchange_rates is None else exchange_rates)
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def update_rate(self, from_currency, to_currency, rate):
+        self.graph.set_rate(from_currency, to_currency, rate)
+
+    def get_rate(self, from_currency, to_currency):
+        if from_currency == to_currency:
+            return 1.0
+        return self.graph.best_rate(from_currency, to_currency)
+
+    @_SharedInstanceMethod
+    def convert(self, amount, from_currency, to_currency):
         if from_currency == to_currency:
             return amount
-        rate = CurrencyConverter.exchange_rates.get((from_currency, to_currency))
+        rate = self.get_rate(from_currency, to_currency)
         if not rate:
             raise Exception("Unsupported currency conversion")
         return round(amount * rate, 2)
 
+    def convert_many(self, amounts, from_currencies, to_currencies):
+        # Currencies may be single values or arrays matching amounts; results are rounded to 2 places
+        amounts = np.asarray(amounts, dtype=float)
+        try:
+            sources, targets = self._positions(from_currencies), self._positions(to_currencies)
+        except KeyError:
+            raise Exception("Unsupported currency conversion")
+        rates = self.graph.best_rates(sources, targets)
+        if np.any(rates == 0):
+            raise Exception("Unsupported currency conversion")
+        return np.round(amounts * rates, 2)
+
+    def _positions(self, currencies):
+        index, code = self.graph.index, self.graph.code
+        if isinstance(currencies, (str, Currency)):
+            return index[code(currencies)]
+        if not (isinstance(currencies, np.ndarray) and currencies.dtype.kind == "U"):
+            currencies = np.array([code(c) for c in currencies])
+        distinct, inverse = np.unique(currencies, return_inverse=True)
+        return np.array([index[str(c)] for c in distinct], dtype=np.intp)[inverse]
+
 
 class WalletSystem:
-    def __init__(self):
+    USER_HEADER = struct.Struct("<HHH")
+    SNAPSHOT_HEADER = struct.Struct("<4sIQI")  # magic, version, log offset, account count
+    SNAPSHOT_MAGIC = b"WSNP"
+
+    def __init__(self, partitions=16, directory=None, group_commit=True):
         self.users = {}
+        self.ledger = LedgerEngine(partitions)
+        self.converter = CurrencyConverter()
+        self.payment_methods = PaymentMethodRegistry()
+        self.directory = directory
+        self.wal = None
+        self._user_log = None
+        self._create_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.recover()
+            self._user_log = open(os.path.join(directory, "users.log"), "ab")
+            self.wal = self.ledger.wal = WriteAheadLog(os.path.join(directory, "wal.log"), group_commit)
 
     def create_user(self, name, email):
-        user = User(name, email)
-        self.users[user.id] = user
+        with self._create_lock:
+            user_id = str(uuid.uuid4())
+            if self._user_log:
+                # Account numbers follow creation order, which is the order of this log. The record is
+                # durable before the account opens, so no logged operation can name a user recovery
+                # would not know; a record that fails to reach disk is cut off again.
+                fields = [user_id.encode(), name.encode(), email.encode()]
+                start = self._user_log.tell()
+                try:
+                    self._user_log.write(self.USER_HEADER.pack(*map(len, fields)) + b"".join(fields))
+                    self._user_log.flush()
+                    os.fsync(self._user_log.fileno())
+                except BaseException:
+                    self._user_log.truncate(start)
+                    raise
+            user = User(name, email, self.ledger, user_id, self.payment_methods)
+            self.users[user.id] = user
         return user
 
+    def snapshot(self):
+        # Captures balances and the matching log offset under a consistent cut, then writes them atomically
+        if self.wal is None:
+            raise Exception("Snapshots need a wallet directory")
+        self.ledger.freeze()
+        try:
+            balances = self.ledger.export_balances()
+            sequence, offset = self.wal.position()
+            count = len(self.ledger.locations)
+        finally:
+            self.ledger.unfreeze()
+        self.wal.wait(sequence)
+        path = os.path.join(self.directory, "snapshot.bin")
+        with tempfile.NamedTemporaryFile("wb", dir=self.directory, delete=False) as handle:
+            handle.write(self.SNAPSHOT_HEADER.pack(self.SNAPSHOT_MAGIC, 1, offset, count))
+            for currency in CURRENCIES:
+                handle.write(balances[currency].tobytes())
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(handle.name, path)
+        return offset
+
+    def recover(self):
+        # Rebuilds users from users.log, loads the last snapshot and replays the log tail after it. A
+        # record torn by a crash is cut off both logs, so new records are appended after whole ones.
+        users_path = os.path.join(self.directory, "users.log")
+        if os.path.exists(users_path):
+            with open(users_path, "rb") as handle:
+                data = handle.read()
+            position = end = 0  # end of the last whole user record
+            while position + self.USER_HEADER.size <= len(data):
+                lengths = self.USER_HEADER.unpack_from(data, position)
+                position += self.USER_HEADER.size
+                if position + sum(lengths) > len(data):
+                    break
+                fields = []
+                for length in lengths:
+                    fields.append(data[position:position + length].decode())
+                    position += length
+                user = User(fields[1], fields[2], self.ledger, fields[0], self.payment_methods)
+                self.users[user.id] = user
+                end = position
+            self._truncate(users_path, end)
+
+        count = len(self.users)
+        balances = {currency: array("q", bytes(8 * count)) for currency in CURRENCIES}
+        offset = 0
+        snapshot_path = os.path.join(self.directory, "snapshot.bin")
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "rb") as handle:
+                magic, _, offset, snapshot_count = self.SNAPSHOT_HEADER.unpack(handle.read(self.SNAPSHOT_HEADER.size))
+                if magic != self.SNAPSHOT_MAGIC:
+                    raise Exception("Corrupt wallet snapshot")
+                for currency in CURRENCIES:
+                    column = handle.read(8 * snapshot_count)
+                    if not column:
+                        break  # written before this currency existed
+                    balances[currency][:snapshot_count] = array("q", column)
+        wal_path = os.path.join(self.directory, "wal.log")
+        replayed = WriteAheadLog.replay(wal_path, offset, balances)
+        self._truncate(wal_path, offset + replayed * WriteAheadLog.RECORD.size)
+        self.ledger.import_balances(balances)
+        return replayed
+
+    @staticmethod
+    def _truncate(path, end):
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            with open(path, "r+b") as handle:
+                handle.truncate(end)
+                os.fsync(handle.fileno())
+
+    def close(self):
+        if self.wal:
+            self.wal.close()
+        if self._user_log:
+            self._user_log.close()
+
+    def import_payment_methods(self, rows):
+        return self.payment_methods.bulk_import(rows, self.users)
+
+    def find_users_by_payment_method(self, method_id, method_type=None):
+        return [self.users[user_id] for user_id in self.payment_methods.users_for_method(method_id, method_type)]
+
     def transfer_funds(self, sender_id, receiver_id, amount, currency):
-        sender = self.users[sender_id]
-        receiver = self.users[receiver_id]
-        if sender.wallet.deduct_balance(currency, amount):
-            receiver.wallet.add_balance(currency, amount)
-            txn = Transaction(sender_id, receiver_id, amount, currency, "transfer")
-            sender.wallet.record_transaction(txn)
-            receiver.wallet.record_transaction(txn)
-            return True
-        return False
+        if sender_id not in self.users or receiver_id not in self.users:
+            raise KeyError(sender_id if sender_id not in self.users else receiver_id)
+        return self.ledger.transfer(sender_id, receiver_id, amount, currency, record=True)
+
+    def transfer_many(self, transfers):
+        # transfers: iterable of (sender_id, receiver_id, amount, currency); returns a success flag per transfer
+        return self.ledger.transfer_many(list(transfers), record=True)
 
     def deposit_funds(self, user_id, amount, currency):
-        user = self.users[user_id]
-        user.wallet.add_balance(currency, amount)
+        if user_id not in self.users:
+            raise KeyError(user_id)
         txn = Transaction("external", user_id, amount, currency, "deposit")
-        user.wallet.record_transaction(txn)
+        return self.ledger.deposit(user_id, currency, amount, txn)
 
     def convert_currency(self, user_id, amount, from_currency, to_currency):
-        user = self.users[user_id]
-        if user.wallet.deduct_balance(from_currency, amount):
-            converted = CurrencyConverter.convert(amount, from_currency, to_currency)
-            user.wallet.add_balance(to_currency, converted)
-            txn = Transaction(user_id, user_id, amount, from_currency, "conversion")
-            user.wallet.record_transaction(txn)
-            return True
-        return False
-
-    def get_user_statement(self, user_id):
-        return self.users[user_id].wallet.get_statement()
+        if user_id not in self.users:
+            raise KeyError(user_id)
+        converted = self.converter.convert(amount, from_currency, to_currency)
+        txn = Transaction(user_id, user_id, amount, from_currency, "conversion",
+                          converted_amount=converted, to_currency=to_currency)
+        return self.ledger.convert(user_id, from_currency, amount, to_currency, converted, txn)
+
+    def get_user_statement(self, user_id, cursor=None, limit=None, start=None, end=None):
+        return self.users[user_id].wallet.get_statement(cursor, limit, start, end)
+
+    def get_user_statement_page(self, user_id, cursor=None, limit=50, start=None, end=None):
+        return self.users[user_id].wallet.get_statement_page(cursor, limit, start, end)
+
+
+# Tests
+
+def test_torn_log_recovery():
+    # Crash mid-record, recover, keep going, then recover again: nothing committed may be lost
+    with tempfile.TemporaryDirectory() as directory:
+        system = WalletSystem(directory=directory, group_commit=False)
+        alice, bob = system.create_user("alice", "a@example.com").id, system.create_user("bob", "b@example.com").id
+        system.deposit_funds(alice, 100.0, Currency.USD)
+        system.transfer_funds(alice, bob, 10.0, Currency.USD)
+        system.close()
+        for name, torn in (("wal.log", WriteAheadLog.RECORD.size // 2), ("users.log", 5)):
+            with open(os.path.join(directory, name), "ab") as handle:
+                handle.write(b"\xff" * torn)
+
+        system = WalletSystem(directory=directory, group_commit=False)
+        assert system.ledger.get_balance(bob, Currency.USD) == 10.0
+        carol = system.create_user("carol", "c@example.com").id
+        system.transfer_funds(alice, carol, 25.0, Currency.USD)
+        system.snapshot()
+        system.transfer_funds(bob, carol, 5.0, Currency.USD)
+        system.close()
+
+        system = WalletSystem(directory=directory, group_commit=False)
+        balances = [system.ledger.get_balance(user_id, Currency.USD) for user_id in (alice, bob, carol)]
+        system.close()
+        assert balances == [65.0, 5.0, 30.0], balances
+    try:
+        WalletSystem().snapshot()
+    except Exception as error:
+        assert "directory" in str(error)
+    else:
+        raise AssertionError("snapshot without a directory should fail")
+
+
+# Benchmarks
+
+def test_wal_commit_failure():
+    # A commit that cannot reach disk must fail its waiters rather than leave them blocked
+    with tempfile.TemporaryDirectory() as directory:
+        log = WriteAheadLog(os.path.join(directory, "wal.log"))
+        log.file.close()
+        sequence = log.append(WriteAheadLog.RECORD.pack(WriteAheadLog.DEPOSIT, 0, 0, 0, 0, 100, 0))
+        for call in (lambda: log.wait(sequence), lambda: log.append(b"")):
+            try:
+                call()
+            except Exception as error:
+                assert str(error) == "Write-ahead log failed"
+            else:
+                raise AssertionError("failed commit went unreported")
+        log.close()
+
+
+def test_sub_minor_amounts():
+    # Amounts that round to no minor units are refused; everything else is booked and reported rounded
+    system = WalletSystem()
+    alice, bob = system.create_user("Alice", "alice@example.com"), system.create_user("Bob", "bob@example.com")
+    assert not system.deposit_funds(alice.id, 0.001, Currency.USD)
+    assert system.deposit_funds(alice.id, 10, Currency.USD)
+    assert system.transfer_many([(alice.id, bob.id, 0.004, Currency.USD), (alice.id, bob.id, 1.234, Currency.USD)]) == [False, True]
+    assert not system.convert_currency(alice.id, 0.001, Currency.USD, Currency.EUR)
+    statement = system.get_user_statement(alice.id)
+    assert len(statement) == 2 and "TRANSFER 1.23 USD" in statement[-1]
+    assert alice.wallet.get_balance(Currency.USD) == 8.77 and bob.wallet.get_balance(Currency.USD) == 1.23
+
+
+def benchmark_transfers(num_users=10000, num_transfers=200000, batch_size=5000, workers=4, seed=7):
+    rng = random.Random(seed)
+    system = WalletSystem()
+    user_ids = [system.create_user(f"user{i}", f"user{i}@example.com").id for i in range(num_users)]
+    for user_id in user_ids:
+        system.deposit_funds(user_id, 1000.0, Currency.USD)
+    transfers = [(rng.choice(user_ids), rng.choice(user_ids), round(rng.uniform(0.01, 20.0), 2), Currency.USD)
+                 for _ in range(num_transfers)]
+
+    start = time.perf_counter()
+    for sender_id, receiver_id, amount, currency in transfers[:num_transfers // 4]:
+        system.transfer_funds(sender_id, receiver_id, amount, currency)
+    single = (num_transfers // 4) / (time.perf_counter() - start)
+
+    batches = [transfers[i:i + batch_size] for i in range(0, num_transfers, batch_size)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        applied = sum(sum(results) for results in executor.map(system.transfer_many, batches))
+    batched = num_transfers / (time.perf_counter() - start)
+
+    total = sum(system.ledger.get_balance(user_id, Currency.USD) for user_id in user_ids)
+    assert round(total, 2) == 1000.0 * num_users, "money was created or destroyed"
+    print(f"Transfers: {single:,.0f}/s one at a time, {batched:,.0f}/s via transfer_many "
+          f"({applied} applied on {workers} threads), total balance conserved")
+    return single, batched
+
+
+def benchmark_durable_transfers(num_users=1000, num_transfers=20000, workers=16, seed=7):
+    rng = random.Random(seed)
+    results = {}
+    for group_commit, transfers in ((False, num_transfers // 10), (True, num_transfers)):
+        with tempfile.TemporaryDirectory() as directory:
+            system = WalletSystem(directory=directory, group_commit=group_commit)
+            user_ids = [system.create_user(f"user{i}", f"user{i}@example.com").id for i in range(num_users)]
+            for user_id in user_ids:
+                system.ledger.deposit(user_id, Currency.USD, 1000.0)
+            pairs = [(rng.choice(user_ids), rng.choice(user_ids)) for _ in range(transfers)]
+
+            def worker(chunk):
+                for sender_id, receiver_id in chunk:
+                    system.ledger.transfer(sender_id, receiver_id, 1.0, Currency.USD)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(worker, [pairs[i::workers] for i in range(workers)]))
+            results[group_commit] = transfers / (time.perf_counter() - start)
+            system.close()
+    print(f"Durable transfers on {workers} threads: {results[False]:,.0f}/s with fsync per transaction, "
+          f"{results[True]:,.0f}/s with group commit")
+    return results
+
+
+def benchmark_cold_start(num_users=100000, num_records=10000000, chunk=100000):
+    with tempfile.TemporaryDirectory() as directory:
+        system = WalletSystem(directory=directory)
+        for i in range(num_users):
+            system.create_user(f"user{i}", f"user{i}@example.com")
+        system.close()
+        record = WriteAheadLog.RECORD
+        usd = CURRENCY_CODES[Currency.USD]
+        block = b"".join(record.pack(WriteAheadLog.DEPOSIT, usd, usd, i % num_users, i % num_users, 100, 0)
+                         if i < num_users else
+                         record.pack(WriteAheadLog.TRANSFER, usd, usd, i % num_users, (i * 7919) % num_users, 1, 0)
+                         for i in range(chunk))
+        with open(os.path.join(directory, "wal.log"), "ab") as handle:
+            for _ in range(num_records // chunk):
+                handle.write(block)
+
+        start = time.perf_counter()
+        recovered = WalletSystem(directory=directory)
+        elapsed = time.perf_counter() - start
+        recovered.close()
+    print(f"Cold start: {num_users} users and {num_records:,} log records recovered in {elapsed:.2f}s")
+    return elapsed
+
+
+def benchmark_currency_conversion(num_currencies=300, edges_per_currency=12, num_amounts=1000000, seed=7):
+    rng = random.Random(seed)
+    codes = [f"C{i:03d}" for i in range(num_currencies)]
+    value = {code: rng.uniform(0.01, 100.0) for code in codes}  # value in a common unit, so no arbitrage
+    rates = {}
+    for code in codes:
+        for other in rng.sample(codes, edges_per_currency):
+            if other != code:
+                rates[(code, other)] = value[code] / value[other] * rng.uniform(0.97, 0.999)
+
+    converter = CurrencyConverter({}, max_hops=4)
+    start = time.perf_counter()
+    converter.graph.load_rates(rates)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    updates = 200
+    for _ in range(updates):
+        (source, target), rate = rng.choice(list(rates.items()))
+        converter.update_rate(source, target, rate * rng.uniform(0.98, 1.02))
+        converter.get_rate(rng.choice(codes), rng.choice(codes))
+    update = (time.perf_counter() - start) / updates
+
+    sources = np.array([rng.choice(codes) for _ in range(1000)] * (num_amounts // 1000))
+    amounts = np.random.default_rng(seed).uniform(1.0, 1000.0, len(sources))
+    start = time.perf_counter()
+    converter.convert_many(amounts, sources, "C000")
+    many = time.perf_counter() - start
+    print(f"Currency graph: {num_currencies} currencies, {len(rates)} rates built in {build:.3f}s, "
+          f"{update * 1000:.2f}ms per rate update + lookup, {len(amounts):,} amounts converted in {many:.3f}s")
+    return build, update, many
+
+
+def benchmark_statement_pages(num_transactions=1000000, page_size=50, pages=1000, seed=7):
+    rng = random.Random(seed)
+    system = WalletSystem()
+    user, other = system.create_user("heavy", "heavy@example.com"), system.create_user("other", "o@example.com")
+    system.deposit_funds(user.id, 10.0 * num_transactions, Currency.USD)
+    system.transfer_many((user.id, other.id, 1.0, Currency.USD) for _ in range(num_transactions))
+
+    start = time.perf_counter()
+    for _ in range(pages):
+        page = system.get_user_statement_page(user.id, rng.randrange(num_transactions), page_size)
+        system.deposit_funds(user.id, 1.0, Currency.USD)
+    elapsed = (time.perf_counter() - start) / pages
+    cutoff = datetime.fromtimestamp(user.wallet.statement.timestamps[num_transactions // 2])
+    start = time.perf_counter()
+    page = system.get_user_statement_page(user.id, start=cutoff, limit=page_size)
+    ranged = time.perf_counter() - start
+    print(f"Statements: {num_transactions:,} entries, {elapsed * 1e6:.0f}us per random {page_size}-line page, "
+          f"{ranged * 1e6:.0f}us for a time-range page (next cursor {page.next_cursor})")
+    return elapsed
+
+
+def benchmark_payment_method_import(num_users=100000, num_methods=1000000, seed=7):
+    import tracemalloc
+
+    rng = random.Random(seed)
+    system = WalletSystem()
+    user_ids = [system.create_user(f"user{i}", f"user{i}@example.com").id for i in range(num_users)]
+    rows = [(rng.choice(user_ids), "CreditCard", f"4{rng.randrange(10 ** 6):015d}", "12/30") if i % 2 else
+            (rng.choice(user_ids), "BankAccount", f"{i:012d}", "Bank") for i in range(num_methods)]
+
+    start = time.perf_counter()
+    system.import_payment_methods(rows)
+    elapsed = time.perf_counter() - start
+
+    users = {user_id: User("", "", user_id=user_id) for user_id in user_ids}
+    tracemalloc.start()
+    registry = PaymentMethodRegistry()
+    registry.bulk_import(rows, users)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    shared = sum(len(system.payment_methods.users_for_method(row[2])) > 1 for row in rows[:100000])
+    lookup = (time.perf_counter() - start) / 100000
+    print(f"Payment methods: {num_methods:,} imported in {elapsed:.2f}s ({num_methods / elapsed:,.0f}/s), "
+          f"{retained / num_methods:.0f} B/method, {lookup * 1e6:.2f}us per reverse lookup, "
+          f"{shared} of the first 100,000 shared")
+    return elapsed
+
+
+if __name__ == "__main__":
+    test_torn_log_recovery()
+    test_wal_commit_failure()
+    test_sub_minor_amounts()
+    benchmark_transfers()
+    benchmark_statement_pages()
+    benchmark_payment_method_import()
+    benchmark_currency_conversion()
+    benchmark_durable_transfers()
+    benchmark_cold_start()
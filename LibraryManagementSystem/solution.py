@@ -1,5 +1,15 @@
 from datetime import datetime, timedelta
+import itertools
+import random
+import re
+import sys
+import threading
+import time
 import uuid
+from array import array
+from collections import deque
+from bisect import bisect_left, bisect_right, insort
+from heapq import heapify, heappop, heappush
 
 
 class Book:
@@ -20,11 +30,17 @@ class Member:
         self.id = str(uuid.uuid4())
         self.name = name
         self.contact_info = contact_info
-        self.borrowed_books = []  # list of Loan objects
+        self.active_loans = {}  # book_id -> Loan, returned loans live in the LoanArchive
+        self.held_titles = set()  # isbns this member is queued for
+        self.lock = threading.Lock()
+
+    @property
+    def borrowed_books(self):
+        return list(self.active_loans.values())
 
     def has_overdue_books(self):
         now = datetime.now()
-        return any(loan.return_date is None and loan.due_date < now for loan in self.borrowed_books)
+        return any(loan.due_date < now for loan in self.active_loans.values())
 
 
 class Loan:
@@ -40,28 +56,383 @@ class Loan:
         self.return_date = datetime.now()
 
 
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+# token -> set of document numbers. Tokens are also kept in a sorted vocabulary for prefix lookups,
+# updated by bisection as tokens gain their first document or lose their last, so a prefix query is
+# O(log V + matching tokens).
+class InvertedIndex:
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+
+    def add(self, doc, tokens):
+        for token in tokens:
+            docs = self.postings.get(token)
+            if docs is None:
+                docs = self.postings[token] = set()
+                insort(self.vocabulary, token)
+            docs.add(doc)
+
+    def remove(self, doc, tokens):
+        for token in tokens:
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.discard(doc)
+                if not docs:
+                    del self.postings[token]
+                    del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def lookup(self, token):
+        return self.postings.get(token, set())
+
+    def lookup_prefix(self, prefix):
+        # Every token with the prefix counts; callers cap the number of results, not tokens
+        vocabulary = self.vocabulary
+        docs = set()
+        for position in range(bisect_left(vocabulary, prefix), len(vocabulary)):
+            token = vocabulary[position]
+            if not token.startswith(prefix):
+                break
+            docs |= self.postings[token]
+        return docs
+
+
+# ISBN hash index, inverted indexes over title and author tokens, and a sorted year index. Books
+# get an integer document number so the postings hold small ints rather than uuid strings.
+class CatalogIndex:
+    def __init__(self):
+        self.books = []  # document number -> Book, None once removed
+        self.doc_numbers = {}  # book_id -> document number
+        self.by_isbn = {}  # isbn -> set of document numbers
+        self.titles = InvertedIndex()
+        self.authors = InvertedIndex()
+        self.years = []  # sorted distinct publication years
+        self.by_year = {}  # year -> set of document numbers
+
+    def __len__(self):
+        return len(self.doc_numbers)
+
+    def add(self, book):
+        doc = self.doc_numbers.get(book.id)
+        if doc is None:
+            doc = self.doc_numbers[book.id] = len(self.books)
+            self.books.append(book)
+        self.by_isbn.setdefault(book.isbn, set()).add(doc)
+        self.titles.add(doc, set(tokenize(book.title)))
+        self.authors.add(doc, set(tokenize(book.author)))
+        docs = self.by_year.get(book.publication_year)
+        if docs is None:
+            docs = self.by_year[book.publication_year] = set()
+            insort(self.years, book.publication_year)
+        docs.add(doc)
+
+    def remove(self, book):
+        doc = self.doc_numbers.pop(book.id, None)
+        if doc is None:
+            return
+        self._unindex(doc, book)
+        self.books[doc] = None
+
+    def reindex(self, book, old_values):
+        # old_values holds the indexed fields as they were before an update
+        doc = self.doc_numbers.get(book.id)
+        if doc is None:
+            return
+        self._unindex(doc, _IndexedFields(**old_values))
+        self.add(book)
+
+    def find_by_isbn(self, isbn):
+        return self._books(self.by_isbn.get(isbn, ()))
+
+    def find_by_year_range(self, start_year, end_year, limit=None):
+        docs = []
+        for year in self.years[bisect_left(self.years, start_year):bisect_right(self.years, end_year)]:
+            docs.extend(self.by_year[year])
+            if limit and len(docs) >= limit:
+                break
+        return self._books(docs, limit)
+
+    def search(self, query, field=None, prefix=True, limit=None):
+        # Every query token must match the title or author (or only `field`); the last token also
+        # matches as a prefix when `prefix` is set.
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        indexes = [self.titles, self.authors] if field is None else [self.titles if field == "title" else self.authors]
+        candidates = []
+        for position, token in enumerate(tokens):
+            as_prefix = prefix and position == len(tokens) - 1
+            docs = set()
+            for index in indexes:
+                docs |= index.lookup_prefix(token) if as_prefix else index.lookup(token)
+            if not docs:
+                return []
+            candidates.append(docs)
+        candidates.sort(key=len)
+        result = candidates[0].intersection(*candidates[1:]) if len(candidates) > 1 else candidates[0]
+        return self._books(result, limit)
+
+    def _unindex(self, doc, fields):
+        docs = self.by_isbn.get(fields.isbn)
+        if docs is not None:
+            docs.discard(doc)
+            if not docs:
+                del self.by_isbn[fields.isbn]
+        self.titles.remove(doc, set(tokenize(fields.title)))
+        self.authors.remove(doc, set(tokenize(fields.author)))
+        docs = self.by_year.get(fields.publication_year)
+        if docs is not None:
+            docs.discard(doc)
+            if not docs:
+                del self.by_year[fields.publication_year]
+                self.years.pop(bisect_left(self.years, fields.publication_year))
+
+    def _books(self, docs, limit=None):
+        books = []
+        for doc in docs:
+            books.append(self.books[doc])
+            if limit and len(books) >= limit:
+                break
+        return books
+
+
+class _IndexedFields:
+    def __init__(self, title, author, isbn, publication_year):
+        self.title = title
+        self.author = author
+        self.isbn = isbn
+        self.publication_year = publication_year
+
+
+# Min-heap of (due_date, seq, loan) over active loans. Returned loans are removed lazily: they are
+# skipped when they reach the top and the heap is compacted once they make up half of it. Loans
+# that a sweep has found overdue move out of the heap into `overdue` until they are returned.
+# Loans are scheduled from several title locks at once, so the heap has its own lock.
+class LoanScheduler:
+    COMPACT_MIN_STALE = 1024
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._stale = 0
+        self.overdue = {}  # loan_id -> Loan
+        self.last_sweep = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap) - self._stale + len(self.overdue)
+
+    def schedule(self, loan):
+        with self._lock:
+            heappush(self._heap, (loan.due_date, next(self._seq), loan))
+
+    def discard(self, loan):
+        with self._lock:
+            if self.overdue.pop(loan.id, None) is not None:
+                return
+            self._stale += 1
+            if self._stale >= self.COMPACT_MIN_STALE and self._stale * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if entry[2].return_date is None]
+                heapify(self._heap)
+                self._stale = 0
+
+    def overdue_as_of(self, as_of=None):
+        as_of = as_of or datetime.now()
+        with self._lock:
+            loans = [loan for loan in self.overdue.values() if loan.due_date < as_of]
+            # Walk only the part of the heap with due_date < as_of: a child is never due before its parent.
+            heap = self._heap
+            stack = [0]
+            while stack:
+                i = stack.pop()
+                if i >= len(heap) or heap[i][0] >= as_of:
+                    continue
+                loan = heap[i][2]
+                if loan.return_date is None:
+                    loans.append(loan)
+                stack.append(2 * i + 1)
+                stack.append(2 * i + 2)
+        return loans
+
+    def next_due(self, n):
+        # Best-first walk of the heap, touching O(n) entries plus the returned ones in between.
+        with self._lock:
+            heap = self._heap
+            loans = []
+            frontier = [(heap[0][0], heap[0][1], 0)] if heap else []
+            while frontier and len(loans) < n:
+                _, _, i = heappop(frontier)
+                loan = heap[i][2]
+                if loan.return_date is None:
+                    loans.append(loan)
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heappush(frontier, (heap[child][0], heap[child][1], child))
+        return loans
+
+    def sweep(self, now=None, notify=None, batch_size=1000):
+        # Moves loans that came due before `now` into `overdue` and hands them to `notify` in batches,
+        # outside the lock so slow notification doesn't hold up circulation.
+        now = now or datetime.now()
+        swept = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] < now:
+                loan = heappop(heap)[2]
+                if loan.return_date is not None:
+                    self._stale -= 1
+                    continue
+                self.overdue[loan.id] = loan
+                swept.append(loan)
+            self.last_sweep = now
+        if notify is not None:
+            for i in range(0, len(swept), batch_size):
+                notify(swept[i:i + batch_size])
+        return len(swept)
+
+
+class ArchivedLoan:
+    __slots__ = ("loan_id", "book_id", "member_id", "borrow_date", "due_date", "return_date")
+
+    def __init__(self, loan_id, book_id, member_id, borrow_date, due_date, return_date):
+        self.loan_id = loan_id
+        self.book_id = book_id
+        self.member_id = member_id
+        self.borrow_date = borrow_date
+        self.due_date = due_date
+        self.return_date = return_date
+
+
+# Column store for returned loans, appended in return order. Member and book ids are interned to
+# ints, loan ids are kept as 16 raw uuid bytes and dates as POSIX timestamps. A per-member array of
+# row numbers makes history lookups independent of the size of the archive, and because rows are
+# appended in return order, a date range is a bisect over that member's return timestamps.
+class LoanArchive:
+    def __init__(self):
+        self.loan_ids = bytearray()
+        self.members = array("I")
+        self.books = array("I")
+        self.borrowed_at = array("d")
+        self.due_at = array("d")
+        self.returned_at = array("d")
+        self.member_ids = []
+        self.book_ids = []
+        self._member_numbers = {}
+        self._book_numbers = {}
+        self._member_rows = {}  # member number -> array of row numbers
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.returned_at)
+
+    def append(self, loan):
+        # Rows must stay in return-time order for the range queries, but concurrent returns can reach
+        # here out of order, so the return time is clamped to the last one archived and written back.
+        with self._lock:
+            returned = loan.return_date.timestamp()
+            if self.returned_at and returned < self.returned_at[-1]:
+                returned = self.returned_at[-1]
+                loan.return_date = datetime.fromtimestamp(returned)
+            member = self._intern(loan.member.id, self._member_numbers, self.member_ids)
+            row = len(self.returned_at)
+            self.loan_ids += uuid.UUID(loan.id).bytes
+            self.members.append(member)
+            self.books.append(self._intern(loan.book.id, self._book_numbers, self.book_ids))
+            self.borrowed_at.append(loan.borrow_date.timestamp())
+            self.due_at.append(loan.due_date.timestamp())
+            self.returned_at.append(returned)
+            rows = self._member_rows.get(member)
+            if rows is None:
+                rows = self._member_rows[member] = array("I")
+            rows.append(row)
+
+    def member_history(self, member_id, start=None, end=None):
+        with self._lock:
+            member = self._member_numbers.get(member_id)
+            if member is None:
+                return []
+            rows = self._member_rows[member]
+            returned_at = self.returned_at
+            lo = 0 if start is None else bisect_left(rows, start.timestamp(), key=returned_at.__getitem__)
+            hi = len(rows) if end is None else bisect_right(rows, end.timestamp(), key=returned_at.__getitem__)
+            return [self._record(row) for row in rows[lo:hi]]
+
+    def returned_between(self, start, end):
+        with self._lock:
+            lo = bisect_left(self.returned_at, start.timestamp())
+            hi = bisect_right(self.returned_at, end.timestamp())
+            return [self._record(row) for row in range(lo, hi)]
+
+    def nbytes(self):
+        columns = (self.members, self.books, self.borrowed_at, self.due_at, self.returned_at)
+        return len(self.loan_ids) + sum(column.itemsize * len(column) for column in columns) + \
+            sum(rows.itemsize * len(rows) for rows in self._member_rows.values())
+
+    def _record(self, row):
+        return ArchivedLoan(str(uuid.UUID(bytes=bytes(self.loan_ids[row * 16:row * 16 + 16]))),
+                            self.book_ids[self.books[row]], self.member_ids[self.members[row]],
+                            datetime.fromtimestamp(self.borrowed_at[row]), datetime.fromtimestamp(self.due_at[row]),
+                            datetime.fromtimestamp(self.returned_at[row]))
+
+    @staticmethod
+    def _intern(key, numbers, keys):
+        number = numbers.get(key)
+        if number is None:
+            number = numbers[key] = len(keys)
+            keys.append(key)
+        return number
+
+
 class Librarian:
     def __init__(self, name):
         self.name = name
 
+    INDEXED_FIELDS = ("title", "author", "isbn", "publication_year")
+
     def add_book(self, system, title, author, isbn, year):
         book = Book(title, author, isbn, year)
         system.books[book.id] = book
+        system.catalog.add(book)
+        system.shelve_book(book)
         return book
 
     def remove_book(self, system, book_id):
-        if book_id in system.books and system.books[book_id].is_available:
-            del system.books[book_id]
-            return True
-        return False
+        book = system.books.get(book_id)
+        if not book:
+            return False
+        with system.title_lock(book.isbn):
+            if not book.is_available:
+                return False
+            system.available_copies[book.isbn].discard(book_id)
+            system.catalog.remove(system.books.pop(book_id))
+        return True
 
     def update_book(self, system, book_id, **kwargs):
         book = system.books.get(book_id)
         if not book:
             return False
+        old_values = {field: getattr(book, field) for field in self.INDEXED_FIELDS}
+        moving = "isbn" in kwargs and kwargs["isbn"] != book.isbn
+        if moving:
+            # Take a shelved copy off its old title before it moves to the new one.
+            with system.title_lock(book.isbn):
+                shelved = book.is_available
+                if shelved:
+                    system.available_copies[book.isbn].discard(book_id)
+                    book.is_available = False
         for key, value in kwargs.items():
             if hasattr(book, key):
                 setattr(book, key, value)
+        if any(getattr(book, field) != old_values[field] for field in self.INDEXED_FIELDS):
+            system.catalog.reindex(book, old_values)
+        if moving and shelved:
+            system.shelve_book(book)
         return True
 
 
@@ -72,7 +443,21 @@ class LibrarySystem:
     def __init__(self):
         self.books = {}     # book_id -> Book
         self.members = {}   # member_id -> Member
-        self.loans = {}     # loan_id -> Loan
+        self.loans = {}     # loan_id -> Loan, active loans only
+        self.active_loans = {}  # book_id -> Loan
+        self.loan_archive = LoanArchive()
+        self.catalog = CatalogIndex()
+        self.loan_scheduler = LoanScheduler()
+        self.available_copies = {}  # isbn -> set of book ids on the shelf
+        self.holds = {}  # isbn -> deque of member ids, oldest first
+        self._title_locks = {}  # isbn -> Lock
+
+    def title_lock(self, isbn):
+        # Locks are taken title first, then member, so a borrow and a hold assignment can't deadlock.
+        lock = self._title_locks.get(isbn)
+        if lock is None:
+            lock = self._title_locks.setdefault(isbn, threading.Lock())
+        return lock
 
     def register_member(self, name, contact_info):
         member = Member(name, contact_info)
@@ -83,17 +468,56 @@ class LibrarySystem:
         member = self.members.get(member_id)
         book = self.books.get(book_id)
 
-        if not member or not book or not book.is_available:
+        if not member or not book:
             return None
 
-        if len([l for l in member.borrowed_books if l.return_date is None]) >= self.MAX_BORROW_LIMIT:
+        with self.title_lock(book.isbn), member.lock:
+            if not book.is_available or len(member.active_loans) >= self.MAX_BORROW_LIMIT:
+                return None
+            return self._lend(member, book)
+
+    def borrow_title(self, member_id, isbn, hold=True):
+        # Lends any shelved copy of the title; with none left, queues a hold and returns None.
+        member = self.members.get(member_id)
+        if not member or isbn not in self.available_copies:
             return None
 
-        loan = Loan(book, member, self.LOAN_DURATION_DAYS)
-        member.borrowed_books.append(loan)
-        self.loans[loan.id] = loan
-        book.is_available = False
-        return loan
+        with self.title_lock(isbn), member.lock:
+            if len(member.active_loans) >= self.MAX_BORROW_LIMIT:
+                return None
+            copies = self.available_copies[isbn]
+            if copies:
+                return self._lend(member, self.books[next(iter(copies))])
+            if hold:
+                self._queue_hold(member, isbn)
+            return None
+
+    def place_hold(self, member_id, isbn):
+        # Refused while a copy is on the shelf; borrow it instead.
+        member = self.members.get(member_id)
+        if not member or isbn not in self.available_copies:
+            return False
+        with self.title_lock(isbn):
+            if self.available_copies[isbn]:
+                return False
+            return self._queue_hold(member, isbn)
+
+    def cancel_hold(self, member_id, isbn):
+        member = self.members.get(member_id)
+        with self.title_lock(isbn):
+            if not member or isbn not in member.held_titles:
+                return False
+            self.holds[isbn].remove(member_id)
+            member.held_titles.discard(isbn)
+            return True
+
+    def _queue_hold(self, member, isbn):
+        # Caller holds the title lock.
+        if isbn in member.held_titles:
+            return False
+        self.holds.setdefault(isbn, deque()).append(member.id)
+        member.held_titles.add(isbn)
+        return True
 
     def return_book(self, member_id, book_id):
         member = self.members.get(member_id)
@@ -101,13 +525,298 @@ class LibrarySystem:
         if not member or not book:
             return False
 
-        for loan in member.borrowed_books:
-            if loan.book.id == book_id and loan.return_date is None:
+        with self.title_lock(book.isbn):
+            with member.lock:
+                loan = member.active_loans.pop(book_id, None)
+                if loan is None:
+                    return False
                 loan.mark_returned()
-                book.is_available = True
-                return True
-        return False
+                del self.active_loans[book_id]
+                del self.loans[loan.id]
+            self.loan_scheduler.discard(loan)
+            self.loan_archive.append(loan)
+            self._shelve(book)
+        # The member is below the limit again, so holds skipped earlier may be served from the shelf.
+        for isbn in list(member.held_titles):
+            with self.title_lock(isbn):
+                self._serve_holds(isbn)
+        return True
+
+    def shelve_book(self, book):
+        with self.title_lock(book.isbn):
+            return self._shelve(book)
+
+    def _shelve(self, book):
+        # Puts the copy on the shelf and serves waiting holds; returns the loan if this copy went
+        # straight to a holder. Caller holds the title lock.
+        book.is_available = True
+        self.available_copies.setdefault(book.isbn, set()).add(book.id)
+        return next((loan for loan in self._serve_holds(book.isbn, book) if loan.book is book), None)
+
+    def _serve_holds(self, isbn, preferred=None):
+        # Lends shelved copies to holders oldest first. Holders at the borrow limit are skipped but
+        # keep their place. Caller holds the title lock.
+        queue = self.holds.get(isbn)
+        copies = self.available_copies.get(isbn)
+        loans = []
+        skipped = []
+        while queue and copies:
+            holder = self.members.get(queue.popleft())
+            if holder is None:
+                continue
+            with holder.lock:
+                if len(holder.active_loans) >= self.MAX_BORROW_LIMIT:
+                    skipped.append(holder.id)
+                    continue
+                holder.held_titles.discard(isbn)
+                book = preferred if preferred is not None and preferred.id in copies else self.books[next(iter(copies))]
+                loans.append(self._lend(holder, book))
+        if skipped:
+            queue.extendleft(reversed(skipped))
+        return loans
+
+    def _lend(self, member, book):
+        # Caller holds the title lock and the member's lock. Borrowing a title ends any hold on it.
+        if book.isbn in member.held_titles:
+            member.held_titles.discard(book.isbn)
+            self.holds[book.isbn].remove(member.id)
+        loan = Loan(book, member, self.LOAN_DURATION_DAYS)
+        member.active_loans[book.id] = loan
+        self.active_loans[book.id] = loan
+        self.loans[loan.id] = loan
+        self.available_copies.get(book.isbn, set()).discard(book.id)
+        book.is_available = False
+        self.loan_scheduler.schedule(loan)
+        return loan
 
     def get_borrowed_books(self, member_id):
         member = self.members.get(member_id)
-        return [loan for loan in member.borrowed_books if loan.return_date is None] if member else []
+        return member.borrowed_books if member else []
+
+    def get_loan_history(self, member_id, start=None, end=None):
+        return self.loan_archive.member_history(member_id, start, end)
+
+    def get_overdue_loans(self, as_of=None):
+        return self.loan_scheduler.overdue_as_of(as_of)
+
+    def get_upcoming_due_loans(self, n=10):
+        return self.loan_scheduler.next_due(n)
+
+    def sweep_overdue_loans(self, notify=None, now=None, batch_size=1000):
+        return self.loan_scheduler.sweep(now, notify, batch_size)
+
+    def find_books_by_isbn(self, isbn):
+        return self.catalog.find_by_isbn(isbn)
+
+    def search_books(self, query, field=None, prefix=True, limit=None):
+        return self.catalog.search(query, field, prefix, limit)
+
+    def find_books_by_year_range(self, start_year, end_year, limit=None):
+        return self.catalog.find_by_year_range(start_year, end_year, limit)
+
+
+# Benchmarks
+
+def benchmark_catalog_search(num_books=1000000, queries=1000, seed=7):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(50000)]
+    surnames = [f"author{i}" for i in range(20000)]
+    system = LibrarySystem()
+    librarian = Librarian("bench")
+    start = time.perf_counter()
+    for i in range(num_books):
+        librarian.add_book(system, " ".join(rng.choices(words, k=4)), f"{rng.choice(surnames)} {rng.choice(words)}",
+                           f"978{i:010d}", rng.randint(1800, 2024))
+    build = time.perf_counter() - start
+
+    timings = {}
+    lookups = {
+        "isbn": lambda: system.find_books_by_isbn(f"978{rng.randrange(num_books):010d}"),
+        "title words": lambda: system.search_books(" ".join(rng.choices(words, k=2)), field="title", prefix=False),
+        "author prefix": lambda: system.search_books(rng.choice(surnames)[:9], field="author", limit=100),
+        "year range": lambda: system.find_books_by_year_range(1990, 1995, limit=100),
+    }
+    for name, lookup in lookups.items():
+        start = time.perf_counter()
+        for _ in range(queries):
+            lookup()
+        timings[name] = (time.perf_counter() - start) / queries
+    print(f"Catalog: {num_books:,} books indexed in {build:.1f}s; "
+          + ", ".join(f"{name} {seconds * 1000:.3f}ms" for name, seconds in timings.items()))
+    return timings
+
+
+def benchmark_overdue_sweep(num_loans=1000000, returned_ratio=0.3, seed=7):
+    rng = random.Random(seed)
+    book = Book("Bench", "Bench", "0", 2000)
+    member = Member("Bench", "bench@example.com")
+    scheduler = LoanScheduler()
+    start_date = datetime(2024, 1, 1)
+    loans = []
+    for _ in range(num_loans):
+        loan = Loan(book, member)
+        loan.due_date = start_date + timedelta(minutes=rng.randrange(60 * 24 * 60))
+        scheduler.schedule(loan)
+        loans.append(loan)
+    for loan in rng.sample(loans, int(num_loans * returned_ratio)):
+        loan.mark_returned()
+        scheduler.discard(loan)
+
+    as_of = start_date + timedelta(days=1)
+    start = time.perf_counter()
+    overdue = scheduler.overdue_as_of(as_of)
+    query = time.perf_counter() - start
+    start = time.perf_counter()
+    upcoming = scheduler.next_due(100)
+    upcoming_time = time.perf_counter() - start
+    notified = []
+    start = time.perf_counter()
+    swept = scheduler.sweep(start_date + timedelta(days=30), notified.extend, batch_size=10000)
+    sweep = time.perf_counter() - start
+    print(f"Loan scheduler: {len(scheduler):,} active loans; overdue as of day 1: {len(overdue):,} in {query * 1000:.2f}ms, "
+          f"next 100 due in {upcoming_time * 1000:.2f}ms, swept {swept:,} overdue in {sweep:.2f}s")
+    return swept, sweep
+
+
+def benchmark_circulation_history(history=200000, samples=10000):
+    system = LibrarySystem()
+    librarian = Librarian("bench")
+    member = system.register_member("Bench", "bench@example.com")
+    book = librarian.add_book(system, "Bench", "Bench", "0", 2000)
+
+    def cycle(count):
+        start = time.perf_counter()
+        for _ in range(count):
+            system.borrow_book(member.id, book.id)
+            system.return_book(member.id, book.id)
+        return (time.perf_counter() - start) / count
+
+    fresh = cycle(samples)
+    cycle(history)
+    aged = cycle(samples)
+    start = time.perf_counter()
+    recent = system.get_loan_history(member.id, datetime.now() - timedelta(milliseconds=10))
+    query = time.perf_counter() - start
+    print(f"Circulation: borrow+return {fresh * 1e6:.1f}us fresh, {aged * 1e6:.1f}us after "
+          f"{len(system.loan_archive):,} archived loans ({system.loan_archive.nbytes() / len(system.loan_archive):.0f} B/loan); "
+          f"last-10ms history: {len(recent):,} loans in {query * 1000:.1f}ms")
+    return fresh, aged
+
+
+def stress_test_circulation(num_titles=200, copies=3, num_members=2000, num_threads=8, ops_per_thread=20000, seed=7):
+    system = LibrarySystem()
+    librarian = Librarian("bench")
+    isbns = [f"978{i:010d}" for i in range(num_titles)]
+    for isbn in isbns:
+        for _ in range(copies):
+            librarian.add_book(system, f"Title {isbn}", "Author", isbn, 2000)
+    members = [system.register_member(f"Member {i}", f"m{i}@example.com") for i in range(num_members)]
+    # A few titles are popular so hold queues build up and get served on return.
+    popular = isbns[:max(1, num_titles // 20)]
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        for _ in range(ops_per_thread):
+            member = rng.choice(members)
+            with member.lock:
+                lent = list(member.active_loans)
+            if lent and rng.random() < 0.5:
+                system.return_book(member.id, rng.choice(lent))
+            else:
+                system.borrow_title(member.id, rng.choice(popular) if rng.random() < 0.5 else rng.choice(isbns))
+
+    threads = [threading.Thread(target=worker, args=(seed + i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Every copy's loans, archived and active, must not overlap in time, and each copy is either on
+    # the shelf or out on exactly one loan.
+    archive = system.loan_archive
+    periods = {}
+    for row in range(len(archive)):
+        periods.setdefault(archive.book_ids[archive.books[row]], []).append((archive.borrowed_at[row], archive.returned_at[row]))
+    for book_id, loan in system.active_loans.items():
+        periods.setdefault(book_id, []).append((loan.borrow_date.timestamp(), float("inf")))
+    for book_periods in periods.values():
+        book_periods.sort()
+        for (_, returned), (borrowed, _) in zip(book_periods, book_periods[1:]):
+            assert returned <= borrowed, "copy lent twice"
+    for book in system.books.values():
+        shelved = book.id in system.available_copies[book.isbn]
+        assert shelved == book.is_available == (book.id not in system.active_loans), "copy state out of sync"
+    for member in members:
+        assert len(member.active_loans) <= system.MAX_BORROW_LIMIT, "borrow limit exceeded"
+    for isbn, queue in system.holds.items():
+        assert len(queue) == len(set(queue)) and all(isbn in system.members[m].held_titles for m in queue)
+        if system.available_copies[isbn]:
+            assert all(len(system.members[m].active_loans) == system.MAX_BORROW_LIMIT for m in queue), \
+                "hold left waiting next to a shelved copy"
+    assert sum(len(member.active_loans) for member in members) == len(system.active_loans) == len(system.loans)
+    # Returns archived concurrently must still be found by the time-range queries.
+    assert all(a <= b for a, b in zip(archive.returned_at, archive.returned_at[1:])), "archive out of time order"
+    first = datetime.fromtimestamp(archive.returned_at[0]) - timedelta(seconds=1)
+    last = datetime.fromtimestamp(archive.returned_at[-1]) + timedelta(seconds=1)
+    assert len(archive.returned_between(first, last)) == len(archive), "range query missed returns"
+    for member in members[:100]:
+        rows = archive._member_rows.get(archive._member_numbers.get(member.id), ())
+        assert len(system.get_loan_history(member.id, first, last)) == len(rows), "member history missed returns"
+
+    ops = num_threads * ops_per_thread
+    print(f"Circulation stress: {ops:,} ops on {num_threads} threads in {elapsed:.2f}s ({ops / elapsed:,.0f} ops/s), "
+          f"{len(archive):,} returns, {len(system.active_loans):,} out, "
+          f"{sum(len(queue) for queue in system.holds.values()):,} holds waiting, "
+          f"{sum(len(copies) for copies in system.available_copies.values())} copies shelved; no double lending")
+    return ops / elapsed
+
+
+# Tests
+
+def test_concurrent_returns(num_threads=64, rounds=50):
+    # Each thread returns its own title, so only the archive orders the returns; a row archived out
+    # of time order falls outside the bisected range that should contain it.
+    system = LibrarySystem()
+    librarian = Librarian("test")
+    members = [system.register_member(f"Member {i}", f"m{i}@example.com") for i in range(num_threads)]
+    books = [librarian.add_book(system, f"Title {i}", "Author", f"979{i:010d}", 2000) for i in range(num_threads)]
+    barrier = threading.Barrier(num_threads)
+
+    def worker(member, book):
+        for _ in range(rounds):
+            assert system.borrow_book(member.id, book.id)
+            barrier.wait()
+            assert system.return_book(member.id, book.id)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=pair) for pair in zip(members, books)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    archive = system.loan_archive
+    assert len(archive) == num_threads * rounds
+    for member in members:
+        history = system.get_loan_history(member.id)
+        assert len(history) == rounds
+        for loan in history:
+            assert loan.loan_id in {row.loan_id for row in archive.returned_between(loan.return_date, loan.return_date)}, \
+                "range query missed a return"
+            window = system.get_loan_history(member.id, loan.return_date, loan.return_date)
+            assert loan.loan_id in {row.loan_id for row in window}, "member history missed a return"
+    print(f"Concurrent returns: {len(archive):,} returns on {num_threads} threads, all found by range queries")
+
+
+if __name__ == "__main__":
+    test_concurrent_returns()
+    benchmark_catalog_search()
+    benchmark_overdue_sweep()
+    benchmark_circulation_history()
+    stress_test_circulation()
@@ -1,3 +1,6 @@
+import random
+import threading
+import time
 import uuid
 from datetime import datetime
 from collections import defaultdict
@@ -33,7 +36,7 @@ class MenuItem:
         self.id = str(uuid.uuid4())
         self.name = name
         self.price = price
-        self.ingredients = ingredients  # List of ingredient names
+        self.ingredients = ingredients  # List of ingredient names (one unit each) or {name: units}
 
 
 class InventoryItem:
@@ -47,6 +50,90 @@ class InventoryItem:
         self.quantity -= amount
 
 
+# Each menu item is compiled once into a sparse vector of (stock slot, units) pairs, so an order's
+# demand is the sum of its items' vectors and reserving it touches each ingredient once. Reservations
+# are all-or-nothing: every ingredient is checked before any is deducted, under a single lock.
+class RecipeEngine:
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.slots = {}  # ingredient name -> slot
+        self.stock = []  # InventoryItem per slot
+        self.recipes = {}  # menu item id -> ((slot, units), ...)
+        self.lock = threading.Lock()
+
+    def slot(self, name):
+        # An ingredient that only a recipe names gets an empty stock item of its own, which joins the
+        # inventory when it is first restocked.
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.stock)
+            self.stock.append(self.inventory.get(name) or InventoryItem(name, 0))
+        return slot
+
+    def compile(self, item):
+        ingredients = item.ingredients
+        amounts = list(ingredients.items()) if isinstance(ingredients, dict) else [(name, 1) for name in ingredients]
+        for name, units in amounts:
+            if type(units) is not int or units <= 0:
+                raise Exception(f"Invalid amount of {name} in {item.name}: {units!r}")
+        vector = defaultdict(int)
+        with self.lock:
+            for name, units in amounts:
+                vector[self.slot(name)] += units
+        self.recipes[item.id] = tuple(vector.items())
+
+    def demand(self, items):
+        total = defaultdict(int)
+        for item in items:
+            for slot, units in self.recipes[item.id]:
+                total[slot] += units
+        return total
+
+    def shortages(self, demand):
+        stock = self.stock
+        return [stock[slot].name for slot, units in demand.items() if stock[slot].quantity < units]
+
+    def _deduct(self, demand, sign=1):
+        stock = self.stock
+        for slot, units in demand.items():
+            stock[slot].quantity -= sign * units
+
+    def reserve(self, demand):
+        with self.lock:
+            missing = self.shortages(demand)
+            if missing:
+                raise Exception(f"Not enough {', '.join(missing)} in inventory.")
+            self._deduct(demand)
+
+    def reserve_many(self, demands, atomic=False):
+        # atomic: all of the demands or none of them (a whole table). Otherwise each demand stands
+        # alone and the result flags which ones were reserved (a delivery burst).
+        with self.lock:
+            if atomic:
+                combined = defaultdict(int)
+                for demand in demands:
+                    for slot, units in demand.items():
+                        combined[slot] += units
+                missing = self.shortages(combined)
+                if missing:
+                    raise Exception(f"Not enough {', '.join(missing)} in inventory.")
+                self._deduct(combined)
+                return [True] * len(demands)
+            reserved = []
+            for demand in demands:
+                ok = not self.shortages(demand)
+                if ok:
+                    self._deduct(demand)
+                reserved.append(ok)
+            return reserved
+
+    def restock(self, name, quantity):
+        with self.lock:
+            stock = self.stock[self.slot(name)]
+            stock.quantity += quantity
+            self.inventory.setdefault(name, stock)
+
+
 class Order:
     def __init__(self, customer_id, items):
         self.id = str(uuid.uuid4())
@@ -90,8 +177,11 @@ class RestaurantSystem:
     def __init__(self):
         self.customers = {}
         self.menu = []
+        self.menu_index = {}
         self.inventory = {}
+        self.recipes = RecipeEngine(self.inventory)
         self.orders = []
+        self.orders_by_id = {}
         self.reservations = []
         self.staff_members = []
         self.sales = []
@@ -105,7 +195,9 @@ class RestaurantSystem:
     # ----- Menu Management -----
     def add_menu_item(self, name, price, ingredients):
         item = MenuItem(name, price, ingredients)
+        self.recipes.compile(item)
         self.menu.append(item)
+        self.menu_index[item.id] = item
         return item
 
     def get_menu(self):
@@ -113,27 +205,53 @@ class RestaurantSystem:
 
     # ----- Inventory Management -----
     def add_inventory_item(self, name, quantity):
-        if name in self.inventory:
-            self.inventory[name].quantity += quantity
-        else:
-            self.inventory[name] = InventoryItem(name, quantity)
+        self.recipes.restock(name, quantity)
 
     def check_inventory(self):
         return self.inventory
 
     # ----- Orders -----
     def create_order(self, customer_id, item_ids):
-        items = [item for item in self.menu if item.id in item_ids]
-        for item in items:
-            for ingredient in item.ingredients:
-                self.inventory[ingredient].use(1)  # Simplified consumption logic
+        # Reserves every ingredient the order needs, or none of them.
+        items = self._lookup_items(item_ids)
+        self.recipes.reserve(self.recipes.demand(items))
+        return self._record_order(customer_id, items)
+
+    def create_orders(self, requests, atomic=False):
+        # requests: [(customer_id, item_ids), ...]. With atomic the batch (e.g. one table) is placed
+        # whole or raises; otherwise orders that can't be made come back as None.
+        batch = [(customer_id, self._lookup_items(item_ids)) for customer_id, item_ids in requests]
+        demands = [self.recipes.demand(items) for _, items in batch]
+        reserved = self.recipes.reserve_many(demands, atomic)
+        return [self._record_order(customer_id, items) if ok else None
+                for (customer_id, items), ok in zip(batch, reserved)]
+
+    def cancel_order(self, order_id):
+        # Gives the order's ingredients back to stock.
+        order = self.orders_by_id[order_id]
+        demand = self.recipes.demand(order.items)
+        with self.recipes.lock:
+            if order.status != "pending":
+                raise Exception("Only pending orders can be cancelled.")
+            order.status = "cancelled"
+            self.recipes._deduct(demand, -1)
+        return order
+
+    def _lookup_items(self, item_ids):
+        missing = [item_id for item_id in item_ids if item_id not in self.menu_index]
+        if missing:
+            raise Exception(f"Unknown menu items: {', '.join(missing)}")
+        return [self.menu_index[item_id] for item_id in item_ids]
+
+    def _record_order(self, customer_id, items):
         order = Order(customer_id, items)
         self.orders.append(order)
+        self.orders_by_id[order.id] = order
         return order
 
     # ----- Payment -----
     def process_payment(self, order_id, method):
-        order = next(o for o in self.orders if o.id == order_id)
+        order = self.orders_by_id[order_id]
         if order.status != "prepared":
             raise Exception("Order not ready for payment.")
         payment = Payment(method, order.total)
@@ -157,3 +275,98 @@ class RestaurantSystem:
 
     def generate_inventory_report(self):
         return {name: item.quantity for name, item in self.inventory.items()}
+
+
+# Tests
+
+def test_recipe_validation():
+    system = RestaurantSystem()
+    system.add_inventory_item("egg", 10)
+    for ingredients in ({"egg": -3}, {"egg": 0}, {"egg": 1.5}, {"egg": True}):
+        try:
+            system.add_menu_item("omelette", 8, ingredients)
+        except Exception:
+            pass
+        else:
+            raise AssertionError(f"recipe {ingredients} accepted")
+    assert not system.get_menu()
+    # Ingredients only a recipe names stay out of the inventory until they are stocked.
+    omelette = system.add_menu_item("omelette", 8, {"egg": 3, "chive": 1}).id
+    assert system.generate_inventory_report() == {"egg": 10}
+    try:
+        system.create_order("walk-in", [omelette])
+    except Exception:
+        pass
+    else:
+        raise AssertionError("order placed without chives")
+    system.add_inventory_item("chive", 2)
+    system.create_order("walk-in", [omelette])
+    assert system.generate_inventory_report() == {"egg": 7, "chive": 1}
+    print("Recipe tests passed")
+
+
+# Benchmarks
+
+def stress_test_orders(num_items=200, num_ingredients=60, num_threads=8, submissions_per_thread=3000, seed=7):
+    # Threads place single orders, whole tables and delivery bursts, and cancel some, against stock
+    # that runs out mid-test. Stock must end up exactly initial minus what live orders reserved.
+    rng = random.Random(seed)
+    system = RestaurantSystem()
+    ingredients = [f"ingredient{i}" for i in range(num_ingredients)]
+    for name in ingredients:
+        system.add_inventory_item(name, 20000)
+    initial = system.generate_inventory_report()
+    menu = [system.add_menu_item(f"dish{i}", rng.randint(5, 30),
+                                 {name: rng.randint(1, 3) for name in rng.sample(ingredients, rng.randint(2, 8))}).id
+            for i in range(num_items)]
+    customer = system.register_customer("Walk-in", "n/a").id
+    rejected = [0] * num_threads
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        mine = []
+        for _ in range(submissions_per_thread):
+            roll = rng.random()
+            try:
+                if roll < 0.5:
+                    mine.append(system.create_order(customer, rng.choices(menu, k=rng.randint(1, 5))))
+                elif roll < 0.7:
+                    table = [(customer, rng.choices(menu, k=rng.randint(1, 3))) for _ in range(rng.randint(2, 6))]
+                    mine.extend(system.create_orders(table, atomic=True))
+                elif roll < 0.9:
+                    burst = [(customer, rng.choices(menu, k=rng.randint(1, 3))) for _ in range(20)]
+                    placed = system.create_orders(burst)
+                    mine.extend(order for order in placed if order)
+                    rejected[index] += placed.count(None)
+                elif mine:
+                    system.cancel_order(mine.pop(rng.randrange(len(mine))).id)
+            except Exception:
+                rejected[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    used = defaultdict(int)
+    live = [order for order in system.orders if order.status == "pending"]
+    for order in live:
+        for item in order.items:
+            ingredients = item.ingredients
+            for name, units in (ingredients.items() if isinstance(ingredients, dict) else ((n, 1) for n in ingredients)):
+                used[name] += units
+    report = system.generate_inventory_report()
+    assert all(report[name] == initial[name] - used[name] >= 0 for name in initial), "inventory out of sync"
+    submissions = num_threads * submissions_per_thread
+    print(f"Order stress: {submissions:,} submissions on {num_threads} threads in {elapsed:.2f}s "
+          f"({submissions / elapsed:,.0f}/s); {len(live):,} live orders, {sum(rejected):,} rejected; "
+          f"{sum(1 for n in report if report[n] == 0)} ingredients sold out, stock consistent")
+    return submissions / elapsed
+
+
+if __name__ == "__main__":
+    test_recipe_validation()
+    stress_test_orders()
@@ -1,10 +1,40 @@
+import contextlib
+import io
+import itertools
 import random
-import uuid
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+
+
+EVENT_MESSAGES = {
+    "snake": "🐍 Snake from {start} to {end}",
+    "ladder": "🪜 Ladder from {start} to {end}",
+    "already_won": "🎉 Game already won by {player.name}",
+    "rolled": "{player.name} rolled a 🎲 {roll}",
+    "stayed": "{player.name} stays at {player.position}",
+    "moved": "{player.name} moved to {player.position}",
+    "won": "🎉 {player.name} has won the game!",
+}
+
+
+# Default event sink, printing the same lines the game always has. Any callable taking
+# (event, **fields) can replace it; None skips event reporting entirely.
+def print_event(event, **fields):
+    print(EVENT_MESSAGES[event].format(**fields))
+
+
+_player_ids = itertools.count(1)
+_game_ids = itertools.count(1)
 
 
 class Player:
+    __slots__ = ("id", "name", "position")
+
     def __init__(self, name):
-        self.id = uuid.uuid4()
+        self.id = next(_player_ids)
         self.name = name
         self.position = 1
 
@@ -18,57 +48,538 @@ class Board:
         self.snakes = snakes or {16: 6, 47: 26, 49: 11, 56: 53, 62: 19, 87: 24, 93: 73, 95: 75, 98: 78}
         self.ladders = ladders or {1: 38, 4: 14, 9: 31, 21: 42, 28: 84, 36: 44, 51: 67, 71: 91, 80: 100}
 
-    def get_next_position(self, pos):
+    def get_next_position(self, pos, sink=print_event):
         if pos in self.snakes:
-            print(f"🐍 Snake from {pos} to {self.snakes[pos]}")
+            if sink:
+                sink("snake", start=pos, end=self.snakes[pos])
             return self.snakes[pos]
         elif pos in self.ladders:
-            print(f"🪜 Ladder from {pos} to {self.ladders[pos]}")
+            if sink:
+                sink("ladder", start=pos, end=self.ladders[pos])
             return self.ladders[pos]
         return pos
 
+    def jump_table(self):
+        # table[square] is where a piece landing on `square` ends up; square 0 is unused.
+        table = np.arange(self.size + 1, dtype=np.int32)
+        for jumps in (self.snakes, self.ladders):
+            for start, end in jumps.items():
+                if start <= self.size:
+                    table[start] = end
+        return table
 
+    def fingerprint(self):
+        return self.size, frozenset(self.snakes.items()), frozenset(self.ladders.items())
+
+
+# `on_finish`, if set, is called with the game once it has a winner, however the turn was played.
 class SnakeAndLadderGame:
-    def __init__(self, players, board=None):
+    __slots__ = ("id", "players", "board", "current_turn", "winner", "sink", "on_finish")
+
+    def __init__(self, players, board=None, sink=print_event, on_finish=None):
+        self.id = next(_game_ids)
         self.players = players
         self.board = board or Board()
         self.current_turn = 0
         self.winner = None
+        self.sink = sink
+        self.on_finish = on_finish
 
     def roll_dice(self):
         return random.randint(1, 6)
 
     def play_turn(self):
+        sink = self.sink
         if self.winner:
-            print(f"🎉 Game already won by {self.winner.name}")
+            if sink:
+                sink("already_won", player=self.winner)
             return
 
         player = self.players[self.current_turn]
         roll = self.roll_dice()
-        print(f"{player.name} rolled a 🎲 {roll}")
+        if sink:
+            sink("rolled", player=player, roll=roll)
         new_pos = player.position + roll
         if new_pos > self.board.size:
-            print(f"{player.name} stays at {player.position}")
+            if sink:
+                sink("stayed", player=player)
         else:
-            player.position = self.board.get_next_position(new_pos)
-            print(f"{player.name} moved to {player.position}")
+            player.position = self.board.get_next_position(new_pos, sink)
+            if sink:
+                sink("moved", player=player)
             if player.position == self.board.size:
                 self.winner = player
-                print(f"🎉 {player.name} has won the game!")
+                if sink:
+                    sink("won", player=player)
+                if self.on_finish:
+                    self.on_finish(self)
 
         self.current_turn = (self.current_turn + 1) % len(self.players)
 
 
+class SimulationResult:
+    def __init__(self, num_players, turns, winners):
+        self.num_players = num_players
+        self.turns = turns  # play_turn calls until the game was won, -1 if it hit the turn cap
+        self.winners = winners  # winning seat, -1 if unfinished
+
+    @property
+    def num_games(self):
+        return len(self.turns)
+
+    @property
+    def unfinished(self):
+        return int(np.count_nonzero(self.winners < 0))
+
+    def win_probabilities(self):
+        return np.bincount(self.winners[self.winners >= 0], minlength=self.num_players) / self.num_games
+
+    def length_distribution(self):
+        # distribution[t] is the share of games won on turn t
+        return np.bincount(self.turns[self.turns >= 0]) / self.num_games
+
+    def mean_turns(self):
+        return float(self.turns[self.turns >= 0].mean())
+
+    def percentiles(self, q=(50, 90, 99)):
+        return np.percentile(self.turns[self.turns >= 0], q)
+
+
+# Plays many games at once with the same rules as play_turn: seats move in order, a roll past the
+# last square stays put, one snake or ladder is applied, and the game ends as soon as a seat lands on
+# the last square. Moves are looked up in a flattened (square, roll) -> square table; finished games
+# are dropped from the working arrays once per round.
+class BatchSimulator:
+    def __init__(self, board=None):
+        self.board = board or Board()
+        self.moves = self.move_table(self.board)
+
+    @staticmethod
+    def move_table(board):
+        # moves[square * 7 + roll] is where a piece on `square` ends up after rolling `roll`
+        jumps = board.jump_table()
+        squares = np.arange(board.size + 1)[:, None]
+        landed = squares + np.arange(7)[None, :]
+        moves = np.where(landed > board.size, squares, jumps[np.minimum(landed, board.size)])
+        return moves.astype(np.int32).ravel()
+
+    def run(self, num_players=2, num_games=100000, max_rounds=10000, seed=None):
+        rng = np.random.default_rng(seed)
+        size = self.board.size
+        moves = self.moves
+        turns = np.full(num_games, -1, dtype=np.int64)
+        winners = np.full(num_games, -1, dtype=np.int64)
+        games = np.arange(num_games)
+        positions = np.ones((num_players, num_games), dtype=np.int32)
+
+        for round_number in range(max_rounds):
+            if not games.size:
+                break
+            rolls = rng.integers(1, 7, size=(num_players, games.size), dtype=np.int32)
+            live = np.ones(games.size, dtype=bool)
+            for seat in range(num_players):
+                current = positions[seat]
+                moved = moves[current * 7 + rolls[seat]]
+                won = live & (moved == size)
+                positions[seat] = np.where(live, moved, current)
+                if won.any():
+                    turns[games[won]] = round_number * num_players + seat + 1
+                    winners[games[won]] = seat
+                    live &= ~won
+            if not live.all():
+                games = games[live]
+                positions = positions[:, live]
+        return SimulationResult(num_players, turns, winners)
+
+
+# Exact single-piece analysis of a board as an absorbing Markov chain over squares 1..size, with
+# the last square absorbing. Each square has at most six outgoing moves, so the chain is kept as the
+# simulator's (square, roll) move table rather than a full matrix. Expected turns come from solving
+# (I - Q) x = 1 over squares 1..size-1; squares a piece can never rest on get an identity row.
+# Without snakes and ladders I - Q is upper triangular with a band of six, so the solve is a back
+# substitution plus a Woodbury correction with one column per jump destination. Boards of the same
+# size are analysed in stacks, with reachability and the back substitution vectorised across the
+# stack, which is what makes analysing thousands of candidate boards cheap; a stack of only a few
+# boards, such as a single analyze, goes through dense LAPACK solves instead. Visit counts solve the
+# dense transposed system and the turn distribution pushes probability mass through the move
+# table; both are computed lazily.
+class BoardAnalysis:
+    def __init__(self, board, max_turns=10000, tolerance=1e-12, _solved=None):
+        self.size = board.size
+        self.max_turns = max_turns
+        self.tolerance = tolerance
+        if _solved is None:
+            moves = BatchSimulator.move_table(board).reshape(1, board.size + 1, 7)[:, :, 1:]
+            _solved = [solved[0] for solved in self._solve(moves, board.size)]
+        self.moves, reached, expected = _solved
+        self.states = np.flatnonzero(reached[:self.size])
+        self.expected_turns_from = np.full(self.size + 1, np.nan)
+        self.expected_turns_from[self.size] = 0.0
+        self.expected_turns_from[self.states] = expected[self.states - 1]
+        self.expected_turns = float(self.expected_turns_from[1])
+        self._visit_frequencies = None
+        self._turn_distribution = None
+
+    @classmethod
+    def analyze_many(cls, boards, max_turns=10000, tolerance=1e-12, chunk=512):
+        analyses = [None] * len(boards)
+        by_size = {}
+        for position, board in enumerate(boards):
+            by_size.setdefault(board.size, []).append(position)
+        for size, positions in by_size.items():
+            for first in range(0, len(positions), chunk):
+                group = positions[first:first + chunk]
+                jumps = np.stack([boards[p].jump_table() for p in group])
+                squares = np.arange(size + 1)[:, None]
+                landed = squares + np.arange(1, 7)
+                moves = np.where(landed > size, squares, jumps[:, np.minimum(landed, size)])
+                for p, *solved in zip(group, *cls._solve(moves, size)):
+                    analyses[p] = cls(boards[p], max_turns, tolerance, solved)
+        return analyses
+
+    @staticmethod
+    def _solve(moves, size):
+        # moves: (boards, size + 1, 6). Returns the move tables, the squares a piece can rest on and
+        # the expected turns from squares 1..size-1, one entry per board.
+        count = len(moves)
+        offsets = np.arange(count)[:, None, None] * (size + 1)
+        flat_moves = moves + offsets
+        reached = np.zeros((count, size + 1), dtype=bool)
+        reached[:, 1] = True
+        frontier = reached.copy()
+        while frontier.any():
+            hit = np.zeros_like(reached)
+            hit.ravel()[flat_moves[frontier]] = True
+            frontier = hit & ~reached
+            reached |= frontier
+        # Reachable squares that may still be stuck, shrinking as squares with a finishing move are found
+        finishes = np.zeros((count, size + 1), dtype=bool)
+        finishes[:, size] = True
+        finishes = finishes.ravel()
+        pending = np.flatnonzero(reached.ravel() & ~finishes)
+        flat_moves = flat_moves.reshape(-1, 6)
+        while pending.size:
+            done = finishes[flat_moves[pending]].any(axis=1)
+            if not done.any():
+                raise ValueError("The last square cannot be reached from every square a piece can get to")
+            finishes[pending[done]] = True
+            pending = pending[~done]
+
+        # Square s is row s - 1; reaching the last square drops out of the system.
+        n = size - 1
+        targets = moves[:, 1:size]
+        live = reached[:, 1:size, None]
+        if count < 16:
+            # A handful of boards is cheaper as dense LAPACK solves than as a row-by-row back substitution
+            cells = ((np.arange(count)[:, None, None] * n + np.arange(n)[:, None]) * (n + 1) + targets - 1)[
+                np.broadcast_to(live, targets.shape)]
+            q = np.bincount(cells, minlength=count * n * (n + 1)).reshape(count, n, n + 1)[:, :, :n] / 6
+            systems = np.eye(n) - q
+            unreachable = ~reached[:, 1:size]
+            systems[unreachable] = np.eye(n)[np.nonzero(unreachable)[1]]
+            return moves, reached, np.linalg.solve(systems, np.ones((count, n, 1)))[:, :, 0]
+
+        # Each roll either overshoots and stays (diagonal), lands on a plain square (band) or is
+        # carried by a jump (Woodbury columns).
+        landed = np.arange(1, size)[:, None] + np.arange(1, 7)
+        band = ((targets == landed) & (landed < size) & live) / 6
+        diagonal = 1 - ((landed > size) & live).sum(axis=2) / 6
+        jumped = (targets != landed) & (landed <= size) & (targets < size) & live
+        destinations = np.zeros((count, size + 1), dtype=bool)
+        destinations.ravel()[(targets + offsets)[jumped]] = True
+        width = int(destinations.sum(axis=1).max())
+        column = np.cumsum(destinations, axis=1) - 1  # jump destination square -> Woodbury column
+        boards, rows, rolls = np.nonzero(jumped)
+        rhs = np.zeros((count, n + 6, width + 1))
+        rhs[:, :n, 0] = 1.0
+        np.add.at(rhs, (boards, rows, 1 + column[boards, targets[boards, rows, rolls]]), 1 / 6)
+        for row in range(n - 1, -1, -1):
+            rhs[:, row] += np.einsum("br,brk->bk", band[:, row], rhs[:, row + 1:row + 7])
+            rhs[:, row] /= diagonal[:, row, None]
+        base, spread = rhs[:, :n, 0], rhs[:, :n, 1:]
+        if width:
+            owner, square = np.nonzero(destinations)
+            ends = np.zeros((count, width), dtype=np.intp)
+            ends[owner, column[owner, square]] = square - 1  # unused columns stay on row 0, their spread is 0
+            correction = np.eye(width) - np.take_along_axis(spread, ends[:, :, None], axis=1)
+            weights = np.linalg.solve(correction, np.take_along_axis(base, ends, axis=1)[:, :, None])
+            base = base + (spread @ weights)[:, :, 0]
+        return moves, reached, base
+
+    def _system(self):
+        index = np.full(self.size + 1, -1)
+        index[self.states] = np.arange(len(self.states))
+        targets = index[self.moves[self.states]]
+        rows = np.repeat(np.arange(len(self.states)), 6)
+        keep = targets.ravel() >= 0
+        k = len(self.states)
+        q = np.bincount(rows[keep] * k + targets.ravel()[keep], minlength=k * k).reshape(k, k) / 6
+        return np.eye(k) - q
+
+    @property
+    def visit_frequencies(self):
+        # visit_frequencies[square] is the expected number of turns a piece starting on 1 begins on it
+        if self._visit_frequencies is None:
+            start = np.zeros(len(self.states))
+            start[0] = 1.0
+            self._visit_frequencies = np.zeros(self.size + 1)
+            self._visit_frequencies[self.states] = np.linalg.solve(self._system().T, start)
+        return self._visit_frequencies
+
+    @property
+    def turn_distribution(self):
+        # turn_distribution[t] is the probability that a lone piece finishes on its t-th turn
+        if self._turn_distribution is None:
+            mass = np.zeros(self.size + 1)
+            mass[1] = 1.0
+            finished = [0.0]
+            targets = self.moves[:self.size].ravel()
+            remaining = 1.0
+            while remaining > self.tolerance and len(finished) <= self.max_turns:
+                mass = np.bincount(targets, weights=np.repeat(mass[:self.size] / 6, 6), minlength=self.size + 1)
+                finished.append(mass[self.size])
+                mass[self.size] = 0.0
+                remaining -= finished[-1]
+            self._turn_distribution = np.array(finished)
+        return self._turn_distribution
+
+    def win_probabilities(self, num_players):
+        # Seat i wins on its t-th turn if it finishes then, seats before it needed more than t turns
+        # and seats after it more than t - 1.
+        finish = self.turn_distribution
+        still_playing = 1 - np.cumsum(finish)
+        before = np.concatenate(([1.0], still_playing[:-1]))
+        return np.array([float(np.sum(finish * still_playing ** seat * before ** (num_players - 1 - seat)))
+                         for seat in range(num_players)])
+
+
+class MarkovAnalyzer:
+    def __init__(self, max_cached=10000):
+        self.max_cached = max_cached
+        self._cache = OrderedDict()  # board fingerprint -> BoardAnalysis
+        self.hits = 0
+        self.misses = 0
+
+    def analyze(self, board):
+        key = board.fingerprint()
+        analysis = self._cache.get(key)
+        if analysis is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return analysis
+        self.misses += 1
+        analysis = self._cache[key] = BoardAnalysis(board)
+        if len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return analysis
+
+    def analyze_many(self, boards):
+        # Cached boards are served from the cache; the rest are solved together in one batch.
+        keys = [board.fingerprint() for board in boards]
+        missing = {}
+        for key, board in zip(keys, boards):
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+            elif key not in missing:
+                missing[key] = board
+        self.misses += len(missing)
+        solved = dict(zip(missing, BoardAnalysis.analyze_many(list(missing.values()))))
+        analyses = [self._cache.get(key) or solved[key] for key in keys]
+        self._cache.update(solved)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return analyses
+
+
+# Sessions are keyed by game id. Activity times are kept in least-recently-used order, so idle
+# sessions are always at the front and eviction only ever looks at the oldest few. Games report
+# their own finish, so finished ones go to a second queue, ordered by finish time, even when played
+# directly rather than through the manager, and are dropped after the shorter `finished_ttl`. All
+# sessions share one default board, and games are quiet unless a sink is passed.
 class GameSessionManager:
-    def __init__(self):
+    def __init__(self, idle_ttl=3600.0, finished_ttl=60.0, max_sessions=None, sink=None, board=None, clock=time.monotonic):
         self.sessions = {}  # session_id -> SnakeAndLadderGame
+        self.activity = OrderedDict()  # session_id -> last active time, least recently used first
+        self.finished = OrderedDict()  # session_id -> finish time
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.max_sessions = max_sessions
+        self.sink = sink
+        self.board = board or Board()
+        self.clock = clock
+        self.evicted = 0
+        self._on_finish = self._finished  # one bound method shared by every game
 
-    def create_game(self, player_names):
-        players = [Player(name) for name in player_names]
-        game = SnakeAndLadderGame(players)
-        session_id = str(uuid.uuid4())
-        self.sessions[session_id] = game
-        return session_id
+    def __len__(self):
+        return len(self.sessions)
+
+    def create_game(self, player_names, board=None):
+        now = self.clock()
+        self.evict(now)
+        game = SnakeAndLadderGame([Player(name) for name in player_names], board or self.board, self.sink,
+                                  self._on_finish)
+        self.sessions[game.id] = game
+        self.activity[game.id] = now
+        if self.max_sessions is not None and len(self.sessions) > self.max_sessions:
+            self._drop(next(iter(self.activity)))
+        return game.id
 
     def get_game(self, session_id):
-        return self.sessions.get(session_id)
+        game = self.sessions.get(session_id)
+        if game is not None:
+            self.activity[session_id] = self.clock()
+            self.activity.move_to_end(session_id)
+        return game
+
+    def play_turn(self, session_id):
+        game = self.get_game(session_id)
+        if game is not None:
+            game.play_turn()
+        return game
+
+    def end_game(self, session_id):
+        return self._drop(session_id) is not None
+
+    def evict(self, now=None):
+        now = self.clock() if now is None else now
+        evicted = 0
+        finished, activity = self.finished, self.activity
+        while finished:
+            session_id, finished_at = next(iter(finished.items()))
+            if now - finished_at < self.finished_ttl:
+                break
+            self._drop(session_id)
+            evicted += 1
+        while activity:
+            session_id, last_active = next(iter(activity.items()))
+            if now - last_active < self.idle_ttl:
+                break
+            self._drop(session_id)
+            evicted += 1
+        return evicted
+
+    def _finished(self, game):
+        if game.id in self.sessions and game.id not in self.finished:
+            self.finished[game.id] = self.clock()
+
+    def _drop(self, session_id):
+        self.finished.pop(session_id, None)
+        self.activity.pop(session_id, None)
+        game = self.sessions.pop(session_id, None)
+        if game is not None:
+            game.on_finish = None
+            self.evicted += 1
+        return game
+
+
+# Tests
+
+def test_direct_play_eviction():
+    now = [0.0]
+    manager = GameSessionManager(idle_ttl=100.0, finished_ttl=10.0, clock=lambda: now[0])
+    session_id = manager.create_game(("Alice", "Bob"))
+    idle_id = manager.create_game(("Carol", "Dave"))
+    game = manager.get_game(session_id)
+    while not game.winner:
+        game.play_turn()
+    assert session_id in manager.finished
+    now[0] = 10.0
+    assert manager.evict() == 1 and manager.get_game(session_id) is None
+    assert manager.get_game(idle_id) is not None
+    now[0] = 110.0
+    assert manager.evict() == 1 and len(manager) == 0 and not manager.activity
+    print("Session tests passed")
+
+
+# Benchmarks
+
+def benchmark_batch_simulation(num_games=1000000, loop_games=2000, num_players=2, seed=7):
+    random.seed(seed)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(loop_games):
+            game = SnakeAndLadderGame([Player(f"P{i}") for i in range(num_players)])
+            while not game.winner:
+                game.play_turn()
+    loop_rate = loop_games / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    result = BatchSimulator().run(num_players, num_games, seed=seed)
+    batch_rate = num_games / (time.perf_counter() - start)
+    p50, p90, p99 = result.percentiles()
+    print(f"Batch simulation: {num_games:,} games at {batch_rate:,.0f} games/s vs {loop_rate:,.0f} with play_turn "
+          f"({batch_rate / loop_rate:.0f}x); mean {result.mean_turns():.1f} turns, p50/p90/p99 {p50:.0f}/{p90:.0f}/{p99:.0f}, "
+          f"win by seat {np.round(result.win_probabilities(), 3).tolist()}")
+    return batch_rate / loop_rate
+
+
+def benchmark_markov_analysis(num_boards=2000, seed=7):
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < num_boards:
+        squares = rng.sample(range(2, 100), 16)
+        snakes = {head: rng.randrange(1, head) for head in squares[:8]}
+        ladders = {foot: rng.randrange(foot + 1, 101) for foot in squares[8:]}
+        boards.append(Board(snakes=snakes, ladders=ladders))
+
+    analyzer = MarkovAnalyzer()
+    start = time.perf_counter()
+    for board in boards[:num_boards // 4]:
+        BoardAnalysis(board)
+    single = num_boards // 4 / (time.perf_counter() - start)
+    start = time.perf_counter()
+    analyzer.analyze_many(boards)
+    cold = num_boards / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for board in boards:
+        analyzer.analyze(board)
+    warm = num_boards / (time.perf_counter() - start)
+
+    analysis = analyzer.analyze(Board())
+    simulated = BatchSimulator().run(1, 200000, seed=seed).mean_turns()
+    print(f"Markov analysis: {single:,.0f} boards/s one at a time, {cold:,.0f} boards/s batched, "
+          f"{warm:,.0f} boards/s cached; default board "
+          f"{analysis.expected_turns:.2f} expected turns (simulated {simulated:.2f}), "
+          f"two-player win by seat {np.round(analysis.win_probabilities(2), 3).tolist()}")
+    return cold, warm
+
+
+def benchmark_session_manager(num_sessions=1000000, turns=1000000, seed=7):
+    random.seed(seed)
+    manager = GameSessionManager()
+    tracemalloc.start()
+    start = time.perf_counter()
+    session_ids = [manager.create_game(("Alice", "Bob")) for _ in range(num_sessions)]
+    create = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Concentrate play on a slice of the sessions so a good share of those games finish.
+    hot = session_ids[:max(1, num_sessions // 20)]
+    session_ids = [random.choice(hot) for _ in range(turns)]
+    start = time.perf_counter()
+    for session_id in session_ids:
+        manager.play_turn(session_id)
+    quiet = turns / (time.perf_counter() - start)
+
+    game = SnakeAndLadderGame([Player("Alice"), Player("Bob")])
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(turns // 10):
+            if game.winner:
+                game = SnakeAndLadderGame([Player("Alice"), Player("Bob")])
+            game.play_turn()
+    printing = turns // 10 / (time.perf_counter() - start)
+
+    evicted = manager.evict(manager.clock() + manager.finished_ttl)
+    print(f"Sessions: {num_sessions:,} created in {create:.1f}s at {memory / num_sessions:.0f} B/session; "
+          f"{quiet:,.0f} quiet turns/s vs {printing:,.0f} printing; {evicted:,} finished sessions evicted")
+    return memory / num_sessions, quiet
+
+
+if __name__ == "__main__":
+    test_direct_play_eviction()
+    benchmark_batch_simulation()
+    benchmark_markov_analysis()
+    benchmark_session_manager()
@@ -1,7 +1,23 @@
+import asyncio
+import heapq
+import itertools
+import mmap
+import os
+import random
+import struct
+import threading
+import time
 import uuid
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict
 
+import numpy as np
+
 
 # Helper Classes for Entities
 
@@ -20,21 +36,38 @@ class Stock:
 
 
 class Account:
-    def __init__(self, user_name: str, balance: float = 10000.0):
+    def __init__(self, user_name: str, balance: float = 10000.0, position_store=None, journal=None):
         self.id = uuid.uuid4()
         self.user_name = user_name
         self.balance = balance
         self.portfolio = {}  # Mapping of Stock to quantity owned
-        self.transaction_history = []
+        self.journal = journal if journal is not None else TransactionJournal()
+        self.position_store = position_store  # Columnar mirror of balance and portfolio used for valuation
+        if position_store is not None:
+            position_store.add_account(self.id, balance)
 
     def update_balance(self, amount: float):
         self.balance += amount
+        if self.position_store is not None:
+            self.position_store.add_cash(self.id, amount)
 
     def update_portfolio(self, stock: Stock, quantity: int):
         if stock.ticker in self.portfolio:
             self.portfolio[stock.ticker] += quantity
         else:
             self.portfolio[stock.ticker] = quantity
+        if self.position_store is not None:
+            self.position_store.add_position(self.id, stock.ticker, quantity)
+
+    def record_transaction(self, transaction):
+        # The journal stamps the record under its own lock, so the transaction takes the journal's time
+        record_id = self.journal.append(self.id, transaction.stock.ticker, transaction.transaction_type,
+                                        transaction.quantity, transaction.price)
+        transaction.transaction_date = self.journal.get(record_id).transaction_date
+
+    @property
+    def transaction_history(self):
+        return self.journal.history(self.id)
 
     def __str__(self):
         return f"Account(id={self.id}, user_name={self.user_name}, balance={self.balance}, portfolio={self.portfolio})"
@@ -69,25 +102,636 @@ class Transaction:
             self.account.update_portfolio(self.stock, -self.quantity)
 
         self.status = "Completed"
-        self.account.transaction_history.append(self)
+        self.account.record_transaction(self)
         return self
 
 
+# Transaction Journal
+
+class JournalRecord:
+    __slots__ = ("id", "account_id", "ticker", "transaction_type", "quantity", "price", "timestamp")
+
+    def __init__(self, record_id, account_id, ticker, transaction_type, quantity, price, timestamp):
+        self.id = record_id
+        self.account_id = account_id
+        self.ticker = ticker
+        self.transaction_type = transaction_type
+        self.quantity = quantity
+        self.price = price
+        self.timestamp = timestamp
+
+    @property
+    def transaction_date(self):
+        return datetime.fromtimestamp(self.timestamp)
+
+    @property
+    def total_amount(self):
+        return self.quantity * self.price
+
+    def __str__(self):
+        return (f"Transaction(id={self.id}, account_id={self.account_id}, ticker={self.ticker}, "
+                f"type={self.transaction_type}, quantity={self.quantity}, price={self.price}, "
+                f"date={self.transaction_date})")
+
+
+# Append-only history of fixed-width records (timestamp, account, ticker, type, quantity, price).
+# The active segment is a bytearray; full segments are frozen to bytes or, when a directory is
+# given, written out and memory-mapped. Each account keeps an array of its record numbers. Timestamps
+# are clamped on append so they never go backwards, which keeps record order and time order the same
+# and lets time-range queries be a bisect followed by a lazy scan.
+class TransactionJournal:
+    RECORD = struct.Struct("<dIHBid")  # 27 bytes per record
+    TRANSACTION_TYPES = ("buy", "sell")
+
+    def __init__(self, directory: str = None, segment_records: int = 65536):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.segments = []  # sealed segments: bytes or read-only mmaps
+        self._files = []
+        self._active = bytearray()
+        self._count = 0
+        self._account_ids = []  # account number -> account id
+        self._account_numbers = {}
+        self._tickers = []
+        self._ticker_numbers = {}
+        self._account_records = []  # account number -> array of record numbers
+        self._last_timestamp = 0.0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, account_id, ticker: str, transaction_type: str, quantity: int, price: float,
+               timestamp: float = None):
+        with self._lock:
+            account_number = self._account_numbers.get(account_id)
+            if account_number is None:
+                account_number = self._account_numbers[account_id] = len(self._account_ids)
+                self._account_ids.append(account_id)
+                self._account_records.append(array("I"))
+            ticker_number = self._ticker_numbers.get(ticker)
+            if ticker_number is None:
+                ticker_number = self._ticker_numbers[ticker] = len(self._tickers)
+                self._tickers.append(ticker)
+            timestamp = max(time.time() if timestamp is None else timestamp, self._last_timestamp)
+            self._last_timestamp = timestamp
+            self._active += self.RECORD.pack(timestamp, account_number, ticker_number,
+                                             self.TRANSACTION_TYPES.index(transaction_type), quantity, price)
+            record_id = self._count
+            self._account_records[account_number].append(record_id)
+            self._count += 1
+            if len(self._active) == self.segment_records * self.RECORD.size:
+                self._seal()
+            return record_id
+
+    def get(self, record_id: int):
+        if not 0 <= record_id < self._count:
+            return None
+        timestamp, account_number, ticker_number, type_code, quantity, price = self._unpack(record_id)
+        return JournalRecord(record_id, self._account_ids[account_number], self._tickers[ticker_number],
+                             self.TRANSACTION_TYPES[type_code], quantity, price, timestamp)
+
+    def history(self, account_id, start: datetime = None, end: datetime = None):
+        account_number = self._account_numbers.get(account_id)
+        if account_number is None:
+            return iter(())
+        return self._scan(self._account_records[account_number], start, end)
+
+    def records(self, start: datetime = None, end: datetime = None):
+        return self._scan(range(self._count), start, end)
+
+    def close(self):
+        for segment in self.segments:
+            if isinstance(segment, mmap.mmap):
+                segment.close()
+        for handle in self._files:
+            handle.close()
+        self.segments, self._files = [], []
+
+    def _scan(self, record_ids, start, end):
+        index = 0
+        if start is not None:
+            index = bisect_left(record_ids, start.timestamp(), key=self._timestamp)
+        end_timestamp = end.timestamp() if end is not None else None
+        for position in range(index, len(record_ids)):
+            record = self.get(record_ids[position])
+            if end_timestamp is not None and record.timestamp >= end_timestamp:
+                return
+            yield record
+
+    def _timestamp(self, record_id: int):
+        return self._unpack(record_id)[0]
+
+    def _unpack(self, record_id: int):
+        segment_number, slot = divmod(record_id, self.segment_records)
+        with self._lock:  # _seal moves the active segment into self.segments
+            buffer = self.segments[segment_number] if segment_number < len(self.segments) else self._active
+            return self.RECORD.unpack_from(buffer, slot * self.RECORD.size)
+
+    def _seal(self):
+        if self.directory:
+            path = os.path.join(self.directory, f"segment_{len(self.segments):06d}.bin")
+            with open(path, "wb") as handle:
+                handle.write(self._active)
+            handle = open(path, "rb")
+            self._files.append(handle)
+            self.segments.append(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            self.segments.append(bytes(self._active))
+        self._active = bytearray()
+
+
+# Columnar Position Store
+
+# Positions are kept as parallel (account row, ticker column, quantity) arrays instead of a dense
+# account x ticker matrix, which would not fit in memory at 1M x 5k. Each (row, column) pair has one
+# slot: compacted slots are sorted by key and found by binary search, newer ones are indexed in a dict.
+# A full mark-to-market is then a gather plus a bincount over the slots.
+class PositionStore:
+    def __init__(self, capacity: int = 1024):
+        self.account_index = {}  # account_id -> row
+        self.ticker_index = {}  # ticker -> column
+        self.cash = np.zeros(capacity)
+        self.prices = np.zeros(capacity)
+        self._rows = np.empty(capacity, dtype=np.int32)
+        self._cols = np.empty(capacity, dtype=np.int32)
+        self._quantities = np.empty(capacity)
+        self._size = 0
+        self._keys = np.empty(0, dtype=np.int64)  # sorted keys of the compacted slots
+        self._slots = {}  # key -> slot for positions opened since the last compaction
+        self._lock = threading.Lock()
+        self.nav = np.zeros(0)
+        self.gross_exposure = np.zeros(0)
+        self.net_exposure = np.zeros(0)
+
+    @property
+    def num_accounts(self):
+        return len(self.account_index)
+
+    @property
+    def num_tickers(self):
+        return len(self.ticker_index)
+
+    def add_account(self, account_id, cash: float = 0.0):
+        with self._lock:
+            row = self.account_index.get(account_id)
+            if row is None:
+                row = self.account_index[account_id] = len(self.account_index)
+                self.cash = self._grow(self.cash, row + 1, 0.0)
+            self.cash[row] = cash
+            return row
+
+    def add_ticker(self, ticker: str, price: float):
+        with self._lock:
+            column = self.ticker_index.get(ticker)
+            if column is None:
+                column = self.ticker_index[ticker] = len(self.ticker_index)
+                self.prices = self._grow(self.prices, column + 1, 0.0)
+            self.prices[column] = price
+            return column
+
+    def add_cash(self, account_id, amount: float):
+        with self._lock:
+            self.cash[self.account_index[account_id]] += amount
+
+    def add_position(self, account_id, ticker: str, quantity: float):
+        with self._lock:
+            row, column = self.account_index[account_id], self.ticker_index[ticker]
+            key = (row << 32) | column
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = int(np.searchsorted(self._keys, key))
+                if slot == len(self._keys) or self._keys[slot] != key:
+                    slot = self._size
+                    self._append(row, column, 0.0)
+                self._slots[key] = slot
+            self._quantities[slot] += quantity
+
+    def load_positions(self, rows, columns, quantities):
+        rows = np.asarray(rows, dtype=np.int32)
+        with self._lock:
+            end = self._size + len(rows)
+            self._reserve_positions(end)
+            self._rows[self._size:end] = rows
+            self._cols[self._size:end] = columns
+            self._quantities[self._size:end] = quantities
+            self._size = end
+            self._compact()
+
+    def update_price(self, ticker: str, price: float):
+        with self._lock:
+            self.prices[self.ticker_index[ticker]] = price
+
+    def update_prices(self, tickers, prices):
+        columns = np.fromiter((self.ticker_index[t] for t in tickers), dtype=np.int64, count=len(tickers))
+        with self._lock:
+            self.prices[columns] = prices
+
+    def mark_to_market(self):
+        with self._lock:
+            n = self._size
+            accounts = self.num_accounts
+            rows = self._rows[:n]
+            values = self._quantities[:n] * self.prices[self._cols[:n]]
+            self.net_exposure = np.bincount(rows, weights=values, minlength=accounts)
+            self.gross_exposure = np.bincount(rows, weights=np.abs(values, out=values), minlength=accounts)
+            self.nav = self.cash[:accounts] + self.net_exposure
+            return self.nav
+
+    def valuation(self, account_id):
+        row = self.account_index[account_id]
+        if row >= len(self.nav):
+            self.mark_to_market()
+        return {"nav": float(self.nav[row]), "gross_exposure": float(self.gross_exposure[row]),
+                "net_exposure": float(self.net_exposure[row])}
+
+    def compact(self):
+        # Merges duplicate slots, drops closed positions and re-sorts everything by key
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        n = self._size
+        keys = (self._rows[:n].astype(np.int64) << 32) | self._cols[:n]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        quantities = np.bincount(inverse, weights=self._quantities[:n], minlength=len(unique_keys))
+        held = quantities != 0
+        self._keys = unique_keys[held]
+        size = len(self._keys)
+        self._rows[:size] = self._keys >> 32
+        self._cols[:size] = self._keys & 0xFFFFFFFF
+        self._quantities[:size] = quantities[held]
+        self._size = size
+        self._slots.clear()
+
+    def _append(self, row: int, column: int, quantity: float):
+        n = self._size
+        if n == len(self._rows):
+            self._reserve_positions(n + 1)
+        self._rows[n] = row
+        self._cols[n] = column
+        self._quantities[n] = quantity
+        self._size = n + 1
+
+    def _reserve_positions(self, size: int):
+        if size > len(self._rows):
+            self._rows = self._grow(self._rows, size)
+            self._cols = self._grow(self._cols, size)
+            self._quantities = self._grow(self._quantities, size)
+
+    @staticmethod
+    def _grow(array, size: int, fill=None):
+        if size <= len(array):
+            return array
+        grown = np.empty(max(size, 2 * len(array)), dtype=array.dtype)
+        grown[:len(array)] = array
+        if fill is not None:
+            grown[len(array):] = fill
+        return grown
+
+
+# Order Book and Matching Engine
+
+_order_ids = itertools.count(1)
+_trade_ids = itertools.count(1)
+
+
+class Order:
+    __slots__ = ("id", "account_id", "ticker", "side", "order_type", "price", "quantity",
+                 "remaining", "filled_quantity", "budget", "status")
+
+    def __init__(self, account_id, ticker: str, side: str, quantity: int, price: float = None, budget: float = None):
+        if side not in ("buy", "sell"):
+            raise ValueError("Order side must be 'buy' or 'sell'.")
+        if quantity <= 0:
+            raise ValueError("Order quantity must be positive.")
+        self.id = next(_order_ids)
+        self.account_id = account_id
+        self.ticker = ticker
+        self.side = side
+        self.order_type = "market" if price is None else "limit"
+        self.price = price
+        self.quantity = quantity
+        self.remaining = quantity
+        self.filled_quantity = 0
+        self.budget = budget  # Cash cap for market buys, None means unlimited
+        self.status = "Open"
+
+    def __str__(self):
+        return (f"Order(id={self.id}, ticker={self.ticker}, side={self.side}, type={self.order_type}, "
+                f"price={self.price}, filled={self.filled_quantity}/{self.quantity}, status={self.status})")
+
+
+class Trade:
+    __slots__ = ("id", "ticker", "price", "quantity", "buy_order_id", "sell_order_id",
+                 "buy_account_id", "sell_account_id", "aggressor_side")
+
+    def __init__(self, ticker, price, quantity, buy_order, sell_order, aggressor_side):
+        self.id = next(_trade_ids)
+        self.ticker = ticker
+        self.price = price
+        self.quantity = quantity
+        self.buy_order_id = buy_order.id
+        self.sell_order_id = sell_order.id
+        self.buy_account_id = buy_order.account_id
+        self.sell_account_id = sell_order.account_id
+        self.aggressor_side = aggressor_side
+
+    def __str__(self):
+        return f"Trade(id={self.id}, ticker={self.ticker}, price={self.price}, quantity={self.quantity})"
+
+
+class PriceLevel:
+    __slots__ = ("price", "orders", "volume")
+
+    def __init__(self, price: float):
+        self.price = price
+        self.orders = deque()  # FIFO queue, cancelled orders are skipped lazily
+        self.volume = 0
+
+
+# Price-time priority book for a single ticker. Each side keeps price -> PriceLevel plus a
+# heap of those prices (bids negated). Cancels only zero the order out and empty levels are
+# dropped once they reach the top of the heap, so submit and cancel stay O(log n).
+class OrderBook:
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.bids = {}  # price -> PriceLevel
+        self.asks = {}
+        self._bid_prices = []  # negated prices
+        self._ask_prices = []
+        self.orders = {}  # order_id -> resting Order
+        self.listeners = []
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def best_bid(self):
+        level = self._top(self.bids, self._bid_prices, -1)
+        return level.price if level else None
+
+    def best_ask(self):
+        level = self._top(self.asks, self._ask_prices, 1)
+        return level.price if level else None
+
+    def depth(self, levels: int = 5):
+        bids = sorted((l.price, l.volume) for l in self.bids.values() if l.volume)[::-1]
+        asks = sorted((l.price, l.volume) for l in self.asks.values() if l.volume)
+        return {"bids": bids[:levels], "asks": asks[:levels]}
+
+    def submit(self, order: Order) -> List[Trade]:
+        trades = self._match(order)
+        if order.remaining:
+            if order.order_type == "limit":
+                self._rest(order)
+            else:
+                order.remaining = 0  # Unfilled market quantity is not kept on the book
+                order.status = "Cancelled" if not order.filled_quantity else "PartiallyFilled"
+        if trades:
+            for listener in self.listeners:
+                for trade in trades:
+                    listener(trade)
+        return trades
+
+    def cancel(self, order_id: int):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        levels = self.bids if order.side == "buy" else self.asks
+        levels[order.price].volume -= order.remaining
+        order.remaining = 0
+        order.status = "Cancelled"
+        return order
+
+    def _top(self, levels, heap, sign):
+        while heap:
+            level = levels[heap[0] * sign]
+            if level.volume:
+                return level
+            heapq.heappop(heap)
+            del levels[level.price]
+        return None
+
+    def _rest(self, order: Order):
+        if order.side == "buy":
+            levels, heap, key = self.bids, self._bid_prices, -order.price
+        else:
+            levels, heap, key = self.asks, self._ask_prices, order.price
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = PriceLevel(order.price)
+            heapq.heappush(heap, key)
+        level.orders.append(order)
+        level.volume += order.remaining
+        self.orders[order.id] = order
+
+    def _match(self, order: Order) -> List[Trade]:
+        is_buy = order.side == "buy"
+        if is_buy:
+            levels, heap, sign = self.asks, self._ask_prices, 1
+        else:
+            levels, heap, sign = self.bids, self._bid_prices, -1
+        limit = order.price
+        budget = order.budget
+        remaining = order.remaining
+        resting = self.orders
+        trades = []
+
+        while remaining and heap:
+            price = heap[0] * sign
+            level = levels[price]
+            if not level.volume:
+                heapq.heappop(heap)
+                del levels[price]
+                continue
+            if limit is not None and (price > limit if is_buy else price < limit):
+                break
+            if budget is not None:
+                affordable = int(budget // price)
+                if not affordable:
+                    break
+            queue = level.orders
+            while remaining and queue:
+                maker = queue[0]
+                if not maker.remaining:
+                    queue.popleft()
+                    continue
+                quantity = remaining if remaining < maker.remaining else maker.remaining
+                if budget is not None:
+                    if quantity > affordable:
+                        quantity = affordable
+                    if not quantity:
+                        break
+                    affordable -= quantity
+                    budget -= quantity * price
+                maker.remaining -= quantity
+                maker.filled_quantity += quantity
+                remaining -= quantity
+                level.volume -= quantity
+                if maker.remaining:
+                    maker.status = "PartiallyFilled"
+                else:
+                    queue.popleft()
+                    maker.status = "Filled"
+                    del resting[maker.id]
+                if is_buy:
+                    trades.append(Trade(self.ticker, price, quantity, order, maker, "buy"))
+                else:
+                    trades.append(Trade(self.ticker, price, quantity, maker, order, "sell"))
+            if budget is not None and not affordable:
+                break
+
+        order.filled_quantity = order.quantity - remaining
+        order.remaining = remaining
+        order.budget = budget
+        if not remaining:
+            order.status = "Filled"
+        elif order.filled_quantity:
+            order.status = "PartiallyFilled"
+        return trades
+
+
+# Market Data Ingestion
+
+class MarketSnapshot:
+    __slots__ = ("version", "prices", "published_at")
+
+    def __init__(self, version: int, prices: Dict[str, float], published_at: float):
+        self.version = version
+        self.prices = prices  # Never mutated after publishing
+        self.published_at = published_at
+
+    def updated(self, ticks: Dict[str, float]):
+        prices = dict(self.prices)
+        prices.update(ticks)
+        return MarketSnapshot(self.version + 1, prices, time.time())
+
+    def __str__(self):
+        return f"MarketSnapshot(version={self.version}, tickers={len(self.prices)})"
+
+
+async def read_ticks_from_file(path: str, yield_every: int = 1024):
+    # Lines are "ticker,price"; the loop hands control back periodically so the flusher can run
+    with open(path) as handle:
+        for count, line in enumerate(handle, 1):
+            ticker, price = line.rstrip().split(",")[:2]
+            yield ticker, float(price)
+            if count % yield_every == 0:
+                await asyncio.sleep(0)
+
+
+async def read_ticks_from_stream(reader: asyncio.StreamReader):
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        ticker, price = line.decode().rstrip().split(",")[:2]
+        yield ticker, float(price)
+
+
+# Coalesces ticks per ticker for `window` seconds, then applies the latest price of each ticker to
+# the system in one batch and publishes a new MarketSnapshot. Staleness is measured from the first
+# tick of a ticker in a window to the publish of the batch that contains it.
+class MarketDataIngestor:
+    def __init__(self, system, window: float = 0.005, revalue: bool = False):
+        self.system = system
+        self.window = window
+        self.revalue = revalue
+        self.pending = {}  # ticker -> (latest price, first arrival)
+        self.ticks_received = 0
+        self.batches_applied = 0
+        self.staleness = array("d")
+
+    async def run(self, ticks):
+        flusher = asyncio.create_task(self._flush_periodically())
+        deadline = time.perf_counter() + self.window
+        try:
+            async for ticker, price in ticks:
+                now = time.perf_counter()
+                previous = self.pending.get(ticker)
+                self.pending[ticker] = (price, previous[1] if previous else now)
+                self.ticks_received += 1
+                if now >= deadline:
+                    self.flush()
+                    deadline = now + self.window
+        finally:
+            flusher.cancel()
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return None
+        batch, self.pending = self.pending, {}
+        self.system.update_stock_prices({ticker: price for ticker, (price, _) in batch.items()}, self.revalue)
+        self.system.market_snapshot = snapshot = self.system.market_snapshot.updated(
+            {ticker: self.system.stocks[ticker].price for ticker in batch if ticker in self.system.stocks})
+        published = time.perf_counter()
+        self.staleness.extend(published - arrival for _, arrival in batch.values())
+        self.batches_applied += 1
+        return snapshot
+
+    def staleness_percentiles(self, percentiles=(50, 90, 99, 100)):
+        ordered = sorted(self.staleness)
+        if not ordered:
+            return {}
+        return {p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in percentiles}
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.window)
+            self.flush()
+
+
+# Concurrency
+
+# A fixed pool of re-entrant locks that keys are hashed onto. hold() takes the stripes for all of its
+# keys in index order, so two callers can never wait on each other in opposite orders.
+class LockStripes:
+    def __init__(self, stripes: int = 64):
+        self.locks = [threading.RLock() for _ in range(stripes)]
+
+    @contextmanager
+    def hold(self, *keys):
+        indices = sorted({hash(key) % len(self.locks) for key in keys})
+        for index in indices:
+            self.locks[index].acquire()
+        try:
+            yield
+        finally:
+            for index in reversed(indices):
+                self.locks[index].release()
+
+
 # Simulating the Online Stock Brokerage System
 
 class OnlineStockBrokerageSystem:
-    def __init__(self):
+    def __init__(self, journal_directory: str = None, stripes: int = 64):
         self.accounts = {}
         self.stocks = {}
-        self.transactions = {}
+        self.journal = TransactionJournal(journal_directory)
+        self.order_books = {}  # ticker -> OrderBook
+        self.open_orders = {}  # order_id -> Order with cash or shares still reserved
+        self.reserved_cash = {}  # order_id -> cash held back for a buy order
+        self.positions = PositionStore()
+        # Lock order is always ticker stripes before account stripes
+        self.ticker_locks = LockStripes(stripes)
+        self.account_locks = LockStripes(stripes)
+        self.market_snapshot = MarketSnapshot(0, {}, time.time())
 
     def register_stock(self, ticker: str, name: str, price: float):
         stock = Stock(ticker, name, price)
         self.stocks[ticker] = stock
+        self.positions.add_ticker(ticker, price)
+        self.market_snapshot = self.market_snapshot.updated({ticker: price})
+        book = OrderBook(ticker)
+        book.subscribe(self._settle_trade)
+        self.order_books[ticker] = book
         return stock
 
     def register_account(self, user_name: str):
-        account = Account(user_name)
+        account = Account(user_name, position_store=self.positions, journal=self.journal)
         self.accounts[account.id] = account
         return account
 
@@ -104,28 +748,317 @@ class OnlineStockBrokerageSystem:
         if not account or not stock:
             raise ValueError("Account or Stock not found.")
         
-        price = stock.price
-        transaction = Transaction(account, stock, quantity, price, transaction_type)
-        transaction.execute()
-        self.transactions[transaction.id] = transaction
+        with self.ticker_locks.hold(stock_ticker), self.account_locks.hold(account_id):
+            price = stock.price
+            transaction = Transaction(account, stock, quantity, price, transaction_type)
+            transaction.execute()
         return transaction
 
+    def place_limit_order(self, account_id: uuid.UUID, stock_ticker: str, quantity: int, price: float, side: str):
+        account, book = self._get_account_and_book(account_id, stock_ticker)
+        order = Order(account_id, stock_ticker, side, quantity, price)
+        self._reserve(account, order, price * quantity)
+        return self._submit(book, order)
+
+    def place_market_order(self, account_id: uuid.UUID, stock_ticker: str, quantity: int, side: str):
+        account, book = self._get_account_and_book(account_id, stock_ticker)
+        order = Order(account_id, stock_ticker, side, quantity)
+        self._reserve(account, order, None)
+        return self._submit(book, order)
+
+    def cancel_order(self, order_id: int):
+        order = self.open_orders.get(order_id)
+        if not order:
+            return None
+        with self.ticker_locks.hold(order.ticker):
+            cancelled = self.order_books[order.ticker].cancel(order_id)
+        if cancelled:
+            self._release(cancelled)
+        return cancelled
+
+    def _get_account_and_book(self, account_id, stock_ticker):
+        account = self.accounts.get(account_id)
+        book = self.order_books.get(stock_ticker)
+        if not account or not book:
+            raise ValueError("Account or Stock not found.")
+        return account, book
+
+    def _reserve(self, account: Account, order: Order, cash: float):
+        with self.account_locks.hold(account.id):
+            if order.side == "buy":
+                if cash is None:
+                    # Market buys may spend up to the whole cash balance, the unused part is released afterwards
+                    cash = order.budget = account.balance
+                if account.balance < cash:
+                    raise ValueError("Insufficient funds.")
+                account.update_balance(-cash)
+                self.reserved_cash[order.id] = cash
+            else:
+                if account.portfolio.get(order.ticker, 0) < order.quantity:
+                    raise ValueError("Not enough stock in portfolio.")
+                account.update_portfolio(self.stocks[order.ticker], -order.quantity)
+            self.open_orders[order.id] = order
+
+    def _submit(self, book: OrderBook, order: Order):
+        with self.ticker_locks.hold(order.ticker):
+            book.submit(order)
+        if not order.remaining:
+            self._release(order)
+        return order
+
+    def _release(self, order: Order):
+        if self.open_orders.pop(order.id, None) is None:
+            return
+        account = self.accounts[order.account_id]
+        with self.account_locks.hold(account.id):
+            if order.side == "buy":
+                account.update_balance(self.reserved_cash.pop(order.id, 0.0))
+            else:
+                unfilled = order.quantity - order.filled_quantity
+                if unfilled:
+                    account.update_portfolio(self.stocks[order.ticker], unfilled)
+
+    def _settle_trade(self, trade: Trade):
+        # Runs inside OrderBook.submit, so the ticker stripe is already held
+        stock = self.stocks[trade.ticker]
+        buyer = self.accounts[trade.buy_account_id]
+        seller = self.accounts[trade.sell_account_id]
+        notional = trade.price * trade.quantity
+        with self.account_locks.hold(buyer.id, seller.id):
+            # Cash and shares were reserved when the orders were placed
+            self.reserved_cash[trade.buy_order_id] -= notional
+            buyer.update_portfolio(stock, trade.quantity)
+            seller.update_balance(notional)
+            stock.update_price(trade.price)
+            self.positions.update_price(stock.ticker, trade.price)
+            # Timestamps are taken inside the journal's append, so concurrent settlements stay in time order
+            self.journal.append(buyer.id, trade.ticker, "buy", trade.quantity, trade.price)
+            self.journal.append(seller.id, trade.ticker, "sell", trade.quantity, trade.price)
+            # The aggressing order is released by _submit once all of its fills are settled
+            maker = self.open_orders.get(trade.sell_order_id if trade.aggressor_side == "buy" else trade.buy_order_id)
+            if maker and not maker.remaining:
+                self._release(maker)
+
     def view_account_portfolio(self, account_id: uuid.UUID):
         account = self.accounts.get(account_id)
         if account:
             return account.portfolio
         return None
 
-    def view_transaction_history(self, account_id: uuid.UUID):
-        account = self.accounts.get(account_id)
-        if account:
-            return account.transaction_history
+    def view_transaction_history(self, account_id: uuid.UUID, start: datetime = None, end: datetime = None):
+        # Returns a lazy iterator over the journal instead of a materialized list
+        if account_id in self.accounts:
+            return self.journal.history(account_id, start, end)
         return None
 
     def update_stock_price(self, ticker: str, new_price: float):
         stock = self.stocks.get(ticker)
         if stock:
             stock.update_price(new_price)
+            self.positions.update_price(ticker, new_price)
             return stock
         return None
 
+    def update_stock_prices(self, ticks: Dict[str, float], revalue: bool = True):
+        # Applies a batch of price ticks and revalues every account in one pass
+        ticks = {ticker: price for ticker, price in ticks.items() if ticker in self.stocks}
+        for ticker, price in ticks.items():
+            self.stocks[ticker].update_price(price)
+        self.positions.update_prices(list(ticks), np.fromiter(ticks.values(), dtype=float, count=len(ticks)))
+        if revalue:
+            return self.positions.mark_to_market()
+        return None
+
+    def get_market_snapshot(self):
+        # Snapshots are immutable and swapped in by reference, so readers never wait on the feed
+        return self.market_snapshot
+
+    def view_account_valuation(self, account_id: uuid.UUID):
+        if account_id not in self.accounts:
+            return None
+        return self.positions.valuation(account_id)
+
+
+# Benchmarks
+
+def benchmark_order_book(num_orders: int = 500000, seed: int = 7):
+    rng = random.Random(seed)
+    book = OrderBook("BENCH")
+    orders = []
+    for _ in range(num_orders):
+        roll = rng.random()
+        side = "buy" if rng.random() < 0.5 else "sell"
+        quantity = rng.randint(1, 100)
+        if roll < 0.15:
+            orders.append(("cancel", rng.randint(1, len(orders) + 1)))
+        elif roll < 0.25:
+            orders.append(("market", side, quantity))
+        else:
+            offset = rng.randint(0, 50) if side == "sell" else -rng.randint(0, 50)
+            orders.append(("limit", side, quantity, round(100.0 + (offset + rng.randint(-5, 5)) * 0.01, 2)))
+
+    submitted = []
+    trade_count = 0
+    start = time.perf_counter()
+    for entry in orders:
+        if entry[0] == "cancel":
+            if entry[1] <= len(submitted):
+                book.cancel(submitted[entry[1] - 1])
+            continue
+        if entry[0] == "market":
+            order = Order(0, "BENCH", entry[1], entry[2])
+        else:
+            order = Order(0, "BENCH", entry[1], entry[2], entry[3])
+        submitted.append(order.id)
+        trade_count += len(book.submit(order))
+    elapsed = time.perf_counter() - start
+    print(f"Order book: {num_orders} operations, {trade_count} trades in {elapsed:.3f}s "
+          f"({num_orders / elapsed:,.0f} ops/s)")
+    return num_orders / elapsed
+
+
+def benchmark_mark_to_market(num_accounts: int = 1000000, num_tickers: int = 5000,
+                             positions_per_account: int = 8, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    store = PositionStore()
+    for row in range(num_accounts):
+        store.add_account(row, 10000.0)
+    for column in range(num_tickers):
+        store.add_ticker(f"T{column}", 100.0)
+    num_positions = num_accounts * positions_per_account
+    store.load_positions(np.repeat(np.arange(num_accounts, dtype=np.int32), positions_per_account),
+                         rng.integers(0, num_tickers, num_positions, dtype=np.int32),
+                         rng.integers(-100, 1000, num_positions).astype(float))
+    tickers = [f"T{column}" for column in range(num_tickers)]
+    prices = rng.uniform(10.0, 500.0, num_tickers)
+
+    start = time.perf_counter()
+    store.update_prices(tickers, prices)
+    store.mark_to_market()
+    elapsed = time.perf_counter() - start
+    print(f"Mark-to-market: {num_accounts} accounts x {num_tickers} tickers, "
+          f"{store._size} positions in {elapsed:.3f}s")
+    return elapsed
+
+
+def benchmark_journal_memory(num_transactions: int = 200000):
+    import tempfile
+    import tracemalloc
+
+    stock = Stock("BENCH", "Benchmark", 100.0)
+    tracemalloc.start()
+    account = Account("objects", balance=float("inf"), journal=TransactionJournal())
+    account.transaction_history_objects = [Transaction(account, stock, 1, 100.0, "buy")
+                                           for _ in range(num_transactions)]
+    object_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del account
+
+    print(f"Transaction history as objects: {object_bytes / num_transactions:.0f} B/txn")
+    ratios = []
+    for directory in (None, tempfile.mkdtemp()):
+        tracemalloc.start()
+        journal = TransactionJournal(directory)
+        account_id = uuid.uuid4()
+        for _ in range(num_transactions):
+            journal.append(account_id, "BENCH", "buy", 1, 100.0)
+        journal_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        journal.close()
+        ratios.append(object_bytes / journal_bytes)
+        print(f"Transaction history in {'spilled' if directory else 'in-memory'} journal: "
+              f"{journal_bytes / num_transactions:.0f} B/txn ({ratios[-1]:.1f}x smaller)")
+    return ratios
+
+
+def stress_test_concurrent_orders(num_accounts: int = 50, num_tickers: int = 8, operations: int = 20000,
+                                  workers: int = 8, seed: int = 7):
+    system = OnlineStockBrokerageSystem()
+    tickers = [f"T{i}" for i in range(num_tickers)]
+    for ticker in tickers:
+        system.register_stock(ticker, ticker, 100.0)
+    accounts = [system.register_account(f"user{i}") for i in range(num_accounts)]
+    for account in accounts:
+        account.update_balance(1000000.0)
+        for ticker in tickers:
+            system.place_order(account.id, ticker, 100, "buy")
+    initial_cash = sum(a.balance for a in accounts)
+    initial_shares = {t: sum(a.portfolio.get(t, 0) for a in accounts) + system.stocks[t].available_quantity
+                      for t in tickers}
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        pool_cash = 0.0  # Cash paid to (negative) or received from the legacy stock pool
+        placed = []
+        for _ in range(operations // workers):
+            account = rng.choice(accounts)
+            ticker = rng.choice(tickers)
+            side = rng.choice(("buy", "sell"))
+            roll = rng.random()
+            try:
+                if roll < 0.5:
+                    price = round(100.0 + rng.randint(-20, 20) * 0.05, 2)
+                    placed.append(system.place_limit_order(account.id, ticker, rng.randint(1, 20), price, side).id)
+                elif roll < 0.7:
+                    system.place_market_order(account.id, ticker, rng.randint(1, 20), side)
+                elif roll < 0.9 and placed:
+                    system.cancel_order(placed.pop(rng.randrange(len(placed))))
+                else:
+                    transaction = system.place_order(account.id, ticker, rng.randint(1, 5), side)
+                    pool_cash += transaction.total_amount if side == "sell" else -transaction.total_amount
+            except ValueError:
+                pass
+        return pool_cash
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pool_cash = sum(executor.map(worker, range(seed, seed + workers)))
+    elapsed = time.perf_counter() - start
+
+    reserved_shares = {t: 0 for t in tickers}
+    for order in list(system.open_orders.values()):
+        if order.side == "sell":
+            reserved_shares[order.ticker] += order.quantity - order.filled_quantity
+    cash = sum(a.balance for a in accounts) + sum(system.reserved_cash.values())
+    assert abs(cash - (initial_cash + pool_cash)) < 1e-6 * initial_cash, "cash was not conserved"
+    for ticker in tickers:
+        shares = (sum(a.portfolio.get(ticker, 0) for a in accounts) + reserved_shares[ticker]
+                  + system.stocks[ticker].available_quantity)
+        assert shares == initial_shares[ticker], f"shares of {ticker} were not conserved"
+    assert all(a.balance >= -1e-6 for a in accounts), "an account went negative"
+    print(f"Concurrent orders: {operations} operations on {workers} threads in {elapsed:.3f}s, "
+          f"cash and shares conserved")
+    return True
+
+
+def benchmark_tick_replay(num_ticks: int = 500000, num_tickers: int = 500, window: float = 0.002, seed: int = 7):
+    import tempfile
+
+    rng = random.Random(seed)
+    system = OnlineStockBrokerageSystem()
+    tickers = [f"T{i}" for i in range(num_tickers)]
+    for ticker in tickers:
+        system.register_stock(ticker, ticker, 100.0)
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as handle:
+        for _ in range(num_ticks):
+            handle.write(f"{rng.choice(tickers)},{100.0 + rng.uniform(-5.0, 5.0):.2f}\n")
+        path = handle.name
+
+    ingestor = MarketDataIngestor(system, window)
+    start = time.perf_counter()
+    asyncio.run(ingestor.run(read_ticks_from_file(path)))
+    elapsed = time.perf_counter() - start
+    os.remove(path)
+    staleness = ingestor.staleness_percentiles()
+    print(f"Tick replay: {num_ticks} ticks in {elapsed:.3f}s ({num_ticks / elapsed:,.0f} ticks/s), "
+          f"{ingestor.batches_applied} batches, snapshot v{system.get_market_snapshot().version}, staleness "
+          + ", ".join(f"p{p}={value * 1000:.2f}ms" for p, value in staleness.items()))
+    return num_ticks / elapsed
+
+
+if __name__ == "__main__":
+    benchmark_order_book()
+    benchmark_mark_to_market()
+    benchmark_journal_memory()
+    stress_test_concurrent_orders()
+    benchmark_tick_replay()